@@ -0,0 +1,360 @@
+"""Module with process-wide OpenAI clients shared by all bot handlers."""
+import os
+from typing import Any, Dict, List, Optional
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from dotenv import load_dotenv
+from telegram.ext import Application
+
+from app.conversation import ConversationStore
+from app.disk_cache import DiskImageCache
+from app.downloads import SpooledDownloader
+from app.executors import ImageExecutors
+from app.hedging import Hedger
+from app.image_hashing import NearDuplicateCache
+from app.image_memory import ImageMemory
+from app.media_group import MediaGroupCollector
+from app.message_renderer import EditThrottle
+from app.openai_helper import OpenAIHelper
+from app.rate_limiter import RateLimiter
+from app.resilience import ResilientCaller
+from app.response_cache import ResponseCache
+from app.router import ModelRouter
+from app.scheduler import LLMScheduler
+from app.singleflight import SingleFlight
+from app.summarizer import ConversationSummarizer
+from app.vision_helper import VisionHelper
+from app.vision_planner import VisionPlanner
+
+load_dotenv()
+
+# Ключ, под которым реестр хранится в application.bot_data
+BOT_DATA_KEY = 'clients'
+
+
+class ClientRegistry:
+    """Registry of OpenAI helpers sharing one pooled HTTP transport.
+
+    Text, vision and image generation go through the same AsyncOpenAI
+    client, so TLS connections are reused across handlers and users
+    instead of being opened for every incoming message.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 60.0,
+        chat_cache: Optional[ResponseCache] = None,
+        vision_cache: Optional[ResponseCache] = None,
+        conversations: Optional[ConversationStore] = None,
+        summary_threshold: int = 12,
+        summary_keep_recent: int = 6,
+        summary_concurrency: int = 2,
+        scheduler: Optional[LLMScheduler] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        resilience: Optional[ResilientCaller] = None,
+        hedger: Optional[Hedger] = None,
+        router: Optional[ModelRouter] = None,
+        vision_jpeg_quality: int = 85,
+        vision_default_detail: str = 'high',
+        near_duplicates: Optional[NearDuplicateCache] = None,
+        executors: Optional[ImageExecutors] = None,
+        media_groups: Optional[MediaGroupCollector] = None,
+        vision_planner: Optional[VisionPlanner] = None,
+        image_memory: Optional[ImageMemory] = None,
+        image_cache: Optional[DiskImageCache] = None,
+        download_spool_memory: int = 1024 * 1024,
+        download_max_size: int = 20 * 1024 * 1024,
+        edit_throttle: Optional[EditThrottle] = None,
+    ):
+        """
+        Create the shared HTTP pool and helpers.
+
+        Args:
+            api_key: OpenAI API key, read from OPENAI_API_KEY when omitted
+            max_connections: Maximum number of open connections in the pool
+            max_keepalive_connections: Maximum number of idle connections kept alive
+            keepalive_expiry: Seconds an idle connection is kept open
+            timeout: Total request timeout in seconds
+            chat_cache: Optional cache for chat responses
+            vision_cache: Optional cache of image analysis results by Telegram file
+            conversations: Per-chat conversation memory, default settings if omitted
+            summary_threshold: Number of stored turns that triggers summarization
+            summary_keep_recent: Number of recent turns kept verbatim
+            summary_concurrency: Maximum number of simultaneous summarization calls
+            scheduler: Limiter of concurrent LLM calls, default settings if omitted
+            rate_limiter: Pacer of calls by RPM/TPM headers, created if omitted
+            resilience: Retries and circuit breakers of API calls, created if omitted
+            hedger: Optional hedging of slow chat completions, disabled if omitted
+            router: Model choice per request, default tiers if omitted
+            vision_jpeg_quality: JPEG quality of images re-encoded before upload
+            vision_default_detail: Vision detail level when the question gives no hint
+            near_duplicates: Optional cache of results for visually identical images
+            executors: Optional process and thread pools for image work,
+                shut down by aclose
+            media_groups: Collector of album photos, default window if omitted
+            vision_planner: Detail level and token budget of Vision requests,
+                default budget if omitted
+            image_memory: Last photo of every chat for follow-up questions,
+                default TTL if omitted
+            image_cache: Optional disk cache of prepared images, expired
+                entries removed in the background after start
+            download_spool_memory: Size above which a downloaded file spills to disk
+            download_max_size: Maximum size of a downloaded file
+            edit_throttle: Per-chat pacing of streamed message edits,
+                default intervals if omitted
+        """
+        api_key = api_key or os.getenv('OPENAI_API_KEY')
+        if not api_key:
+            raise ValueError('OPENAI_API_KEY not found in environment variables')
+
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        # Лимитер подключен к общему HTTP клиенту, поэтому покрывает и чат, и vision
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self.http_client = DefaultAsyncHttpxClient(
+            timeout=httpx.Timeout(timeout, connect=5.0),
+            transport=self.rate_limiter.wrap(httpx.AsyncHTTPTransport(limits=self.limits)),
+        )
+        # Повторы выполняет ResilientCaller, встроенные повторы SDK отключены
+        self.client = AsyncOpenAI(api_key=api_key, http_client=self.http_client, max_retries=0)
+        self.resilience = resilience if resilience is not None else ResilientCaller(budget=timeout)
+        self.chat_cache = chat_cache
+        self.vision_cache = vision_cache
+        self.singleflight = SingleFlight()
+        self.scheduler = scheduler if scheduler is not None else LLMScheduler()
+        self.conversations = conversations if conversations is not None else ConversationStore()
+        self.router = router if router is not None else ModelRouter()
+        self.openai_helper = OpenAIHelper(
+            client=self.client,
+            cache=chat_cache,
+            singleflight=self.singleflight,
+            resilience=self.resilience,
+            hedger=hedger,
+            router=self.router,
+        )
+        self.hedger = hedger
+        self.vision_helper = VisionHelper(
+            client=self.client,
+            resilience=self.resilience,
+            router=self.router,
+            jpeg_quality=vision_jpeg_quality,
+            default_detail=vision_default_detail,
+            near_duplicates=near_duplicates,
+            executors=executors,
+            http_client=self.http_client,
+            planner=vision_planner,
+            image_cache=image_cache,
+        )
+        self.executors = executors
+        self.image_cache = image_cache
+        # Файлы Telegram качаются своим клиентом: токен бота не проходит через
+        # лимитер OpenAI, а загрузки не занимают соединения запросов к API
+        self.download_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout, connect=5.0),
+            limits=self.limits,
+        )
+        self.downloader = SpooledDownloader(
+            self.download_client,
+            max_memory=download_spool_memory,
+            max_size=download_max_size,
+        )
+        self.image_memory = image_memory if image_memory is not None else ImageMemory()
+        self.edit_throttle = edit_throttle if edit_throttle is not None else EditThrottle()
+        self.media_groups = media_groups if media_groups is not None else MediaGroupCollector()
+        self.summarizer = ConversationSummarizer(
+            self.conversations,
+            self.openai_helper,
+            threshold=summary_threshold,
+            keep_recent=summary_keep_recent,
+            max_concurrency=summary_concurrency,
+        )
+
+    @classmethod
+    def from_env(cls) -> 'ClientRegistry':
+        """
+        Create registry using connection settings from environment variables.
+
+        Returns:
+            ClientRegistry: Configured registry
+        """
+        return cls(
+            max_connections=int(os.getenv('OPENAI_MAX_CONNECTIONS', '100')),
+            max_keepalive_connections=int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', '20')),
+            keepalive_expiry=float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', '30')),
+            timeout=float(os.getenv('OPENAI_TIMEOUT', '60')),
+            chat_cache=ResponseCache(
+                max_entries=int(os.getenv('CHAT_CACHE_MAX_ENTRIES', '1024')),
+                max_bytes=int(os.getenv('CHAT_CACHE_MAX_BYTES', str(8 * 1024 * 1024))),
+                ttl=float(os.getenv('CHAT_CACHE_TTL', '3600')),
+            ),
+            vision_cache=ResponseCache(
+                max_entries=int(os.getenv('VISION_CACHE_MAX_ENTRIES', '4096')),
+                max_bytes=int(os.getenv('VISION_CACHE_MAX_BYTES', str(8 * 1024 * 1024))),
+                ttl=float(os.getenv('VISION_CACHE_TTL', '86400')),
+            ),
+            conversations=ConversationStore(
+                max_turns=int(os.getenv('CONVERSATION_MAX_TURNS', '20')),
+                token_budget=int(os.getenv('CONVERSATION_TOKEN_BUDGET', '2000')),
+                max_chats=int(os.getenv('CONVERSATION_MAX_CHATS', '10000')),
+            ),
+            summary_threshold=int(os.getenv('CONVERSATION_SUMMARY_THRESHOLD', '12')),
+            summary_keep_recent=int(os.getenv('CONVERSATION_KEEP_RECENT', '6')),
+            summary_concurrency=int(os.getenv('SUMMARY_MAX_CONCURRENCY', '2')),
+            scheduler=LLMScheduler(
+                max_concurrency=int(os.getenv('LLM_MAX_CONCURRENCY', '16')),
+                per_user_limit=int(os.getenv('LLM_PER_USER_CONCURRENCY', '2')),
+                max_queue_per_user=int(os.getenv('LLM_MAX_QUEUE_PER_USER', '10')),
+            ),
+            resilience=ResilientCaller(
+                max_retries=int(os.getenv('OPENAI_MAX_RETRIES', '3')),
+                base_delay=float(os.getenv('OPENAI_RETRY_BASE_DELAY', '0.5')),
+                max_delay=float(os.getenv('OPENAI_RETRY_MAX_DELAY', '8')),
+                budget=float(os.getenv('OPENAI_REQUEST_BUDGET', '60')),
+                failure_threshold=int(os.getenv('OPENAI_CIRCUIT_FAILURES', '5')),
+                reset_timeout=float(os.getenv('OPENAI_CIRCUIT_RESET', '30')),
+            ),
+            hedger=Hedger(
+                quantile=float(os.getenv('CHAT_HEDGE_QUANTILE', '0.95')),
+                max_outstanding=int(os.getenv('CHAT_HEDGE_MAX_OUTSTANDING', '4')),
+            ) if os.getenv('CHAT_HEDGING', 'false').lower() in ('1', 'true', 'yes') else None,
+            router=ModelRouter(
+                fast_models=_models_from_env('CHAT_FAST_MODELS', 'gpt-3.5-turbo'),
+                strong_models=_models_from_env('CHAT_STRONG_MODELS', 'gpt-4o'),
+                vision_models=_models_from_env('VISION_MODELS', 'gpt-4o'),
+                image_models=_models_from_env('IMAGE_MODELS', 'dall-e-3'),
+                policy=os.getenv('MODEL_ROUTING_POLICY', 'auto'),
+                complexity_threshold=float(os.getenv('MODEL_ROUTING_COMPLEXITY', '0.5')),
+            ),
+            vision_jpeg_quality=int(os.getenv('VISION_JPEG_QUALITY', '85')),
+            vision_default_detail=os.getenv('VISION_DEFAULT_DETAIL', 'high'),
+            near_duplicates=NearDuplicateCache(
+                max_distance=int(os.getenv('VISION_DEDUP_MAX_DISTANCE', '4')),
+                max_entries=int(os.getenv('VISION_DEDUP_MAX_ENTRIES', '2048')),
+                ttl=float(os.getenv('VISION_DEDUP_TTL', '86400')),
+            ),
+            executors=ImageExecutors(
+                processes=int(os.getenv('IMAGE_WORKER_PROCESSES', '2')),
+                threads=int(os.getenv('IMAGE_WORKER_THREADS', '4')),
+                max_pending_cpu=int(os.getenv('IMAGE_MAX_PENDING', '8')),
+            ),
+            media_groups=MediaGroupCollector(
+                window=float(os.getenv('MEDIA_GROUP_WINDOW', '1.0')),
+                max_wait=float(os.getenv('MEDIA_GROUP_MAX_WAIT', '5')),
+            ),
+            vision_planner=VisionPlanner(
+                default_detail=os.getenv('VISION_DEFAULT_DETAIL', 'high'),
+                token_budget=int(os.getenv('VISION_TOKEN_BUDGET', '4000')),
+                max_output_tokens=int(os.getenv('VISION_MAX_OUTPUT_TOKENS', '1000')),
+            ),
+            image_memory=ImageMemory(
+                ttl=float(os.getenv('IMAGE_FOLLOWUP_TTL', '600')),
+                max_chats=int(os.getenv('IMAGE_FOLLOWUP_MAX_CHATS', '1000')),
+                max_bytes=int(os.getenv('IMAGE_FOLLOWUP_MAX_BYTES', str(64 * 1024 * 1024))),
+            ),
+            image_cache=DiskImageCache(
+                os.getenv('IMAGE_DISK_CACHE_DIR'),
+                max_bytes=int(os.getenv('IMAGE_DISK_CACHE_MAX_BYTES', str(512 * 1024 * 1024))),
+                ttl=float(os.getenv('IMAGE_DISK_CACHE_TTL', str(7 * 24 * 3600))),
+                sweep_interval=float(os.getenv('IMAGE_DISK_CACHE_SWEEP_INTERVAL', '600')),
+            ) if os.getenv('IMAGE_DISK_CACHE_DIR') else None,
+            download_spool_memory=int(os.getenv('DOWNLOAD_SPOOL_MAX_MEMORY', str(1024 * 1024))),
+            download_max_size=int(os.getenv('DOWNLOAD_MAX_SIZE', str(20 * 1024 * 1024))),
+            edit_throttle=EditThrottle(
+                private_interval=float(os.getenv('STREAM_EDIT_INTERVAL', '1.0')),
+                group_interval=float(os.getenv('STREAM_GROUP_EDIT_INTERVAL', '3.0')),
+            ),
+        )
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Collect runtime metrics of shared components.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Metrics grouped by component name
+        """
+        stats = {}
+        if self.chat_cache is not None:
+            stats['chat_cache'] = self.chat_cache.stats()
+        if self.vision_cache is not None:
+            stats['vision_cache'] = self.vision_cache.stats()
+        stats['singleflight'] = self.singleflight.stats()
+        stats['scheduler'] = self.scheduler.stats()
+        stats['rate_limiter'] = self.rate_limiter.stats()
+        stats['resilience'] = self.resilience.stats()
+        if self.hedger is not None:
+            stats['hedger'] = self.hedger.stats()
+        stats['router'] = self.router.stats()
+        stats['vision'] = self.vision_helper.stats()
+        stats['vision_planner'] = self.vision_helper.planner.stats()
+        if self.vision_helper.near_duplicates is not None:
+            stats['near_duplicates'] = self.vision_helper.near_duplicates.stats()
+        if self.executors is not None:
+            stats['executors'] = self.executors.stats()
+        stats['media_groups'] = self.media_groups.stats()
+        stats['image_memory'] = self.image_memory.stats()
+        if self.image_cache is not None:
+            stats['image_cache'] = self.image_cache.stats()
+        stats['downloads'] = self.downloader.stats()
+        stats['edit_throttle'] = self.edit_throttle.stats()
+        stats['conversations'] = self.conversations.stats()
+        stats['summarizer'] = self.summarizer.stats()
+        return stats
+
+    def start(self) -> None:
+        """Start background maintenance; requires a running event loop."""
+        if self.image_cache is not None:
+            self.image_cache.start()
+
+    async def aclose(self) -> None:
+        """Stop background tasks, image workers and the HTTP connection pools."""
+        await self.summarizer.aclose()
+        if self.image_cache is not None:
+            await self.image_cache.aclose()
+        if self.executors is not None:
+            self.executors.shutdown()
+        await self.http_client.aclose()
+        await self.download_client.aclose()
+
+
+def _models_from_env(name: str, default: str) -> List[str]:
+    """Read comma-separated list of model names from environment variable."""
+    return [model.strip() for model in os.getenv(name, default).split(',') if model.strip()]
+
+
+def get_clients(bot_data: Dict[str, Any]) -> ClientRegistry:
+    """
+    Return registry stored in bot_data, creating it if post_init did not run.
+
+    Args:
+        bot_data: Application-wide bot_data dictionary
+
+    Returns:
+        ClientRegistry: Shared registry
+    """
+    registry = bot_data.get(BOT_DATA_KEY)
+    if registry is None:
+        registry = ClientRegistry.from_env()
+        bot_data[BOT_DATA_KEY] = registry
+    return registry
+
+
+async def post_init(application: Application) -> None:
+    """Create the shared client registry when the application starts."""
+    registry = ClientRegistry.from_env()
+    registry.start()
+    application.bot_data[BOT_DATA_KEY] = registry
+
+
+async def post_shutdown(application: Application) -> None:
+    """Close the shared client registry when the application stops."""
+    registry = application.bot_data.pop(BOT_DATA_KEY, None)
+    if registry is not None:
+        await registry.aclose()
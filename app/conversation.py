@@ -0,0 +1,222 @@
+"""Module with per-chat conversation memory for chat completions."""
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional
+
+# Служебные токены, которые модель добавляет к каждому сообщению
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Префикс, с которым краткое содержание передается модели
+SUMMARY_PREFIX = "Краткое содержание предыдущей части диалога: "
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """
+    Roughly estimate number of tokens in text.
+
+    Uses the common "four characters per token" approximation plus the
+    per-message overhead, which is enough to keep prompts under a budget
+    without loading a tokenizer.
+
+    Args:
+        text: Message text
+
+    Returns:
+        int: Estimated number of tokens
+    """
+    if not text:
+        return MESSAGE_OVERHEAD_TOKENS
+    return len(text) // 4 + 1 + MESSAGE_OVERHEAD_TOKENS
+
+
+@dataclass(frozen=True, slots=True)
+class Turn:
+    """One message of a conversation with its precomputed token estimate."""
+    role: str
+    content: str
+    tokens: int
+
+    def as_message(self) -> Dict[str, str]:
+        """Convert turn to chat completion message."""
+        return {"role": self.role, "content": self.content}
+
+
+class _Chat:
+    """Turns of one chat and the rolling summary of older turns."""
+
+    __slots__ = ("turns", "summary")
+
+    def __init__(self, max_turns: int):
+        self.turns: Deque[Turn] = deque(maxlen=max_turns)
+        self.summary: Optional[Turn] = None
+
+
+class ConversationStore:
+    """Recent conversation turns keyed by chat_id.
+
+    Each chat keeps at most max_turns turns in a deque, so appending is O(1)
+    and memory per chat is bounded by max_turns * max_turn_chars. Older
+    turns can be folded into a rolling summary (see app.summarizer). The
+    number of chats is bounded too: the least recently active chat is
+    forgotten first.
+    """
+
+    def __init__(
+        self,
+        max_turns: int = 20,
+        max_turn_chars: int = 4000,
+        token_budget: int = 2000,
+        max_chats: int = 10000,
+    ):
+        """
+        Initialize store.
+
+        Args:
+            max_turns: Maximum number of turns kept per chat
+            max_turn_chars: Longer messages are truncated to this length
+            token_budget: Maximum estimated prompt size in tokens
+            max_chats: Maximum number of chats kept in memory
+        """
+        self.max_turns = max_turns
+        self.max_turn_chars = max_turn_chars
+        self.token_budget = token_budget
+        self.max_chats = max_chats
+        self._chats: "OrderedDict[int, _Chat]" = OrderedDict()
+
+    def append(self, chat_id: int, role: str, content: str) -> None:
+        """
+        Add turn to chat history, dropping the oldest one when full.
+
+        Args:
+            chat_id: Telegram chat ID
+            role: "user" or "assistant"
+            content: Message text
+        """
+        content = content.strip()[:self.max_turn_chars]
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = _Chat(self.max_turns)
+            self._chats[chat_id] = chat
+            if len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        chat.turns.append(Turn(role, content, estimate_tokens(content)))
+
+    def turns(self, chat_id: int) -> List[Turn]:
+        """
+        Return stored turns of the chat, oldest first.
+
+        Args:
+            chat_id: Telegram chat ID
+
+        Returns:
+            List[Turn]: Chat turns
+        """
+        chat = self._chats.get(chat_id)
+        return list(chat.turns) if chat is not None else []
+
+    def summary(self, chat_id: int) -> Optional[str]:
+        """
+        Return rolling summary of older turns of the chat.
+
+        Args:
+            chat_id: Telegram chat ID
+
+        Returns:
+            Optional[str]: Summary text or None if nothing was summarized yet
+        """
+        chat = self._chats.get(chat_id)
+        if chat is None or chat.summary is None:
+            return None
+        return chat.summary.content
+
+    def fold(self, chat_id: int, turns: List[Turn], summary: str) -> None:
+        """
+        Replace summarized turns with a new rolling summary.
+
+        Turns appended while the summary was being generated are kept: only
+        the given turns are removed, and only while they are still at the
+        head of the history.
+
+        Args:
+            chat_id: Telegram chat ID
+            turns: Turns that were summarized, oldest first
+            summary: Summary of the previous summary and the given turns
+        """
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            return
+        folded = {id(turn) for turn in turns}
+        while chat.turns and id(chat.turns[0]) in folded:
+            chat.turns.popleft()
+        summary = summary.strip()[:self.max_turn_chars]
+        chat.summary = Turn("system", summary, estimate_tokens(SUMMARY_PREFIX + summary))
+
+    def build_history(
+        self,
+        chat_id: int,
+        message: str,
+        system_prompt: Optional[str] = None,
+        token_budget: Optional[int] = None,
+    ) -> List[Dict[str, str]]:
+        """
+        Select the most recent turns that fit into the token budget.
+
+        The system prompt, the rolling summary and the new message are
+        always sent, so their size is reserved first; the remaining budget
+        is filled with turns from newest to oldest, i.e. the oldest turns
+        are trimmed first.
+
+        Args:
+            chat_id: Telegram chat ID
+            message: New user message
+            system_prompt: System prompt of the request
+            token_budget: Budget override, store default if omitted
+
+        Returns:
+            List[Dict[str, str]]: History messages, oldest first
+        """
+        budget = self.token_budget if token_budget is None else token_budget
+        remaining = budget - estimate_tokens(message)
+        if system_prompt:
+            remaining -= estimate_tokens(system_prompt)
+
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            return []
+        if chat.summary is not None:
+            remaining -= chat.summary.tokens
+
+        selected = []
+        for turn in reversed(chat.turns):
+            if turn.tokens > remaining:
+                break
+            remaining -= turn.tokens
+            selected.append(turn.as_message())
+        if chat.summary is not None:
+            selected.append({"role": "system", "content": SUMMARY_PREFIX + chat.summary.content})
+        selected.reverse()
+        return selected
+
+    def clear(self, chat_id: int) -> None:
+        """
+        Forget history of the chat.
+
+        Args:
+            chat_id: Telegram chat ID
+        """
+        self._chats.pop(chat_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return store counters.
+
+        Returns:
+            Dict[str, Any]: Number of chats, stored turns and summaries
+        """
+        return {
+            "chats": len(self._chats),
+            "turns": sum(len(chat.turns) for chat in self._chats.values()),
+            "summaries": sum(1 for chat in self._chats.values() if chat.summary is not None),
+        }
@@ -0,0 +1,319 @@
+"""Module with a disk-backed cache of prepared images."""
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Union
+
+from app.image_preprocessing import PreparedImage
+
+TMP_SUFFIX = ".tmp"
+
+
+@dataclass(frozen=True)
+class _Ref:
+    """Index entry: a cache key pointing at a content-addressed blob."""
+
+    key: str
+    digest: str
+    size: int
+    detail: str
+    width: int
+    height: int
+    original_size: int
+    mime_type: str
+    expires_at: float
+
+
+class DiskImageCache:
+    """Size-capped LRU cache of prepared images on disk.
+
+    Downscaled JPEG bytes are stored once per content (blobs/ named by
+    SHA-256), and a small JSON ref per Telegram file and detail level
+    (refs/) points at them, so two files with identical prepared bytes
+    share a blob. The index lives in memory; reads map the blob file
+    instead of copying it. Files are written to a temporary name and
+    renamed, blobs before refs, so a crash leaves at most unreferenced
+    blobs and temporary files, which are removed at startup together
+    with refs whose blob is missing or truncated. Expired entries are
+    removed by a background task.
+
+    Methods doing file I/O are blocking and thread-safe: call them off the
+    event loop.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        max_bytes: int = 512 * 1024 * 1024,
+        ttl: float = 7 * 24 * 3600.0,
+        sweep_interval: float = 600.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Open the cache directory and rebuild the index from it.
+
+        Args:
+            path: Cache directory, created if missing
+            max_bytes: Maximum total size of stored blobs
+            ttl: Lifetime of an entry in seconds, kept across restarts
+            sweep_interval: Seconds between background removals of expired entries
+            clock: Wall time source, replaced in tests
+        """
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._clock = clock
+        self._blobs_dir = self.path / "blobs"
+        self._refs_dir = self.path / "refs"
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Ref]" = OrderedDict()
+        # digest -> число ссылок на блоб
+        self._blob_refs: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self.recovered = 0
+        self.dropped = 0
+        self._recover()
+
+    def get(self, file_id: str, detail: str) -> Optional[PreparedImage]:
+        """
+        Return the prepared image and mark it as recently used.
+
+        Args:
+            file_id: Stable ID of the source file (Telegram file_unique_id)
+            detail: Detail level the image was prepared for
+
+        Returns:
+            Optional[PreparedImage]: Image whose data is a read-only memory
+                map of the blob, None if missing or expired
+        """
+        key = _key(file_id, detail)
+        with self._lock:
+            ref = self._entries.get(key)
+            if ref is None:
+                self.misses += 1
+                return None
+            if ref.expires_at <= self._clock():
+                self._remove(key)
+                self.expired += 1
+                self.misses += 1
+                return None
+            try:
+                with open(self._blob_path(ref.digest), "rb") as file:
+                    data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                # Блоб удален или поврежден извне: запись больше не годится
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            _touch(self._ref_path(key))
+            self.hits += 1
+        return PreparedImage(
+            data=data,
+            detail=ref.detail,
+            width=ref.width,
+            height=ref.height,
+            original_size=ref.original_size,
+            mime_type=ref.mime_type,
+        )
+
+    def put(self, file_id: str, prepared: PreparedImage) -> None:
+        """
+        Store a prepared image, evicting least recently used entries if needed.
+
+        Images larger than the whole cache are not stored.
+
+        Args:
+            file_id: Stable ID of the source file (Telegram file_unique_id)
+            prepared: Downscaled and re-encoded image
+        """
+        size = len(prepared.data)
+        if size == 0 or size > self.max_bytes:
+            return
+        key = _key(file_id, prepared.detail)
+        digest = hashlib.sha256(prepared.data).hexdigest()
+        ref = _Ref(
+            key=key,
+            digest=digest,
+            size=size,
+            detail=prepared.detail,
+            width=prepared.width,
+            height=prepared.height,
+            original_size=prepared.original_size,
+            mime_type=prepared.mime_type,
+            expires_at=self._clock() + self.ttl,
+        )
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            blob_path = self._blob_path(digest)
+            if digest not in self._blob_refs:
+                blob_path.parent.mkdir(exist_ok=True)
+                _write_atomic(blob_path, prepared.data)
+                self.size_bytes += size
+            # Ссылка пишется после блоба: после сбоя не останется ссылки без данных
+            _write_atomic(self._ref_path(key), json.dumps(asdict(ref)).encode())
+            self._entries[key] = ref
+            self._blob_refs[digest] = self._blob_refs.get(digest, 0) + 1
+            while self.size_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def sweep(self) -> int:
+        """
+        Remove expired entries.
+
+        Returns:
+            int: Number of removed entries
+        """
+        now = self._clock()
+        with self._lock:
+            expired = [key for key, ref in self._entries.items() if ref.expires_at <= now]
+            for key in expired:
+                self._remove(key)
+            self.expired += len(expired)
+        return len(expired)
+
+    def start(self) -> None:
+        """Start periodic removal of expired entries; requires a running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._sweep_forever())
+
+    async def aclose(self) -> None:
+        """Stop the background removal task."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return cache counters.
+
+        Returns:
+            Dict[str, Any]: Entries, blobs, size, hits, misses, evictions,
+                expired entries, entries recovered and dropped at startup
+                and hit rate
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "blobs": len(self._blob_refs),
+            "bytes": self.size_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "recovered": self.recovered,
+            "dropped": self.dropped,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    async def _sweep_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            await asyncio.to_thread(self.sweep)
+
+    def _recover(self) -> None:
+        self._blobs_dir.mkdir(parents=True, exist_ok=True)
+        self._refs_dir.mkdir(parents=True, exist_ok=True)
+        now = self._clock()
+        refs = []
+        for path in self._refs_dir.iterdir():
+            if path.suffix == TMP_SUFFIX:
+                # Запись прервана сбоем
+                _unlink(path)
+                continue
+            try:
+                ref = _Ref(**json.loads(path.read_bytes()))
+                valid = (
+                    path.stem == ref.key
+                    and ref.expires_at > now
+                    and self._blob_path(ref.digest).stat().st_size == ref.size
+                )
+                mtime = path.stat().st_mtime
+            except (OSError, ValueError, TypeError):
+                valid = False
+            if not valid:
+                _unlink(path)
+                self.dropped += 1
+                continue
+            refs.append((mtime, ref))
+
+        # Порядок LRU восстанавливается по времени последнего обращения к ссылке
+        for _, ref in sorted(refs, key=lambda item: item[0]):
+            self._entries[ref.key] = ref
+            if ref.digest not in self._blob_refs:
+                self.size_bytes += ref.size
+            self._blob_refs[ref.digest] = self._blob_refs.get(ref.digest, 0) + 1
+        self.recovered = len(self._entries)
+
+        for directory in self._blobs_dir.iterdir():
+            for path in directory.iterdir() if directory.is_dir() else [directory]:
+                if path.name not in self._blob_refs:
+                    _unlink(path)
+        while self.size_bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        ref = self._entries.pop(key)
+        # Сначала ссылка, потом блоб: после сбоя останется только лишний блоб
+        _unlink(self._ref_path(key))
+        count = self._blob_refs[ref.digest] - 1
+        if count:
+            self._blob_refs[ref.digest] = count
+            return
+        del self._blob_refs[ref.digest]
+        self.size_bytes -= ref.size
+        _unlink(self._blob_path(ref.digest))
+
+    def _blob_path(self, digest: str) -> Path:
+        return self._blobs_dir / digest[:2] / digest
+
+    def _ref_path(self, key: str) -> Path:
+        return self._refs_dir / f"{key}.json"
+
+
+def _key(file_id: str, detail: str) -> str:
+    # ID файла Telegram не обязан быть безопасным именем файла
+    return hashlib.sha256(f"{file_id}:{detail}".encode()).hexdigest()
+
+
+def _write_atomic(path: Path, data: Any) -> None:
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=TMP_SUFFIX)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(tmp_name, path)
+    except BaseException:
+        _unlink(Path(tmp_name))
+        raise
+
+
+def _touch(path: Path) -> None:
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _unlink(path: Path) -> None:
+    try:
+        path.unlink()
+    except OSError:
+        pass
@@ -0,0 +1,116 @@
+"""Module for downloading Telegram files without holding them in memory."""
+import asyncio
+import io
+import tempfile
+from typing import Any, BinaryIO, Dict, Optional
+from urllib.parse import urlparse
+
+import httpx
+from telegram import File
+
+DOWNLOAD_CHUNK = 64 * 1024
+
+
+class FileTooLargeError(Exception):
+    """Raised when a file exceeds the download size limit."""
+
+
+class SpooledDownloader:
+    """Streams Telegram files into memory or temporary files.
+
+    A file is read from the network in DOWNLOAD_CHUNK pieces; up to
+    max_memory bytes stay in memory, larger files spill to a named
+    temporary file on disk, which worker processes can open by path.
+    Memory use per download is bounded no matter how big the file is,
+    unlike File.download_as_bytearray which grows one buffer to the full size.
+    """
+
+    def __init__(
+        self,
+        http_client: httpx.AsyncClient,
+        max_memory: int = 1024 * 1024,
+        max_size: int = 20 * 1024 * 1024,
+        tmp_dir: Optional[str] = None,
+    ):
+        """
+        Initialize downloader.
+
+        Args:
+            http_client: HTTP client to stream files with
+            max_memory: Size above which a download spills to disk
+            max_size: Maximum file size, larger downloads are aborted
+            tmp_dir: Directory for spilled files, system default if omitted
+        """
+        self.http_client = http_client
+        self.max_memory = max_memory
+        self.max_size = max_size
+        self.tmp_dir = tmp_dir
+        self.downloads = 0
+        self.spilled = 0
+        self.rejected = 0
+        self.bytes = 0
+
+    async def download(self, file: File) -> BinaryIO:
+        """
+        Download a file into memory or, above max_memory, a temporary file.
+
+        Args:
+            file: Telegram file returned by get_file
+
+        Returns:
+            BinaryIO: File positioned at the start; the caller closes it,
+                which also deletes a temporary file
+
+        Raises:
+            FileTooLargeError: If the file is larger than max_size
+            httpx.HTTPError: If the download fails
+        """
+        if file.file_size and file.file_size > self.max_size:
+            self.rejected += 1
+            raise FileTooLargeError(f"файл больше {self.max_size // (1024 * 1024)} МБ")
+        if urlparse(file.file_path).scheme not in ("http", "https"):
+            # Локальный сервер Bot API отдает путь к файлу на диске: копировать нечего
+            self.downloads += 1
+            return await asyncio.to_thread(open, file.file_path, "rb")
+
+        spool: BinaryIO = io.BytesIO()
+        size = 0
+        try:
+            async with self.http_client.stream("GET", file.file_path) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK):
+                    size += len(chunk)
+                    if size > self.max_size:
+                        self.rejected += 1
+                        raise FileTooLargeError(f"файл больше {self.max_size // (1024 * 1024)} МБ")
+                    if size > self.max_memory and isinstance(spool, io.BytesIO):
+                        # Файл на диске с именем: его можно передать процессу по пути
+                        spilled = tempfile.NamedTemporaryFile(dir=self.tmp_dir, prefix="download-")
+                        spilled.write(spool.getbuffer())
+                        spool.close()
+                        spool = spilled
+                    spool.write(chunk)
+            spool.flush()
+        except BaseException:
+            spool.close()
+            raise
+        spool.seek(0)
+        self.downloads += 1
+        self.bytes += size
+        self.spilled += size > self.max_memory
+        return spool
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return download counters.
+
+        Returns:
+            Dict[str, Any]: Downloads, downloads spilled to disk, rejected
+                oversized files and downloaded bytes
+        """
+        return {
+            "downloads": self.downloads,
+            "spilled": self.spilled,
+            "rejected": self.rejected,
+            "bytes": self.bytes,
+        }
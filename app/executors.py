@@ -0,0 +1,155 @@
+"""Module with bounded executors for CPU-bound image work."""
+import asyncio
+import functools
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+class BoundedExecutor:
+    """Executor wrapper limiting the number of submitted jobs.
+
+    At most max_pending jobs are handed to the executor at a time; other
+    callers wait on the event loop without queueing their data inside the
+    executor, so a burst of large photos cannot pile up in memory.
+    """
+
+    def __init__(self, executor: Executor, max_pending: int):
+        """
+        Initialize wrapper.
+
+        Args:
+            executor: Process or thread pool doing the work
+            max_pending: Maximum number of jobs submitted to the pool
+        """
+        self.executor = executor
+        self.max_pending = max_pending
+        self._semaphore = asyncio.Semaphore(max_pending)
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """
+        Run function in the pool once a slot is free.
+
+        Args:
+            fn: Function to run; must be picklable for process pools
+            *args: Positional arguments of the function
+
+        Returns:
+            T: Result of the function
+        """
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(fn, *args))
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return queue counters.
+
+        Returns:
+            Dict[str, Any]: Waiting, running and completed jobs
+        """
+        return {"waiting": self.waiting, "running": self.running, "completed": self.completed}
+
+
+class ImageExecutors:
+    """Pools for the vision pipeline: processes for Pillow, threads for base64.
+
+    Decoding, resizing and hashing photos hold the CPU for tens of
+    milliseconds each and are moved to worker processes; base64 encoding
+    releases the GIL and runs in threads. Workers get a photo as bytes or,
+    when it is downloaded to a file on disk, as the path of that file: open
+    files cannot be pickled. Nothing heavy is left on the event loop thread.
+    """
+
+    def __init__(
+        self,
+        processes: Optional[int] = None,
+        threads: int = 4,
+        max_pending_cpu: Optional[int] = None,
+        max_pending_io: Optional[int] = None,
+    ):
+        """
+        Initialize pools; worker processes are started on first use.
+
+        Args:
+            processes: Worker processes for Pillow work, CPU count if omitted;
+                0 runs Pillow work in the thread pool instead
+            threads: Worker threads for base64 encoding
+            max_pending_cpu: Maximum jobs submitted to the process pool,
+                twice the number of workers if omitted
+            max_pending_io: Maximum jobs submitted to the thread pool,
+                twice the number of workers if omitted
+        """
+        if processes is None:
+            processes = os.cpu_count() or 1
+        self.threads = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="image-io")
+        if processes > 0:
+            # spawn: дочерний процесс не наследует потоки и event loop бота
+            self.processes: Optional[ProcessPoolExecutor] = ProcessPoolExecutor(
+                max_workers=processes, mp_context=multiprocessing.get_context("spawn")
+            )
+            cpu_pool: Executor = self.processes
+        else:
+            self.processes = None
+            cpu_pool = self.threads
+        self.cpu = BoundedExecutor(cpu_pool, max_pending_cpu or 2 * max(processes, 1))
+        self.io = BoundedExecutor(self.threads, max_pending_io or 2 * threads)
+
+    async def run_cpu(self, fn: Callable[..., T], *args: Any) -> T:
+        """
+        Run CPU-bound Pillow work in the process pool.
+
+        Args:
+            fn: Module-level function to run
+            *args: Picklable positional arguments
+
+        Returns:
+            T: Result of the function
+        """
+        return await self.cpu.run(fn, *args)
+
+    async def run_io(self, fn: Callable[..., T], *args: Any) -> T:
+        """
+        Run GIL-releasing work (base64, hashing of buffers) in the thread pool.
+
+        Args:
+            fn: Function to run
+            *args: Positional arguments
+
+        Returns:
+            T: Result of the function
+        """
+        return await self.io.run(fn, *args)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return queue counters of both pools.
+
+        Returns:
+            Dict[str, Any]: Waiting, running and completed jobs per pool
+        """
+        stats = {f"cpu_{name}": value for name, value in self.cpu.stats().items()}
+        stats.update({f"io_{name}": value for name, value in self.io.stats().items()})
+        return stats
+
+    def shutdown(self) -> None:
+        """Stop worker processes and threads without waiting for queued jobs."""
+        if self.processes is not None:
+            self.processes.shutdown(wait=False, cancel_futures=True)
+        self.threads.shutdown(wait=False, cancel_futures=True)
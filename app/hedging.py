@@ -0,0 +1,165 @@
+"""Module with hedged requests reducing tail latency of OpenAI calls."""
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class Hedger:
+    """Sends a duplicate call when the first one is slower than usual.
+
+    If a call has not finished after the running quantile (p95 by default)
+    of recent latencies, the same call is started again and whichever
+    finishes first wins; the other one is cancelled. The number of hedges
+    in flight is capped, so during a general slowdown the extra load stays
+    bounded instead of doubling.
+    """
+
+    def __init__(
+        self,
+        quantile: float = 0.95,
+        min_delay: float = 0.5,
+        max_delay: float = 10.0,
+        initial_delay: float = 3.0,
+        max_outstanding: int = 4,
+        samples: int = 200,
+        min_samples: int = 20,
+    ):
+        """
+        Initialize hedger.
+
+        Args:
+            quantile: Latency quantile after which a hedge is sent
+            min_delay: Lower bound of the hedge delay in seconds
+            max_delay: Upper bound of the hedge delay in seconds
+            initial_delay: Hedge delay used until min_samples latencies are known
+            max_outstanding: Maximum number of hedges in flight
+            samples: Number of recent latencies kept
+            min_samples: Number of latencies needed to use the quantile
+        """
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.initial_delay = initial_delay
+        self.max_outstanding = max_outstanding
+        self.min_samples = min_samples
+        self._latencies: Deque[float] = deque(maxlen=samples)
+        self.outstanding = 0
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.skipped = 0
+
+    def threshold(self) -> float:
+        """
+        Return current delay before a hedge is sent.
+
+        Returns:
+            float: Seconds, the latency quantile clamped to [min_delay, max_delay]
+        """
+        if len(self._latencies) < self.min_samples:
+            return self.initial_delay
+        latencies = sorted(self._latencies)
+        value = latencies[min(len(latencies) - 1, int(len(latencies) * self.quantile))]
+        return min(self.max_delay, max(self.min_delay, value))
+
+    async def run(
+        self,
+        factory: Callable[[], Awaitable[T]],
+        discard: Optional[Callable[[T], Awaitable[Any]]] = None,
+    ) -> T:
+        """
+        Run the call, hedging it if it is slower than the threshold.
+
+        Only calls without side effects may be hedged: both attempts can
+        reach the server.
+
+        Args:
+            factory: Function starting a new independent attempt of the call
+            discard: Optional cleanup of a result of the losing attempt that
+                finished at the same time as the winner, e.g. closing a stream
+
+        Returns:
+            T: Result of the attempt that finished first
+
+        Raises:
+            Exception: Error of the call if every started attempt failed
+        """
+        self.calls += 1
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        primary = asyncio.ensure_future(factory())
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.threshold())
+        except BaseException:
+            primary.cancel()
+            raise
+        if done or self.outstanding >= self.max_outstanding:
+            if not done:
+                # Лимит дублей исчерпан — просто ждем основной запрос
+                self.skipped += 1
+            try:
+                result = await primary
+            finally:
+                primary.cancel()
+            self._latencies.append(loop.time() - started)
+            return result
+
+        self.hedged += 1
+        self.outstanding += 1
+        hedge_started = loop.time()
+        hedge = asyncio.ensure_future(factory())
+        pending = {primary, hedge}
+        winner = None
+        try:
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled() or task.exception() is not None:
+                        # Упавшая попытка не отменяет вторую: ждем ее результат
+                        error = error or (task.exception() if not task.cancelled() else None)
+                        continue
+                    winner = task
+                    if task is hedge:
+                        self.hedge_wins += 1
+                        self._latencies.append(loop.time() - hedge_started)
+                    else:
+                        self._latencies.append(loop.time() - started)
+                    return task.result()
+            if error is not None:
+                raise error
+            raise asyncio.CancelledError()
+        finally:
+            self.outstanding -= 1
+            # Проигравший запрос отменяется, чтобы не занимать соединение
+            for task in (primary, hedge):
+                task.cancel()
+                if (
+                    discard is not None and task is not winner and task.done()
+                    and not task.cancelled() and task.exception() is None
+                ):
+                    await discard(task.result())
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return hedging counters.
+
+        Returns:
+            Dict[str, Any]: Hedge rate, share of hedges that won, skipped hedges
+                and current threshold in seconds
+        """
+        return {
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedge_rate": self.hedged / self.calls if self.calls else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "win_rate": self.hedge_wins / self.hedged if self.hedged else 0.0,
+            "skipped": self.skipped,
+            "outstanding": self.outstanding,
+            "threshold": self.threshold(),
+        }
@@ -0,0 +1,279 @@
+"""Module for finding visually identical images by perceptual hash."""
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from app.image_preprocessing import ImageSource, open_source
+from app.response_cache import make_cache_key
+
+HASH_SIZE = 8
+
+
+def dhash(data: ImageSource, hash_size: int = HASH_SIZE) -> Optional[int]:
+    """
+    Compute difference hash of an image.
+
+    The image is reduced to (hash_size + 1) x hash_size grayscale pixels
+    and every bit tells whether a pixel is brighter than its right
+    neighbour. Recompression, resizing and small color changes keep the
+    hash within a few bits. CPU-bound: run it off the event loop.
+
+    Args:
+        data: Image bytes or a seekable file with them
+        hash_size: Number of rows and bits per row
+
+    Returns:
+        Optional[int]: hash_size * hash_size bit hash, None if the bytes
+            are not a decodable image
+    """
+    try:
+        image = Image.open(open_source(data))
+        # Декодер JPEG сразу уменьшает картинку, полное разрешение не нужно
+        image.draft("L", (hash_size * 8, hash_size * 8))
+        image = ImageOps.exif_transpose(image)
+        pixels = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS).tobytes()
+    except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError):
+        return None
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for column in range(hash_size):
+            value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    """Return number of differing bits of two hashes."""
+    return (a ^ b).bit_count()
+
+
+class _Node:
+    """BK-tree node: hash, deletion mark and children by distance."""
+
+    __slots__ = ("value", "deleted", "children")
+
+    def __init__(self, value: int):
+        self.value = value
+        self.deleted = False
+        self.children: Dict[int, "_Node"] = {}
+
+
+class BKTree:
+    """Burkhard-Keller tree of hashes under Hamming distance.
+
+    Search within distance d only descends into children whose edge
+    distance is in [dist - d, dist + d], so a query touches a small part of
+    the tree. Removal marks nodes as deleted; the tree is rebuilt when
+    deleted nodes outnumber live ones.
+    """
+
+    def __init__(self):
+        """Initialize empty tree."""
+        self._root: Optional[_Node] = None
+        self.size = 0
+        self.tombstones = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, value: int) -> None:
+        """
+        Insert hash; inserting an existing hash does nothing.
+
+        Args:
+            value: Hash to insert
+        """
+        if self._root is None:
+            self._root = _Node(value)
+            self.size += 1
+            return
+        node = self._root
+        while True:
+            distance = hamming(node.value, value)
+            if distance == 0:
+                if node.deleted:
+                    node.deleted = False
+                    self.tombstones -= 1
+                    self.size += 1
+                return
+            child = node.children.get(distance)
+            if child is None:
+                node.children[distance] = _Node(value)
+                self.size += 1
+                return
+            node = child
+
+    def remove(self, value: int) -> None:
+        """
+        Remove hash if present.
+
+        Args:
+            value: Hash to remove
+        """
+        node = self._root
+        while node is not None:
+            distance = hamming(node.value, value)
+            if distance == 0:
+                if not node.deleted:
+                    node.deleted = True
+                    self.tombstones += 1
+                    self.size -= 1
+                    if self.tombstones > self.size:
+                        self._rebuild()
+                return
+            node = node.children.get(distance)
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, int]]:
+        """
+        Find hashes within max_distance.
+
+        Args:
+            value: Query hash
+            max_distance: Maximum Hamming distance
+
+        Returns:
+            List[Tuple[int, int]]: (distance, hash) pairs, closest first
+        """
+        found = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(node.value, value)
+            if distance <= max_distance and not node.deleted:
+                found.append((distance, node.value))
+            for edge, child in node.children.items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        found.sort()
+        return found
+
+    def _rebuild(self) -> None:
+        values = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            if not node.deleted:
+                values.append(node.value)
+            stack.extend(node.children.values())
+        self._root = None
+        self.size = 0
+        self.tombstones = 0
+        for value in values:
+            self.add(value)
+
+
+class NearDuplicateCache:
+    """Cache of image analysis results shared by visually identical images.
+
+    Results are stored per (hash, prompt, model) with TTL and LRU eviction;
+    a lookup reuses the result of the closest stored image whose hash is
+    within max_distance bits and which was asked the same question of the
+    same model.
+    """
+
+    def __init__(
+        self,
+        max_distance: int = 4,
+        max_entries: int = 2048,
+        ttl: float = 86400.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize cache.
+
+        Args:
+            max_distance: Maximum Hamming distance of hashes treated as the same image
+            max_entries: Maximum number of stored results
+            ttl: Lifetime of a result in seconds
+            clock: Monotonic time source, replaced in tests
+        """
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._tree = BKTree()
+        # (hash, context) -> (expires_at, answer)
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[float, str]]" = OrderedDict()
+        self._contexts: Dict[int, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, image_hash: int, prompt: Optional[str], model: str) -> Optional[str]:
+        """
+        Return result of a visually identical image asked the same question.
+
+        Args:
+            image_hash: Perceptual hash of the image
+            prompt: Question about the image
+            model: Model that analyzes the image
+
+        Returns:
+            Optional[str]: Stored result or None
+        """
+        context = make_cache_key(prompt or "", model)
+        now = self._clock()
+        for _, candidate in self._tree.search(image_hash, self.max_distance):
+            key = (candidate, context)
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            expires_at, answer = entry
+            if expires_at <= now:
+                self._remove(key)
+                continue
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return answer
+        self.misses += 1
+        return None
+
+    def set(self, image_hash: int, prompt: Optional[str], model: str, answer: str) -> None:
+        """
+        Store result of an image analysis.
+
+        Args:
+            image_hash: Perceptual hash of the image
+            prompt: Question about the image
+            model: Model that analyzed the image
+            answer: Analysis result
+        """
+        key = (image_hash, make_cache_key(prompt or "", model))
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        else:
+            self._contexts[image_hash] = self._contexts.get(image_hash, 0) + 1
+            self._tree.add(image_hash)
+        self._entries[key] = (self._clock() + self.ttl, answer)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return cache counters.
+
+        Returns:
+            Dict[str, Any]: Entries, indexed hashes, hits, misses, evictions and hit rate
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hashes": len(self._tree),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _remove(self, key: Tuple[int, str]) -> None:
+        del self._entries[key]
+        image_hash = key[0]
+        remaining = self._contexts[image_hash] - 1
+        if remaining:
+            self._contexts[image_hash] = remaining
+        else:
+            del self._contexts[image_hash]
+            self._tree.remove(image_hash)
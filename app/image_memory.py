@@ -0,0 +1,196 @@
+"""Module with per-chat memory of the last image for follow-up questions."""
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.image_preprocessing import PreparedImage
+
+
+@dataclass(frozen=True)
+class RememberedImage:
+    """Last photo of a chat: Telegram reference and, once known, prepared bytes."""
+
+    file_id: str
+    file_unique_id: str
+    width: Optional[int]
+    height: Optional[int]
+    prepared: Optional[PreparedImage] = None
+    expires_at: float = 0.0
+    answer_ids: Tuple[int, ...] = ()
+
+    @property
+    def size(self) -> int:
+        """Bytes of memory held by the prepared image."""
+        return len(self.prepared.data) if self.prepared is not None else 0
+
+
+class ImageMemory:
+    """Last photo of every chat, kept for a short time.
+
+    Follow-up text questions about a photo are answered from the prepared
+    (already downscaled and re-encoded) bytes without downloading the photo
+    again. A photo whose answer came from a cache has no prepared bytes;
+    the Telegram file_id is kept so it can still be downloaded on demand.
+    The number of chats and the total size of prepared bytes are bounded;
+    the least recently used chat is forgotten first. IDs of the last bot
+    answers about the photo are kept so a reply to them is a follow-up too.
+    """
+
+    max_answer_ids = 8
+
+    def __init__(
+        self,
+        ttl: float = 600.0,
+        max_chats: int = 1000,
+        max_bytes: int = 64 * 1024 * 1024,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize memory.
+
+        Args:
+            ttl: Seconds after the photo during which text questions may refer to it
+            max_chats: Maximum number of chats with a remembered photo
+            max_bytes: Maximum total size of prepared images
+            clock: Monotonic time source, replaced in tests
+        """
+        self.ttl = ttl
+        self.max_chats = max_chats
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._images: "OrderedDict[int, RememberedImage]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def remember(
+        self,
+        chat_id: int,
+        file_id: str,
+        file_unique_id: str,
+        width: Optional[int],
+        height: Optional[int],
+    ) -> None:
+        """
+        Remember a new photo of the chat by its Telegram reference.
+
+        Prepared bytes and answer IDs of the same photo remembered earlier are kept.
+
+        Args:
+            chat_id: Chat the photo was sent to
+            file_id: Telegram ID to download the photo with
+            file_unique_id: Telegram ID that is the same for every copy of the file
+            width: Width of the original photo, None if unknown (image files)
+            height: Height of the original photo, None if unknown
+        """
+        previous = self._images.get(chat_id)
+        prepared = None
+        answer_ids: Tuple[int, ...] = ()
+        if previous is not None and previous.file_unique_id == file_unique_id:
+            prepared = previous.prepared
+            answer_ids = previous.answer_ids
+        self._store(chat_id, RememberedImage(
+            file_id=file_id,
+            file_unique_id=file_unique_id,
+            width=width,
+            height=height,
+            prepared=prepared,
+            expires_at=self._clock() + self.ttl,
+            answer_ids=answer_ids,
+        ))
+
+    def attach(self, chat_id: int, file_unique_id: str, prepared: PreparedImage) -> None:
+        """
+        Attach prepared bytes to the remembered photo.
+
+        Ignored if the chat has sent another photo meanwhile.
+
+        Args:
+            chat_id: Chat the photo was sent to
+            file_unique_id: Telegram ID of the photo the bytes were prepared from
+            prepared: Downscaled and re-encoded image
+        """
+        current = self._images.get(chat_id)
+        if current is None or current.file_unique_id != file_unique_id:
+            return
+        if current.prepared is not None and current.prepared.detail == prepared.detail:
+            return
+        self._store(chat_id, replace(current, prepared=prepared))
+
+    def attach_answer(self, chat_id: int, file_unique_id: str, message_id: int) -> None:
+        """
+        Remember a bot answer about the photo, so a reply to it refers to the photo.
+
+        Ignored if the chat has sent another photo meanwhile.
+
+        Args:
+            chat_id: Chat the photo was sent to
+            file_unique_id: Telegram ID of the photo the answer is about
+            message_id: ID of the answer message
+        """
+        current = self._images.get(chat_id)
+        if current is None or current.file_unique_id != file_unique_id:
+            return
+        answer_ids = (current.answer_ids + (message_id,))[-self.max_answer_ids:]
+        self._store(chat_id, replace(current, answer_ids=answer_ids))
+
+    def get(self, chat_id: int) -> Optional[RememberedImage]:
+        """
+        Return the photo text messages of the chat refer to.
+
+        Args:
+            chat_id: Chat ID
+
+        Returns:
+            Optional[RememberedImage]: Last photo if its TTL has not expired
+        """
+        image = self._images.get(chat_id)
+        if image is None:
+            self.misses += 1
+            return None
+        if image.expires_at <= self._clock():
+            self.forget(chat_id)
+            self.misses += 1
+            return None
+        self._images.move_to_end(chat_id)
+        self.hits += 1
+        return image
+
+    def forget(self, chat_id: int) -> None:
+        """
+        Forget the photo of the chat.
+
+        Args:
+            chat_id: Chat ID
+        """
+        image = self._images.pop(chat_id, None)
+        if image is not None:
+            self._bytes -= image.size
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return memory counters.
+
+        Returns:
+            Dict[str, Any]: Remembered chats, bytes, hits, misses and evictions
+        """
+        return {
+            "chats": len(self._images),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _store(self, chat_id: int, image: RememberedImage) -> None:
+        self.forget(chat_id)
+        self._images[chat_id] = image
+        self._bytes += image.size
+        while len(self._images) > self.max_chats or self._bytes > self.max_bytes:
+            oldest = next(iter(self._images))
+            if oldest == chat_id and len(self._images) == 1:
+                break
+            self.forget(oldest)
+            self.evictions += 1
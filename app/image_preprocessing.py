@@ -0,0 +1,315 @@
+"""Module for preparing images before they are sent to the Vision API."""
+import io
+import logging
+import os
+import re
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Callable, Optional, Sequence, Tuple, TypeVar, Union
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# Размер фото Telegram (PhotoSize): нужны только width, height и file_size
+PhotoSizeT = TypeVar("PhotoSizeT")
+T = TypeVar("T")
+
+# Исходное изображение: байты в памяти или файл, например скачанный во временный файл
+ImageSource = Union[bytes, bytearray, BinaryIO]
+
+# Уровни детализации Vision API
+DETAIL_LOW = "low"
+DETAIL_HIGH = "high"
+DETAIL_AUTO = "auto"
+
+# Сетка Vision API: low — одна картинка 512x512, high — вписывание в 2048x2048,
+# затем короткая сторона до 768 и нарезка на тайлы 512x512
+LOW_DETAIL_SIDE = 512
+HIGH_DETAIL_MAX_SIDE = 2048
+HIGH_DETAIL_SHORT_SIDE = 768
+
+DEFAULT_JPEG_QUALITY = 85
+
+# Намерение вопроса к изображению
+INTENT_READ = "read"
+INTENT_DETAIL = "detail"
+INTENT_BRIEF = "brief"
+INTENT_DESCRIBE = "describe"
+
+# Слова ищутся целиком: у основ допустимы только окончания (\w*), иначе
+# "чек" находится в "человеке", а "read" в "already"
+_READ_WORDS = re.compile(
+    r"\b(?:текст\w*|прочита\w*|прочти\w*|надпис\w*|напечат\w*|документ\w*|таблиц\w*|"
+    r"скриншот\w*|код|кода|коде|коду|кодом|формул\w*|чек|чека|чеке|чеки|чеков|"
+    r"перепиши\w*|распозна\w*|read|texts?|documents?|tables?|screenshots?|transcribe|ocr)\b",
+    re.IGNORECASE,
+)
+_DETAIL_WORDS = re.compile(
+    r"\b(?:подробн\w*|детальн\w*|мелк\w*|цифр\w*|числ\w*|график\w*|диаграмм\w*|сколько|"
+    r"detail\w*|charts?|count|how many)\b",
+    re.IGNORECASE,
+)
+_BRIEF_WORDS = re.compile(
+    r"\b(?:кратко|в двух словах|одним словом|что это|кто это|какого цвета|briefly|what is this)\b",
+    re.IGNORECASE,
+)
+
+# Текст, который имеет смысл только вместе с изображением
+_IMAGE_REFERENCE_WORDS = re.compile(
+    r"\b(?:фото|фотк\w*|фотографи\w*|снимк\w*|снимок|картин\w*|изображени\w*|скрин\w*|рисун\w*|"
+    r"на н[её]м|на ней|на них|на фоне|в кадре|видно|что это|кто это|как(?:ого|ой) (?:\w+ )?цвет\w*|"
+    r"photos?|pictures?|images?|screenshots?|what is this|who is this|what colou?r)\b",
+    re.IGNORECASE,
+)
+
+# Детализация для каждого намерения (None — детализация по умолчанию)
+_INTENT_DETAIL = {
+    INTENT_READ: DETAIL_HIGH,
+    INTENT_DETAIL: DETAIL_HIGH,
+    INTENT_BRIEF: DETAIL_LOW,
+    INTENT_DESCRIBE: None,
+}
+
+
+@dataclass(frozen=True)
+class PreparedImage:
+    """Image ready for upload with the detail level it was prepared for."""
+
+    data: bytes
+    detail: str
+    width: int
+    height: int
+    original_size: int
+    mime_type: str = "image/jpeg"
+
+    @property
+    def saved_bytes(self) -> int:
+        """Bytes saved compared to the original image."""
+        return self.original_size - len(self.data)
+
+
+def open_source(source: ImageSource) -> BinaryIO:
+    """
+    Return a readable file positioned at the start of the image.
+
+    Args:
+        source: Image bytes or a seekable file
+
+    Returns:
+        BinaryIO: The file itself or the bytes wrapped in one
+    """
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    source.seek(0)
+    return source
+
+
+def source_size(source: ImageSource) -> int:
+    """Return size of the image bytes or file."""
+    if isinstance(source, (bytes, bytearray)):
+        return len(source)
+    return source.seek(0, io.SEEK_END)
+
+
+def source_path(source: ImageSource) -> Optional[str]:
+    """
+    Return path of the file on disk behind the image, if there is one.
+
+    Open files cannot be sent to worker processes, their paths can.
+
+    Args:
+        source: Image bytes or a file
+
+    Returns:
+        Optional[str]: Path of a named file on disk, None for bytes and
+            in-memory or anonymous files
+    """
+    if isinstance(source, (bytes, bytearray)):
+        return None
+    name = getattr(source, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        return name
+    return None
+
+
+def apply_to_path(fn: Callable[..., T], path: str, *args: Any) -> T:
+    """
+    Open the file and call fn with it; used to run image work in a worker process.
+
+    Args:
+        fn: Module-level function taking an ImageSource first
+        path: Path of the image file
+        *args: Other positional arguments of fn
+
+    Returns:
+        T: Result of fn
+    """
+    with open(path, "rb") as file:
+        return fn(file, *args)
+
+
+def target_size(width: int, height: int, detail: str) -> Tuple[int, int]:
+    """
+    Return the largest size the model actually looks at for the detail level.
+
+    Args:
+        width: Image width in pixels
+        height: Image height in pixels
+        detail: "low" or "high"
+
+    Returns:
+        Tuple[int, int]: Width and height, never larger than the original
+    """
+    if detail == DETAIL_LOW:
+        scale = min(1.0, LOW_DETAIL_SIDE / max(width, height))
+    else:
+        scale = min(
+            1.0,
+            HIGH_DETAIL_MAX_SIDE / max(width, height),
+            HIGH_DETAIL_SHORT_SIDE / min(width, height),
+        )
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def classify_intent(prompt: Optional[str]) -> str:
+    """
+    Classify what the user wants from the image.
+
+    Args:
+        prompt: User's question, None for the default description
+
+    Returns:
+        str: INTENT_READ, INTENT_DETAIL, INTENT_BRIEF or INTENT_DESCRIBE
+    """
+    if not prompt:
+        return INTENT_DESCRIBE
+    if _READ_WORDS.search(prompt):
+        return INTENT_READ
+    if _DETAIL_WORDS.search(prompt):
+        return INTENT_DETAIL
+    if _BRIEF_WORDS.search(prompt):
+        return INTENT_BRIEF
+    return INTENT_DESCRIBE
+
+
+def refers_to_image(text: Optional[str]) -> bool:
+    """
+    Check whether a text message is a question about a picture.
+
+    Args:
+        text: Text of the message
+
+    Returns:
+        bool: True if the text mentions the picture or asks what is on it
+    """
+    return bool(text) and _IMAGE_REFERENCE_WORDS.search(text) is not None
+
+
+def intent_detail(intent: str, default: str = DETAIL_HIGH) -> str:
+    """
+    Return detail level the intent needs, regardless of image size.
+
+    Args:
+        intent: Result of classify_intent
+        default: Level used when the intent gives no hint
+
+    Returns:
+        str: "low" or "high"
+    """
+    return _INTENT_DETAIL[intent] or default
+
+
+def choose_detail(width: int, height: int, prompt: Optional[str], default: str = DETAIL_HIGH) -> str:
+    """
+    Pick Vision detail level for the image and question.
+
+    Args:
+        width: Image width in pixels
+        height: Image height in pixels
+        prompt: User's question about the image
+        default: Level used when the question gives no hint
+
+    Returns:
+        str: "low" or "high"
+    """
+    if max(width, height) <= LOW_DETAIL_SIDE:
+        # Высокая детализация не добавит информации маленькой картинке
+        return DETAIL_LOW
+    return intent_detail(classify_intent(prompt), default)
+
+
+def select_photo_size(photos: Sequence[PhotoSizeT], detail: str) -> PhotoSizeT:
+    """
+    Choose the smallest Telegram rendition that still covers the model's grid.
+
+    Args:
+        photos: Available PhotoSize objects of one photo
+        detail: "low" or "high"
+
+    Returns:
+        PhotoSizeT: Smallest rendition at least as large as the target size,
+            the largest one if none is
+    """
+    largest = max(photos, key=lambda photo: photo.width * photo.height)
+    width, height = target_size(largest.width, largest.height, detail)
+    sufficient = [
+        photo for photo in photos
+        if max(photo.width, photo.height) >= max(width, height)
+        and min(photo.width, photo.height) >= min(width, height)
+    ]
+    if not sufficient:
+        return largest
+    return min(sufficient, key=lambda photo: (photo.width * photo.height, photo.file_size or 0))
+
+
+def preprocess_image(
+    data: ImageSource,
+    prompt: Optional[str] = None,
+    detail: str = DETAIL_AUTO,
+    quality: int = DEFAULT_JPEG_QUALITY,
+    default_detail: str = DETAIL_HIGH,
+) -> PreparedImage:
+    """
+    Downscale image to the model's grid, strip metadata and re-encode as JPEG.
+
+    CPU-bound: run it off the event loop.
+
+    Args:
+        data: Original image bytes or a seekable file with them; a file is
+            decoded without reading it into memory first
+        prompt: User's question, used to pick detail automatically
+        detail: "low", "high" or "auto"
+        quality: JPEG quality of the re-encoded image
+        default_detail: Level used by "auto" when the question gives no hint
+
+    Returns:
+        PreparedImage: Prepared image; the original bytes if they cannot be decoded
+    """
+    original_size = source_size(data)
+    try:
+        image = Image.open(open_source(data))
+        width, height = image.size
+        if detail == DETAIL_AUTO:
+            detail = choose_detail(width, height, prompt, default_detail)
+        # Декодер JPEG может сразу уменьшить картинку в 2-8 раз, это быстрее resize
+        image.draft("RGB", target_size(width, height, detail))
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        size = target_size(image.width, image.height, detail)
+        if size != image.size:
+            image = image.resize(size, Image.LANCZOS)
+        output = io.BytesIO()
+        # Новый файл сохраняется без EXIF и других метаданных
+        image.save(output, format="JPEG", quality=quality, optimize=True)
+    except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning(f"Не удалось подготовить изображение, отправляем как есть: {e}")
+        if detail == DETAIL_AUTO:
+            detail = default_detail
+        return PreparedImage(open_source(data).read(), detail, 0, 0, original_size)
+    return PreparedImage(output.getvalue(), detail, image.width, image.height, original_size)
@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
 """Основной модуль бота."""
 
+import asyncio
 import logging
 import os
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Message
+from typing import Awaitable, BinaryIO, Callable, Dict, List, Optional, Union
+from telegram import File, Update, InlineKeyboardButton, InlineKeyboardMarkup, Message
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -17,8 +19,14 @@ from dotenv import load_dotenv
 # Используем абсолютные импорты – убедитесь, что модули находятся в PYTHONPATH или в одном каталоге.
 from app.roles import UserRole, add_role, remove_role, has_role, get_user_roles
 from app.decorators import require_role, require_registration
-from app.openai_helper import OpenAIHelper
-from app.vision_helper import VisionHelper
+from app.clients import ClientRegistry, get_clients, post_init, post_shutdown
+from app.image_memory import RememberedImage
+from app.image_preprocessing import DETAIL_HIGH, ImageSource, PreparedImage, refers_to_image, select_photo_size
+from app.message_renderer import DelayedStatusMessage, StreamRenderer
+from app.resilience import CircuitOpenError
+from app.scheduler import QueueFullError
+from app.vision_helper import split_questions, vision_cache_key
+from app.vision_planner import VisionPlan
 from app.registration import (
     create_registration_request,
     get_registration_status,
@@ -44,6 +52,38 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+# Системный промпт для текстовых ответов
+CHAT_SYSTEM_PROMPT = (
+    "Ты - дружелюбный ассистент, который помогает пользователям. Отвечай кратко и по существу. "
+    "Если пользователь просит создать изображение, предложи использовать команду /generate_image "
+    "с описанием желаемого изображения."
+)
+
+# Относительная стоимость запросов для справедливой очереди к OpenAI
+TEXT_REQUEST_COST = 1.0
+VISION_REQUEST_COST = 2.0
+IMAGE_GENERATION_COST = 4.0
+
+QUEUE_FULL_MESSAGE = (
+    "Слишком много запросов одновременно. "
+    "Дождитесь ответа на предыдущие сообщения и попробуйте снова."
+)
+
+UNAVAILABLE_MESSAGE = (
+    "Сервис OpenAI временно недоступен. Пожалуйста, повторите запрос через минуту."
+)
+
+# Через сколько секунд обработки фото показывать сообщение о статусе
+STATUS_MESSAGE_DELAY = 1.0
+
+# Форматы файлов, которые принимает Vision; HEIC, SVG и прочие он не разберет
+SUPPORTED_IMAGE_TYPES = ("image/jpeg", "image/png", "image/webp", "image/gif")
+
+UNSUPPORTED_IMAGE_MESSAGE = (
+    "Этот формат изображения не поддерживается. "
+    "Пришлите файл в формате JPEG, PNG, WebP или GIF либо отправьте его как фото."
+)
+
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик команды /start"""
@@ -324,60 +364,409 @@ async def list_requests(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         )
 
 
+@require_role(UserRole.ADMIN)
+async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показывает метрики кэшей и запросов к OpenAI."""
+    lines = []
+    for component, values in get_clients(context.bot_data).stats().items():
+        lines.append(f"{component}:")
+        for name, value in values.items():
+            formatted = f"{value:.3f}" if isinstance(value, float) else str(value)
+            lines.append(f"  {name}: {formatted}")
+    await update.message.reply_text("\n".join(lines) if lines else "Нет данных")
+
+
 @require_registration
 @require_role(UserRole.USER)
 async def echo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик текстовых сообщений"""
-    # Инициализируем OpenAI helper при первом использовании
-    if not hasattr(context.bot_data, 'openai_helper'):
-        context.bot_data['openai_helper'] = OpenAIHelper()
-
-    # Обычный текстовый ответ
-    response = await context.bot_data['openai_helper'].get_chat_response(
-        update.message.text,
-        system_prompt="Ты - дружелюбный ассистент, который помогает пользователям. Отвечай кратко и по существу. Если пользователь просит создать изображение, предложи использовать команду /generate_image с описанием желаемого изображения."
-    )
-    
-    # Отправляем ответ пользователю
-    await update.message.reply_text(response)
+    clients = get_clients(context.bot_data)
+    chat_id = update.message.chat.id
+    text = update.message.text
+
+    # Вопрос о недавнем фото отвечается по этому фото, без повторной загрузки
+    remembered = clients.image_memory.get(chat_id)
+    if remembered is not None and is_image_followup(update.message, remembered):
+        await answer_about_image(update, context, clients, remembered)
+        return
+
+    # Контекст диалога: последние реплики, помещающиеся в бюджет токенов
+    history = clients.conversations.build_history(chat_id, text, CHAT_SYSTEM_PROMPT)
+
+    # Ответ приходит по частям и постепенно дописывается в одно сообщение
+    # Частота правок общая для всех ответов чата: в группах она ниже
+    renderer = StreamRenderer(update.message, throttle=clients.edit_throttle)
+    try:
+        # Заглушка отправляется сразу, даже если запрос ждет в очереди
+        await renderer.start()
+        async with clients.scheduler.slot(update.effective_user.id, cost=TEXT_REQUEST_COST):
+            answer = await renderer.render(
+                clients.openai_helper.stream_chat_response(
+                    text,
+                    system_prompt=CHAT_SYSTEM_PROMPT,
+                    # Одинаковые вопросы разных пользователей обслуживаются из кэша
+                    use_cache=True,
+                    history=history,
+                ),
+                fallback="Не удалось получить ответ. Попробуйте переформулировать вопрос.",
+            )
+    except QueueFullError:
+        await renderer.fail(QUEUE_FULL_MESSAGE)
+        return
+    except CircuitOpenError:
+        await renderer.fail(UNAVAILABLE_MESSAGE)
+        return
+    except Exception as e:
+        logger.error(f"Ошибка при получении ответа от OpenAI: {str(e)}")
+        await renderer.fail(f"Ошибка при получении ответа от OpenAI: {str(e)}")
+        return
+
+    clients.conversations.append(chat_id, "user", text)
+    clients.conversations.append(chat_id, "assistant", answer)
+    # Длинная история сжимается в фоне, не задерживая следующий ответ
+    clients.summarizer.maybe_schedule(chat_id)
+
     logger.debug(f"Отправлен ответ на сообщение от пользователя {update.effective_user.id}")
 
+def format_answers(questions: List[str], answers: List[str]) -> str:
+    """Ответы на несколько вопросов одним сообщением: вопрос и ответ под номером."""
+    return "\n\n".join(
+        f"{index}. {question}\n{answer}" for index, (question, answer) in enumerate(zip(questions, answers), 1)
+    )
+
+async def ask_about_image(
+    clients: ClientRegistry,
+    image: Union[ImageSource, PreparedImage],
+    prompt: str,
+    questions: List[str],
+    model: str,
+    plan: VisionPlan,
+    on_prepared: Callable[[PreparedImage], None],
+    cache_id: str,
+    history: Optional[List[Dict[str, str]]] = None,
+) -> str:
+    """Один запрос к Vision о фото: ответ на вопрос или на каждый из нескольких вопросов."""
+    if len(questions) > 1:
+        # Несколько вопросов — один запрос с ответом на каждый
+        answers = await clients.vision_helper.answer_questions(
+            image, questions, model=model, plan=plan, on_prepared=on_prepared, cache_id=cache_id, history=history
+        )
+        return format_answers(questions, answers)
+    if isinstance(image, PreparedImage):
+        return await clients.vision_helper.analyze_prepared(image, prompt, model=model, plan=plan, history=history)
+    return await clients.vision_helper.analyze_image(
+        image,
+        prompt=prompt,
+        model=model,
+        detail=plan.detail,
+        plan=plan,
+        on_prepared=on_prepared,
+        cache_id=cache_id,
+        history=history,
+    )
+
+def close_download(download: Optional["asyncio.Future[BinaryIO]"]) -> None:
+    """Отменяет незавершенную загрузку и закрывает уже скачанный файл."""
+    if download is None:
+        return
+    download.cancel()
+    if download.done() and not download.cancelled() and download.exception() is None:
+        download.result().close()
+
+def is_image_followup(message: Message, remembered: RememberedImage) -> bool:
+    """Относится ли текст к последнему фото чата: ответ на это фото или на ответ бота о нем, либо вопрос о картинке."""
+    reply = message.reply_to_message
+    if reply is not None:
+        if reply.message_id in remembered.answer_ids:
+            return True
+        media = reply.photo[-1] if reply.photo else reply.document
+        if media is not None:
+            # Ответ на другое фото — не про последнее
+            return media.file_unique_id == remembered.file_unique_id
+    return refers_to_image(message.text)
+
+async def answer_about_image(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    clients: ClientRegistry,
+    remembered: RememberedImage,
+) -> None:
+    """Ответ на текстовый вопрос о последнем фото чата."""
+    chat_id = update.message.chat.id
+    text = update.message.text
+    questions = split_questions(text)
+    model = clients.vision_helper.vision_model()
+    plan = clients.vision_helper.planner.plan(
+        [(remembered.width, remembered.height)], text, questions=len(questions)
+    )
+    # Уточняющий вопрос понятен только вместе с предыдущими репликами
+    history = clients.conversations.build_history(chat_id, text)
+    prepared = remembered.prepared
+
+    def remember(image: PreparedImage) -> None:
+        clients.image_memory.attach(chat_id, remembered.file_unique_id, image)
+
+    status = DelayedStatusMessage(update.message, "Смотрю на изображение...", delay=STATUS_MESSAGE_DELAY)
+    status.start()
+    image_file = None
+    try:
+        async with clients.scheduler.slot(update.effective_user.id, cost=VISION_REQUEST_COST):
+            # Размер файла-документа неизвестен: нужная детализация по вопросу
+            detail = clients.vision_helper.planner.resolve_detail(plan.detail, text)
+            if prepared is None or (detail == DETAIL_HIGH and prepared.detail != DETAIL_HIGH):
+                # Байтов нет (ответ на фото был из кэша) или их детализации мало для вопроса
+                prepared = await clients.vision_helper.load_prepared(remembered.file_unique_id, detail)
+            if prepared is None:
+                image_file = await clients.downloader.download(await context.bot.get_file(remembered.file_id))
+            answer = await ask_about_image(
+                clients,
+                prepared if prepared is not None else image_file,
+                text,
+                questions,
+                model,
+                plan,
+                remember,
+                remembered.file_unique_id,
+                history,
+            )
+        sent = await status.finish(answer)
+    except QueueFullError:
+        await status.finish(QUEUE_FULL_MESSAGE)
+        return
+    except CircuitOpenError:
+        await status.finish(UNAVAILABLE_MESSAGE)
+        return
+    except Exception as e:
+        logger.error(f"Ошибка при анализе изображения: {str(e)}")
+        await status.finish(f"Ошибка при анализе изображения: {str(e)}")
+        return
+    finally:
+        if image_file is not None:
+            image_file.close()
+
+    remember_exchange(clients, chat_id, remembered.file_unique_id, text, answer, sent)
+
+def remember_exchange(
+    clients: ClientRegistry,
+    chat_id: int,
+    file_unique_id: str,
+    question: str,
+    answer: str,
+    sent: Message,
+) -> None:
+    """Сохраняет вопрос о фото и ответ в историю чата для следующих вопросов."""
+    # Ответ на сообщение бота об этом фото — тоже вопрос о фото
+    clients.image_memory.attach_answer(chat_id, file_unique_id, sent.message_id)
+    clients.conversations.append(chat_id, "user", question)
+    clients.conversations.append(chat_id, "assistant", answer)
+    # Длинная история сжимается в фоне, не задерживая следующий ответ
+    clients.summarizer.maybe_schedule(chat_id)
+
 @require_role(UserRole.USER)
 async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик фотографий"""
-    # Инициализируем Vision helper при первом использовании
-    if not hasattr(context.bot_data, 'vision_helper'):
-        context.bot_data['vision_helper'] = VisionHelper()
+    clients = get_clients(context.bot_data)
 
-    # Получаем файл фотографии (берем последнюю версию, т.к. она имеет наивысшее качество)
-    photo_file = await update.message.photo[-1].get_file()
-    photo_bytes = await photo_file.download_as_bytearray()
-    
+    # Фото альбома приходят отдельными апдейтами: собираем их в один запрос
+    if update.message.media_group_id is not None:
+        album = await clients.media_groups.collect(update.message)
+        if album is not None:
+            await handle_album(update, clients, album)
+        return
+
+    photos = update.message.photo
+    largest = photos[-1]
+
+    async def fetch(detail: str) -> File:
+        # Детализация выбирается до загрузки: скачиваем наименьшую версию фото,
+        # которой хватает для сетки модели, а не всегда самую большую
+        return await select_photo_size(photos, detail).get_file()
+
+    await analyze_single_image(
+        update,
+        clients,
+        file_id=select_photo_size(photos, DETAIL_HIGH).file_id,
+        file_unique_id=largest.file_unique_id,
+        width=largest.width,
+        height=largest.height,
+        fetch=fetch,
+    )
+
+@require_role(UserRole.USER)
+async def handle_image_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик изображений, отправленных файлом (без сжатия Telegram)"""
+    clients = get_clients(context.bot_data)
+    document = update.message.document
+    if document.file_size and document.file_size > clients.downloader.max_size:
+        await update.message.reply_text(
+            f"Файл слишком большой: принимаются изображения до {clients.downloader.max_size // (1024 * 1024)} МБ."
+        )
+        return
+    if document.mime_type not in SUPPORTED_IMAGE_TYPES:
+        # Проверяем до загрузки: иначе Vision ответит невнятной ошибкой 400
+        await update.message.reply_text(UNSUPPORTED_IMAGE_MESSAGE)
+        return
+
+    async def fetch(detail: str) -> File:
+        return await document.get_file()
+
+    # Размеры оригинала Telegram для файлов не сообщает: детализация
+    # выбирается по самому изображению после загрузки
+    await analyze_single_image(
+        update,
+        clients,
+        file_id=document.file_id,
+        file_unique_id=document.file_unique_id,
+        width=None,
+        height=None,
+        fetch=fetch,
+    )
+
+async def analyze_single_image(
+    update: Update,
+    clients: ClientRegistry,
+    file_id: str,
+    file_unique_id: str,
+    width: Optional[int],
+    height: Optional[int],
+    fetch: Callable[[str], Awaitable[File]],
+) -> None:
+    """Анализ одного изображения — фото или файла — и ответ в чат."""
     # Получаем текст сообщения или используем стандартный промпт
     caption = update.message.caption or "Опиши детально, что ты видишь на этом изображении"
-    
-    # Отправляем сообщение о том, что начали обработку
-    processing_message = await update.message.reply_text(
-        "Анализирую изображение... Это может занять несколько секунд."
+
+    # Следующие текстовые вопросы чата будут про это изображение
+    chat_id = update.message.chat.id
+    clients.image_memory.remember(chat_id, file_id, file_unique_id, width, height)
+
+    # Повторно присланное фото отвечается из кэша без загрузки и запроса к OpenAI
+    model = clients.vision_helper.vision_model()
+    cache_key = vision_cache_key(file_unique_id, caption, model)
+    if clients.vision_cache is not None:
+        cached = clients.vision_cache.get(cache_key)
+        if cached is not None:
+            sent = await update.message.reply_text(cached)
+            remember_exchange(clients, chat_id, file_unique_id, caption, cached, sent)
+            return
+
+    # Детализация и лимит ответа по размеру фото, вопросу и бюджету токенов
+    questions = split_questions(update.message.caption)
+    plan = clients.vision_helper.planner.plan([(width, height)], caption, questions=len(questions))
+    detail = plan.detail
+
+    # Статус появляется в фоне, только если обработка затянулась; ответ
+    # заменяет его текст, удалять ничего не нужно
+    status = DelayedStatusMessage(
+        update.message,
+        "Анализирую изображение... Это может занять несколько секунд.",
+        delay=STATUS_MESSAGE_DELAY,
     )
-    
+    status.start()
+
+    async def download() -> BinaryIO:
+        # Файл читается потоком во временный файл: в памяти не больше порога
+        return await clients.downloader.download(await fetch(detail))
+
+    def remember(prepared: PreparedImage) -> None:
+        clients.image_memory.attach(chat_id, file_unique_id, prepared)
+
+    download_task = None
     try:
-        # Анализируем изображение с учетом промпта
-        response = await context.bot_data['vision_helper'].analyze_image(photo_bytes, prompt=caption)
-        
+        # Подготовленное раньше фото читается с диска: без загрузки и пересжатия.
+        # В память чата его не кладем — уточняющие вопросы тоже прочитают его с диска
+        prepared = await clients.vision_helper.load_prepared(
+            file_unique_id, clients.vision_helper.planner.resolve_detail(detail, caption)
+        )
+        # Загрузка идет, пока запрос ждет своей очереди к OpenAI
+        download_task = asyncio.create_task(download()) if prepared is None else None
+        async with clients.scheduler.slot(update.effective_user.id, cost=VISION_REQUEST_COST):
+            image = prepared if prepared is not None else await download_task
+            response = await ask_about_image(
+                clients, image, caption, questions, model, plan, remember, file_unique_id
+            )
+        if clients.vision_cache is not None and response:
+            clients.vision_cache.set(cache_key, response)
+
         # Отправляем результат анализа
-        await update.message.reply_text(response)
+        sent = await status.finish(response)
+        # Уточняющие вопросы уйдут в Vision вместе с этим обменом
+        remember_exchange(clients, chat_id, file_unique_id, caption, response, sent)
+    except QueueFullError:
+        await status.finish(QUEUE_FULL_MESSAGE)
+    except CircuitOpenError:
+        await status.finish(UNAVAILABLE_MESSAGE)
     except Exception as e:
         # Логируем ошибку
         logger.error(f"Ошибка при анализе изображения: {str(e)}")
         # Отправляем пользователю сообщение об ошибке
-        await update.message.reply_text(f"Ошибка при анализе изображения: {str(e)}")
+        await status.finish(f"Ошибка при анализе изображения: {str(e)}")
     finally:
-        # Удаляем сообщение о обработке
-        await processing_message.delete()
+        close_download(download_task)
     
     logger.debug(f"Обработано изображение от пользователя {update.effective_user.id}")
 
+async def handle_album(update: Update, clients: ClientRegistry, album: List[Message]) -> None:
+    """Один запрос к Vision и один ответ на весь альбом."""
+    # Подпись альбома Telegram хранит у одного из сообщений, обычно у первого
+    caption = next(
+        (message.caption for message in album if message.caption),
+        "Опиши детально, что ты видишь на этих изображениях",
+    )
+    # Вопросы про альбом целиком не поддерживаются: прежнее фото больше не актуально
+    clients.image_memory.forget(update.message.chat_id)
+    model = clients.vision_helper.vision_model()
+    largest = [message.photo[-1] for message in album]
+    cache_key = vision_cache_key(",".join(photo.file_unique_id for photo in largest), caption, model)
+    if clients.vision_cache is not None:
+        cached = clients.vision_cache.get(cache_key)
+        if cached is not None:
+            await update.message.reply_text(cached)
+            return
+
+    plan = clients.vision_helper.planner.plan([(photo.width, photo.height) for photo in largest], caption)
+    details = list(plan.details)
+
+    async def download(message: Message, detail: str) -> BinaryIO:
+        photo_file = await select_photo_size(message.photo, detail).get_file()
+        return await clients.downloader.download(photo_file)
+
+    status = DelayedStatusMessage(
+        update.message,
+        f"Анализирую {len(album)} изображений... Это может занять несколько секунд.",
+        delay=STATUS_MESSAGE_DELAY,
+    )
+    status.start()
+    # Фото альбома скачиваются параллельно, пока запрос ждет очереди; каждая
+    # загрузка — своя задача, чтобы при ошибке одной закрыть файлы остальных
+    downloads = [
+        asyncio.create_task(download(message, detail)) for message, detail in zip(album, details)
+    ]
+    try:
+        async with clients.scheduler.slot(update.effective_user.id, cost=VISION_REQUEST_COST):
+            images = await asyncio.gather(*downloads)
+            response = await clients.vision_helper.analyze_images(
+                list(images), prompt=caption, model=model, detail=details, plan=plan
+            )
+        if clients.vision_cache is not None and response:
+            clients.vision_cache.set(cache_key, response)
+        await status.finish(response)
+    except QueueFullError:
+        await status.finish(QUEUE_FULL_MESSAGE)
+    except CircuitOpenError:
+        await status.finish(UNAVAILABLE_MESSAGE)
+    except Exception as e:
+        logger.error(f"Ошибка при анализе альбома: {str(e)}")
+        await status.finish(f"Ошибка при анализе изображений: {str(e)}")
+    finally:
+        for download_task in downloads:
+            download_task.cancel()
+        # Дожидаемся и отмененных загрузок: все скачанные файлы закрываются здесь
+        for image_file in await asyncio.gather(*downloads, return_exceptions=True):
+            if not isinstance(image_file, BaseException):
+                image_file.close()
+
+    logger.debug(f"Обработан альбом из {len(album)} фото от пользователя {update.effective_user.id}")
+
 @require_role(UserRole.USER)
 async def generate_image(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Генерация изображения с помощью DALL-E 3"""
@@ -389,9 +778,7 @@ async def generate_image(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         return
 
-    # Инициализируем OpenAI helper при первом использовании
-    if not hasattr(context.bot_data, 'openai_helper'):
-        context.bot_data['openai_helper'] = OpenAIHelper()
+    clients = get_clients(context.bot_data)
 
     # Получаем описание изображения
     prompt = ' '.join(context.args)
@@ -403,14 +790,20 @@ async def generate_image(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     
     try:
         # Генерируем изображение
-        image_url = await context.bot_data['openai_helper'].generate_image(prompt)
+        async with clients.scheduler.slot(update.effective_user.id, cost=IMAGE_GENERATION_COST):
+            image_url = await clients.openai_helper.generate_image(prompt)
         
         # Отправляем изображение
         await update.message.reply_photo(
             image_url,
             caption=f"Сгенерированное изображение по запросу:\n{prompt}"
         )
+    except QueueFullError:
+        await update.message.reply_text(QUEUE_FULL_MESSAGE)
+    except CircuitOpenError:
+        await update.message.reply_text(UNAVAILABLE_MESSAGE)
     except Exception as e:
+        logger.error(f"Ошибка при генерации изображения: {str(e)}")
         await update.message.reply_text(f"Произошла ошибка при генерации изображения: {str(e)}")
     finally:
         # Удаляем сообщение о обработке
@@ -434,7 +827,16 @@ def main() -> None:
             raise ValueError("Не найден токен бота в переменных окружения")
         logger.debug("Токен бота успешно получен")
 
-        application = Application.builder().token(token).build()
+        # Обновления обрабатываются параллельно, чтобы долгий запрос к OpenAI
+        # одного пользователя не задерживал ответы остальным
+        application = (
+            Application.builder()
+            .token(token)
+            .concurrent_updates(True)
+            .post_init(post_init)
+            .post_shutdown(post_shutdown)
+            .build()
+        )
 
         # Регистрируем обработчики команд, callback-запросов и текстовых сообщений
         application.add_handler(CommandHandler("start", start))
@@ -442,10 +844,12 @@ def main() -> None:
         application.add_handler(CommandHandler("revoke_admin", revoke_admin))
         application.add_handler(CommandHandler("my_roles", my_roles))
         application.add_handler(CommandHandler("list_requests", list_requests))
+        application.add_handler(CommandHandler("stats", show_stats))
         application.add_handler(CallbackQueryHandler(button_handler))
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, echo))
         application.add_handler(CommandHandler("generate_image", generate_image))
         application.add_handler(MessageHandler(filters.PHOTO, handle_photo))
+        application.add_handler(MessageHandler(filters.Document.IMAGE, handle_image_document))
         application.add_error_handler(error_handler)
 
         # Запуск бота с использованием polling
@@ -0,0 +1,100 @@
+"""Module for collecting album (media group) photos into one batch."""
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from telegram import Message
+
+
+class _Album:
+    """Messages of one album received so far."""
+
+    __slots__ = ("messages", "started", "updated", "full")
+
+    def __init__(self, message: Message, now: float):
+        self.messages = [message]
+        self.started = now
+        self.updated = now
+        self.full = asyncio.Event()
+
+
+class MediaGroupCollector:
+    """Buffers messages sharing media_group_id for a short window.
+
+    Telegram delivers an album as separate updates, one per photo, within a
+    fraction of a second. The handler call that brings the first photo
+    waits until no new photo arrived for `window` seconds (at most
+    `max_wait` in total) and gets the whole album; calls bringing the other
+    photos return immediately. Requires concurrent update processing.
+    """
+
+    def __init__(
+        self,
+        window: float = 1.0,
+        max_wait: float = 5.0,
+        max_items: int = 10,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize collector.
+
+        Args:
+            window: Seconds without a new photo after which the album is complete
+            max_wait: Maximum seconds to wait for the album since its first photo
+            max_items: Album size that completes it at once (Telegram allows 10)
+            clock: Monotonic time source
+        """
+        self.window = window
+        self.max_wait = max_wait
+        self.max_items = max_items
+        self._clock = clock
+        self._albums: Dict[Tuple[int, str], _Album] = {}
+        self.albums = 0
+        self.photos = 0
+
+    async def collect(self, message: Message) -> Optional[List[Message]]:
+        """
+        Add album message and return the complete album to one caller.
+
+        Args:
+            message: Message with media_group_id set
+
+        Returns:
+            Optional[List[Message]]: Album messages in order for the call that
+                brought the first one, None for the rest
+        """
+        key = (message.chat_id, message.media_group_id)
+        album = self._albums.get(key)
+        if album is not None:
+            album.messages.append(message)
+            album.updated = self._clock()
+            if len(album.messages) >= self.max_items:
+                album.full.set()
+            return None
+
+        album = _Album(message, self._clock())
+        self._albums[key] = album
+        try:
+            while len(album.messages) < self.max_items:
+                now = self._clock()
+                deadline = min(album.updated + self.window, album.started + self.max_wait)
+                if now >= deadline:
+                    break
+                try:
+                    await asyncio.wait_for(album.full.wait(), deadline - now)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            del self._albums[key]
+        self.albums += 1
+        self.photos += len(album.messages)
+        return sorted(album.messages, key=lambda item: item.message_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return album counters.
+
+        Returns:
+            Dict[str, Any]: Collected albums, their photos and albums still open
+        """
+        return {"albums": self.albums, "photos": self.photos, "pending": len(self._albums)}
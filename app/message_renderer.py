@@ -0,0 +1,355 @@
+"""Module for rendering streamed model output into Telegram messages."""
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, List, Optional
+
+from telegram import Message
+from telegram.constants import ChatType, MessageLimit
+from telegram.error import BadRequest, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+
+def split_text(text: str, limit: int) -> int:
+    """
+    Find position to split text that does not fit into one message.
+
+    Prefers the last line break, then the last space before the limit, so
+    words are not cut in half; falls back to a hard cut at the limit.
+
+    Args:
+        text: Text longer than limit
+        limit: Maximum message length
+
+    Returns:
+        int: Length of the head part that stays in the current message
+    """
+    for separator in ("\n", " "):
+        position = text.rfind(separator, 0, limit)
+        if position >= limit // 2:
+            return position + 1
+    return limit
+
+
+class EditThrottle:
+    """Per-chat pacing of message edits shared by all renderers.
+
+    Telegram limits edits per chat, not per message: several answers
+    streaming into one group at once share its budget of about 20 edits
+    per minute. The time of the next allowed edit is kept for every chat;
+    group chats get a longer interval than private ones.
+    """
+
+    def __init__(
+        self,
+        private_interval: float = 1.0,
+        group_interval: float = 3.0,
+        max_chats: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize throttle.
+
+        Args:
+            private_interval: Minimum seconds between edits in a private chat
+            group_interval: Minimum seconds between edits in a group or channel
+            max_chats: Number of chats above which idle entries are dropped
+            clock: Monotonic time source, replaced in tests
+        """
+        self.private_interval = private_interval
+        self.group_interval = group_interval
+        self.max_chats = max_chats
+        self._clock = clock
+        self._next_edit: Dict[Hashable, float] = {}
+        self.allowed = 0
+        self.throttled = 0
+
+    def interval(self, chat_type: Optional[str]) -> float:
+        """
+        Return minimum seconds between edits for the chat type.
+
+        Args:
+            chat_type: Telegram chat type, e.g. "private" or "supergroup"
+
+        Returns:
+            float: Group interval for groups and channels, private otherwise
+        """
+        if chat_type in (ChatType.GROUP, ChatType.SUPERGROUP, ChatType.CHANNEL):
+            return self.group_interval
+        return self.private_interval
+
+    def acquire(self, chat_id: Hashable, chat_type: Optional[str], force: bool = False) -> bool:
+        """
+        Take the chat's edit slot if it is free.
+
+        Args:
+            chat_id: Chat the message belongs to
+            chat_type: Telegram chat type
+            force: Take the slot even if the interval has not passed, e.g.
+                for the final text of an answer
+
+        Returns:
+            bool: True if the edit may be sent now
+        """
+        now = self._clock()
+        if not force and now < self._next_edit.get(chat_id, 0.0):
+            self.throttled += 1
+            return False
+        self.allowed += 1
+        self._set(chat_id, now + self.interval(chat_type))
+        return True
+
+    def postpone(self, chat_id: Hashable, delay: float) -> None:
+        """
+        Hold back edits of the chat, e.g. after Telegram's RetryAfter.
+
+        Args:
+            chat_id: Chat the message belongs to
+            delay: Seconds during which edits are not sent
+        """
+        self._set(chat_id, max(self._next_edit.get(chat_id, 0.0), self._clock() + delay))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return throttle counters.
+
+        Returns:
+            Dict[str, Any]: Tracked chats, edits sent and edits skipped
+        """
+        return {"chats": len(self._next_edit), "allowed": self.allowed, "throttled": self.throttled}
+
+    def _set(self, chat_id: Hashable, next_edit: float) -> None:
+        self._next_edit[chat_id] = next_edit
+        if len(self._next_edit) > self.max_chats:
+            # Чаты, чей интервал уже прошел, ничего не ограничивают
+            now = self._clock()
+            self._next_edit = {key: value for key, value in self._next_edit.items() if value > now}
+
+
+class StreamRenderer:
+    """Progressively edits a placeholder message while the answer streams in.
+
+    Edits are coalesced through an EditThrottle keyed by chat, so that all
+    answers streaming into one chat together stay under Telegram's per-chat
+    edit rate. Text that does not fit into one message continues in a new
+    reply.
+    """
+
+    def __init__(
+        self,
+        reply_to: Message,
+        min_interval: float = 1.0,
+        placeholder: str = "Печатаю...",
+        limit: int = MessageLimit.MAX_TEXT_LENGTH,
+        throttle: Optional[EditThrottle] = None,
+    ):
+        """
+        Initialize renderer.
+
+        Args:
+            reply_to: User message to reply to
+            min_interval: Minimum seconds between edits when no shared
+                throttle is given
+            placeholder: Text of the message shown before the first delta
+            limit: Maximum length of one Telegram message
+            throttle: Edit throttle shared by all renderers of the bot; a
+                private one with min_interval for every chat is used if omitted
+        """
+        self.reply_to = reply_to
+        self.placeholder = placeholder
+        self.limit = limit
+        self.throttle = throttle if throttle is not None else EditThrottle(min_interval, min_interval)
+        self.messages: List[Message] = []
+        self.edits = 0
+        self._text = ""
+        self._shown = ""
+        self._parts: List[str] = []
+
+    @property
+    def text(self) -> str:
+        """Full text rendered so far across all messages."""
+        return "".join(self._parts) + self._text
+
+    async def start(self) -> None:
+        """Send the placeholder message if it has not been sent yet."""
+        if not self.messages:
+            self.messages.append(await self.reply_to.reply_text(self.placeholder))
+            self._shown = self.placeholder
+
+    async def feed(self, delta: str) -> None:
+        """
+        Add a piece of text and edit the message if the rate limit allows.
+
+        Args:
+            delta: Next piece of the answer
+        """
+        await self.start()
+        self._text += delta
+        while len(self._text) > self.limit:
+            head_length = split_text(self._text, self.limit)
+            head, self._text = self._text[:head_length], self._text[head_length:]
+            await self._edit(head, force=True)
+            self._parts.append(head)
+            self.messages.append(await self.reply_to.reply_text(self._text))
+            self._shown = self._text
+        await self._edit(self._text)
+
+    async def finish(self, fallback: str = "") -> str:
+        """
+        Flush the remaining text regardless of the edit rate.
+
+        Args:
+            fallback: Text to show if the stream produced nothing
+
+        Returns:
+            str: Full rendered text
+        """
+        if not self.text and fallback:
+            await self.start()
+            self._text = fallback
+        await self._edit(self._text, force=True)
+        return self.text
+
+    async def fail(self, error_text: str) -> None:
+        """
+        Show an error instead of the answer.
+
+        If part of the answer is already visible, the error is sent as a
+        separate reply so that the partial answer is kept.
+
+        Args:
+            error_text: Error message for the user
+        """
+        if self.text:
+            await self._edit(self._text, force=True)
+            await self.reply_to.reply_text(error_text)
+        elif self.messages:
+            await self._edit(error_text, force=True)
+        else:
+            await self.reply_to.reply_text(error_text)
+
+    async def render(self, deltas: AsyncIterator[str], fallback: str = "") -> str:
+        """
+        Render the whole stream.
+
+        Args:
+            deltas: Async iterator of answer pieces
+            fallback: Text to show if the stream produced nothing
+
+        Returns:
+            str: Full rendered text
+        """
+        await self.start()
+        async for delta in deltas:
+            await self.feed(delta)
+        return await self.finish(fallback)
+
+    async def _edit(self, text: str, force: bool = False) -> None:
+        """Edit the last message, skipping unchanged text and throttled edits."""
+        if not text or text == self._shown or not self.messages:
+            return
+        chat = self.reply_to.chat
+        if not self.throttle.acquire(chat.id, chat.type, force):
+            return
+        try:
+            await self.messages[-1].edit_text(text)
+            self._shown = text
+            self.edits += 1
+        except RetryAfter as e:
+            # Telegram просит подождать: промежуточные обновления всего чата пропускаем
+            self.throttle.postpone(chat.id, e.retry_after)
+            if force:
+                await asyncio.sleep(e.retry_after)
+                await self._edit(text, force=True)
+        except BadRequest as e:
+            # Например, "Message is not modified" — не критично для ответа
+            logger.debug(f"Не удалось обновить сообщение: {e}")
+
+
+class DelayedStatusMessage:
+    """Status message that appears only when the work is slow.
+
+    The placeholder is sent in the background after `delay` seconds, so
+    it does not hold up the work that follows start(). The result is edited
+    into the placeholder if it was sent, or sent as an ordinary reply if
+    the work finished earlier. Either way no status message is left to
+    delete.
+    """
+
+    def __init__(
+        self,
+        reply_to: Message,
+        text: str,
+        delay: float = 1.0,
+        limit: int = MessageLimit.MAX_TEXT_LENGTH,
+    ):
+        """
+        Initialize status message.
+
+        Args:
+            reply_to: User message to reply to
+            text: Text of the status message
+            delay: Seconds of work after which the status message is shown
+            limit: Maximum length of one Telegram message
+        """
+        self.reply_to = reply_to
+        self.text = text
+        self.delay = delay
+        self.limit = limit
+        self.message: Optional[Message] = None
+        self._task: Optional[asyncio.Task] = None
+        self._sending = False
+
+    def start(self) -> None:
+        """Schedule the status message; returns immediately."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._show())
+
+    async def finish(self, text: str) -> Message:
+        """
+        Show the result instead of the status message.
+
+        Args:
+            text: Answer or error text for the user
+
+        Returns:
+            Message: Last message with the text
+        """
+        await self._settle()
+        head, rest = text, ""
+        if len(text) > self.limit:
+            head_length = split_text(text, self.limit)
+            head, rest = text[:head_length], text[head_length:]
+        message = None
+        if self.message is not None:
+            try:
+                message = await self.message.edit_text(head)
+            except BadRequest as e:
+                logger.debug(f"Не удалось обновить сообщение: {e}")
+        if message is None:
+            message = await self.reply_to.reply_text(head)
+        while rest:
+            head_length = split_text(rest, self.limit) if len(rest) > self.limit else len(rest)
+            message = await self.reply_to.reply_text(rest[:head_length])
+            rest = rest[head_length:]
+        return message
+
+    async def _show(self) -> None:
+        await asyncio.sleep(self.delay)
+        self._sending = True
+        self.message = await self.reply_to.reply_text(self.text)
+
+    async def _settle(self) -> None:
+        """Cancel the pending status message or wait until it is sent."""
+        if self._task is None:
+            return
+        if not self._sending:
+            self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            # Статус не критичен: ответ уйдет обычным сообщением
+            logger.debug(f"Не удалось отправить статус: {e}")
@@ -1,68 +1,340 @@
 """Module for interacting with OpenAI API."""
-import base64
 import os
-from typing import Optional, Union
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
 
-from openai import OpenAI
+from openai import AsyncOpenAI, AsyncStream
+from openai.types.chat import ChatCompletionChunk
 from dotenv import load_dotenv
 
+from app.hedging import Hedger
+from app.resilience import ResilientCaller, guarded_call
+from app.response_cache import ResponseCache, make_cache_key
+from app.router import FAST, ModelRouter
+from app.singleflight import FlightCancelled, SingleFlight
+
 load_dotenv()
 
+# Параметры модели для текстовых ответов (модель используется без маршрутизатора)
+CHAT_MODEL = "gpt-3.5-turbo"
+IMAGE_MODEL = "dall-e-3"
+CHAT_TEMPERATURE = 0.7
+CHAT_MAX_TOKENS = 1000
+
+T = TypeVar('T')
+
 class OpenAIHelper:
     """Helper class for interacting with OpenAI API."""
-    
-    def __init__(self):
-        """Initialize OpenAI client."""
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
-            raise ValueError('OPENAI_API_KEY not found in environment variables')
-        self.client = OpenAI(api_key=api_key)
-
-    async def get_chat_response(self, message: str, system_prompt: Optional[str] = None) -> str:
+
+    def __init__(
+        self,
+        client: Optional[AsyncOpenAI] = None,
+        cache: Optional[ResponseCache] = None,
+        singleflight: Optional[SingleFlight] = None,
+        resilience: Optional[ResilientCaller] = None,
+        hedger: Optional[Hedger] = None,
+        router: Optional[ModelRouter] = None,
+    ):
+        """
+        Initialize OpenAI client.
+
+        Args:
+            client: Optional pre-configured async client; created from
+                OPENAI_API_KEY when omitted
+            cache: Optional cache for chat responses
+            singleflight: Optional coalescing of identical concurrent requests
+            resilience: Optional retries and circuit breaking of API calls
+            hedger: Optional hedging of slow chat requests: the whole call of
+                get_chat_response, the stream opening of stream_chat_response
+            router: Optional per-request model choice; CHAT_MODEL and
+                IMAGE_MODEL are used when omitted
+        """
+        if client is None:
+            api_key = os.getenv('OPENAI_API_KEY')
+            if not api_key:
+                raise ValueError('OPENAI_API_KEY not found in environment variables')
+            client = AsyncOpenAI(api_key=api_key)
+        self.client = client
+        self.cache = cache
+        self.singleflight = singleflight
+        self.resilience = resilience
+        self.hedger = hedger
+        self.router = router
+
+    async def get_chat_response(
+        self,
+        message: str,
+        system_prompt: Optional[str] = None,
+        use_cache: Optional[bool] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        model: Optional[str] = None,
+    ) -> str:
         """
         Get response from OpenAI chat model.
-        
+
         Args:
             message: User message
             system_prompt: Optional system prompt to set context
-            
+            use_cache: Whether the response may be shared with identical
+                requests: served from the cache, stored in it and coalesced
+                with concurrent calls; by default only deterministic
+                (temperature 0) requests are shared
+            history: Previous messages of the conversation, oldest first
+            model: Model to use, chosen by the router when omitted
+
+        Returns:
+            str: Model's response
+
+        Raises:
+            openai.OpenAIError: If the request fails
+            CircuitOpenError: If the model is marked as unavailable
+        """
+        model = model or self.chat_model(message, history)
+        key = self._request_key(message, system_prompt, use_cache, history, model)
+        if key is not None and self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        messages = self._build_messages(message, system_prompt, history)
+
+        if key is not None and self.singleflight is not None:
+            return await self.singleflight.do(key, lambda: self._fetch(messages, key, model))
+        return await self._fetch(messages, key, model)
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = CHAT_TEMPERATURE,
+        max_tokens: int = CHAT_MAX_TOKENS,
+        model: Optional[str] = None,
+    ) -> str:
+        """
+        Request completion for prepared messages without caching.
+
+        Args:
+            messages: Full list of chat messages
+            temperature: Sampling temperature
+            max_tokens: Maximum number of tokens in the answer
+            model: Model to use; by default the fast chat model, since
+                callers of complete are background tasks
+
         Returns:
             str: Model's response
+
+        Raises:
+            openai.OpenAIError: If the request fails
+            CircuitOpenError: If the model is marked as unavailable
         """
+        if model is None:
+            model = self.router.pick(FAST) if self.router is not None else CHAT_MODEL
+        response = await self._call(model, lambda: self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        ))
+        return response.choices[0].message.content
+
+    def chat_model(self, message: str, history: Optional[List[Dict[str, str]]] = None) -> str:
+        """
+        Choose model for a chat request.
+
+        Args:
+            message: User message
+            history: Previous messages of the conversation
+
+        Returns:
+            str: Model chosen by the router or CHAT_MODEL
+        """
+        if self.router is None:
+            return CHAT_MODEL
+        return self.router.route_chat(message, history)
+
+    async def _call(self, model: str, factory: Callable[[], Awaitable[T]]) -> T:
+        """Run API call through retries and circuit breaker if configured."""
+        return await guarded_call(model, factory, self.resilience, self.router)
+
+    async def _fetch(self, messages: List[Dict[str, str]], key: Optional[str], model: str) -> str:
+        """Request completion and store it in the cache."""
+        if self.hedger is not None:
+            content = await self.hedger.run(lambda: self.complete(messages, model=model))
+        else:
+            content = await self.complete(messages, model=model)
+        if key is not None and self.cache is not None and content:
+            self.cache.set(key, content)
+        return content
+
+    async def stream_chat_response(
+        self,
+        message: str,
+        system_prompt: Optional[str] = None,
+        use_cache: Optional[bool] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        model: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream response from OpenAI chat model as text deltas.
+
+        A cached response, or the result of an identical request that is
+        already streaming for another user, is yielded as a single piece.
+
+        Args:
+            message: User message
+            system_prompt: Optional system prompt to set context
+            use_cache: Same as in get_chat_response
+            history: Previous messages of the conversation, oldest first
+            model: Model to use, chosen by the router when omitted
+
+        Yields:
+            str: Next non-empty piece of the model's response
+
+        Raises:
+            openai.OpenAIError: If the request fails, possibly after part of
+                the answer has already been yielded
+            CircuitOpenError: If the model is marked as unavailable
+        """
+        model = model or self.chat_model(message, history)
+        key = self._request_key(message, system_prompt, use_cache, history, model)
+        if key is not None and self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        flight = None
+        if key is not None and self.singleflight is not None:
+            if self.singleflight.pending(key):
+                try:
+                    content = await self.singleflight.join(key)
+                    if content:
+                        yield content
+                    return
+                except FlightCancelled:
+                    # Пользователь, начавший запрос, ушел — выполняем свой
+                    pass
+            flight = self.singleflight.lead(key)
+
+        messages = self._build_messages(message, system_prompt, history)
+        parts = []
+        try:
+            # Повторяется и дублируется только открытие потока до первого куска:
+            # запрос без побочных эффектов, а начатый ответ уже показан пользователю
+            if self.hedger is not None:
+                stream, first = await self.hedger.run(
+                    lambda: self._open_stream(model, messages),
+                    discard=lambda opened: opened[0].close(),
+                )
+            else:
+                stream, first = await self._open_stream(model, messages)
+            async with stream:
+                if first is not None:
+                    delta = _delta(first)
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+                async for chunk in stream:
+                    delta = _delta(chunk)
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+        except BaseException as e:
+            if flight is not None:
+                if isinstance(e, Exception):
+                    flight.set_exception(e)
+                else:
+                    flight.cancel()
+            raise
+
+        content = "".join(parts)
+        if flight is not None:
+            flight.set_result(content)
+        # В кэш попадает только полностью полученный ответ
+        if key is not None and self.cache is not None and content:
+            self.cache.set(key, content)
+
+    async def _open_stream(
+        self, model: str, messages: List[Dict[str, str]]
+    ) -> Tuple[AsyncStream[ChatCompletionChunk], Optional[ChatCompletionChunk]]:
+        """Open a completion stream and wait for its first chunk."""
+        stream = await self._call(model, lambda: self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=CHAT_TEMPERATURE,
+            max_tokens=CHAT_MAX_TOKENS,
+            stream=True,
+        ))
+        try:
+            return stream, await stream.__anext__()
+        except StopAsyncIteration:
+            return stream, None
+        except BaseException:
+            # Проигравшая попытка отменена: соединение закрывается сразу
+            await stream.close()
+            raise
+
+    def _request_key(
+        self,
+        message: str,
+        system_prompt: Optional[str],
+        use_cache: Optional[bool],
+        history: Optional[List[Dict[str, str]]],
+        model: str = CHAT_MODEL,
+    ) -> Optional[str]:
+        """Return key identifying the request or None if it must not be shared."""
+        if self.cache is None and self.singleflight is None:
+            return None
+        if use_cache is None:
+            use_cache = CHAT_TEMPERATURE == 0
+        if not use_cache:
+            return None
+        return make_cache_key(
+            system_prompt, history or [], message, model, CHAT_TEMPERATURE, CHAT_MAX_TOKENS
+        )
+
+    @staticmethod
+    def _build_messages(
+        message: str,
+        system_prompt: Optional[str],
+        history: Optional[List[Dict[str, str]]] = None,
+    ) -> List[Dict[str, str]]:
+        """Build chat messages list from system prompt, history and user message."""
         messages = []
         if system_prompt:
             messages.append({"role": "system", "content": system_prompt})
+        if history:
+            messages.extend(history)
         messages.append({"role": "user", "content": message})
-        
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=messages,
-                temperature=0.7,
-                max_tokens=1000
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            return f"Ошибка при получении ответа от OpenAI: {str(e)}"
-            
-    async def generate_image(self, prompt: str) -> str:
+        return messages
+
+    async def generate_image(self, prompt: str, model: Optional[str] = None) -> str:
         """
         Generate image using DALL-E 3.
-        
+
         Args:
             prompt: Description of the image to generate
-            
+            model: Model to use, chosen by the router when omitted
+
         Returns:
             str: URL of the generated image
+
+        Raises:
+            openai.OpenAIError: If the request fails
+            CircuitOpenError: If the model is marked as unavailable
         """
-        try:
-            response = self.client.images.generate(
-                model="dall-e-3",
-                prompt=prompt,
-                size="1024x1024",
-                quality="standard",
-                n=1,
-            )
-            return response.data[0].url
-        except Exception as e:
-            return f"Ошибка при генерации изображения: {str(e)}"
+        if model is None:
+            model = self.router.route_image() if self.router is not None else IMAGE_MODEL
+        response = await self._call(model, lambda: self.client.images.generate(
+            model=model,
+            prompt=prompt,
+            size="1024x1024",
+            quality="standard",
+            n=1,
+        ))
+        return response.data[0].url
+
+
+def _delta(chunk: ChatCompletionChunk) -> Optional[str]:
+    """Return text of a stream chunk, None for service chunks."""
+    if not chunk.choices:
+        return None
+    return chunk.choices[0].delta.content
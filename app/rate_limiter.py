@@ -0,0 +1,408 @@
+"""Module with client-side pacing based on OpenAI rate limit headers."""
+import asyncio
+import json
+import logging
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Лимиты OpenAI задаются в запросах и токенах в минуту
+LIMIT_WINDOW_SECONDS = 60.0
+
+# Оценка токенов для изображения, если detail неизвестен (high, 512x512 → 1 тайл)
+IMAGE_TOKENS_ESTIMATE = 255
+
+# Тела больше этого размера (изображения в base64) не разбираются как JSON целиком
+MAX_PARSED_BODY = 256 * 1024
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_MODEL_FIELD = re.compile(rb'"model"\s*:\s*"([^"]+)"')
+_MAX_TOKENS_FIELD = re.compile(rb'"max_(?:completion_)?tokens"\s*:\s*(\d+)')
+_IMAGE_FIELD = re.compile(rb'"type"\s*:\s*"image_url"')
+
+
+def parse_reset(value: Optional[str]) -> float:
+    """
+    Parse reset duration from x-ratelimit-reset-* headers.
+
+    OpenAI uses Go-style durations such as "1s", "6m0s", "20ms" or
+    "1h2m3.5s"; plain numbers are treated as seconds.
+
+    Args:
+        value: Header value
+
+    Returns:
+        float: Duration in seconds, 0 if the value is missing or invalid
+    """
+    if not value:
+        return 0.0
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    seconds = 0.0
+    for number, unit in _DURATION_PART.findall(value):
+        seconds += float(number) * {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}[unit]
+    return seconds
+
+
+def estimate_request(content: bytes) -> Tuple[Optional[str], int]:
+    """
+    Extract model and estimate token cost of an OpenAI request body.
+
+    Args:
+        content: JSON request body
+
+    Returns:
+        Tuple[Optional[str], int]: Model name (None if absent) and estimated
+            tokens counted against TPM: prompt tokens plus max_tokens
+    """
+    if len(content) <= MAX_PARSED_BODY:
+        try:
+            body = json.loads(content)
+        except ValueError:
+            return None, 0
+        if not isinstance(body, dict):
+            return None, 0
+        prompt_chars = 0
+        images = 0
+        for message in body.get("messages") or []:
+            message_content = message.get("content")
+            if isinstance(message_content, str):
+                prompt_chars += len(message_content)
+            elif isinstance(message_content, list):
+                for part in message_content:
+                    if part.get("type") == "image_url":
+                        images += 1
+                    else:
+                        prompt_chars += len(part.get("text") or "")
+        prompt_chars += len(body.get("prompt") or "")
+        max_tokens = body.get("max_tokens") or body.get("max_completion_tokens") or 0
+        tokens = prompt_chars // 4 + images * IMAGE_TOKENS_ESTIMATE + int(max_tokens)
+        return body.get("model"), tokens
+
+    # Большое тело — это почти всегда изображение в base64: не разбираем его целиком
+    model_match = _MODEL_FIELD.search(content)
+    max_tokens_match = _MAX_TOKENS_FIELD.search(content)
+    images = len(_IMAGE_FIELD.findall(content))
+    tokens = images * IMAGE_TOKENS_ESTIMATE + (int(max_tokens_match.group(1)) if max_tokens_match else 0)
+    return (model_match.group(1).decode() if model_match else None), tokens
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at limit / window per second.
+
+    Reservations may drive the balance below zero; the caller then waits
+    until the debt is refilled, so concurrent callers are spread out in
+    time instead of all being sent at once.
+    """
+
+    def __init__(self, limit: float, remaining: float, clock: Callable[[], float]):
+        """
+        Initialize bucket from the first observed headers.
+
+        Args:
+            limit: Limit per window
+            remaining: Currently remaining amount
+            clock: Monotonic time source
+        """
+        self._clock = clock
+        self.limit = limit
+        self.tokens = remaining
+        self.updated_at = clock()
+
+    @property
+    def rate(self) -> float:
+        """Refill rate per second."""
+        return self.limit / LIMIT_WINDOW_SECONDS
+
+    def reserve(self, amount: float) -> float:
+        """
+        Take amount from the bucket.
+
+        Args:
+            amount: Requests or tokens the call will consume
+
+        Returns:
+            float: Seconds to wait before sending the call
+        """
+        self._refill()
+        self.tokens -= amount
+        if self.tokens >= 0 or self.rate <= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def sync(self, limit: float, remaining: float) -> None:
+        """
+        Align the bucket with the server's view.
+
+        Args:
+            limit: Limit per window from x-ratelimit-limit-*
+            remaining: Remaining amount from x-ratelimit-remaining-*,
+                minus what is already reserved by calls still in flight
+        """
+        self._refill()
+        self.limit = limit
+        self.tokens = min(remaining, limit)
+
+    def drain(self, seconds: float) -> None:
+        """
+        Empty the bucket so that it refills only after the given time.
+
+        Args:
+            seconds: Time until the server accepts calls again
+        """
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.tokens = min(self.limit, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+
+class _ModelLimits:
+    """Request and token buckets of one model with amounts still in flight."""
+
+    __slots__ = ("requests", "tokens", "pending_requests", "pending_tokens")
+
+    def __init__(self):
+        self.requests: Optional[TokenBucket] = None
+        self.tokens: Optional[TokenBucket] = None
+        self.pending_requests = 0
+        self.pending_tokens = 0
+
+
+class RateLimitedTransport(httpx.AsyncBaseTransport):
+    """httpx transport that paces requests through a RateLimiter."""
+
+    def __init__(self, limiter: "RateLimiter", transport: httpx.AsyncBaseTransport):
+        """
+        Wrap a transport.
+
+        Args:
+            limiter: Limiter reserving and releasing capacity of every call
+            transport: Transport that actually sends the requests
+        """
+        self.limiter = limiter
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        """Send the request once the limiter allows it."""
+        return await self.limiter.send(request, self.transport.handle_async_request)
+
+    async def aclose(self) -> None:
+        """Close the wrapped transport."""
+        await self.transport.aclose()
+
+
+class RateLimiter:
+    """Paces outgoing OpenAI calls to stay just under RPM/TPM limits.
+
+    Wraps the transport of the shared HTTP client, so it covers every path
+    that uses the client (chat, vision, image generation). The buckets of
+    each model are created from the first response headers; until then
+    calls are not delayed. A call reserves its capacity before sending and
+    gives it back when the response headers arrive or the call fails or is
+    cancelled, so lost calls do not shrink the limits for good.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic, sleep=asyncio.sleep):
+        """
+        Initialize limiter.
+
+        Args:
+            clock: Monotonic time source, replaced in tests
+            sleep: Async sleep function, replaced in tests
+        """
+        self._clock = clock
+        self._sleep = sleep
+        self._models: Dict[str, _ModelLimits] = {}
+        self.paced = 0
+        self.paced_seconds = 0.0
+        self.rate_limited = 0
+
+    def wrap(self, transport: httpx.AsyncBaseTransport) -> RateLimitedTransport:
+        """
+        Wrap a transport for httpx.AsyncClient(transport=...).
+
+        Args:
+            transport: Transport that actually sends the requests
+
+        Returns:
+            RateLimitedTransport: Transport pacing requests through this limiter
+        """
+        return RateLimitedTransport(self, transport)
+
+    async def acquire(self, model: str, tokens: int) -> float:
+        """
+        Reserve one request and the estimated tokens, waiting if needed.
+
+        Args:
+            model: Model name
+            tokens: Estimated tokens of the call
+
+        Returns:
+            float: Seconds the call was delayed
+        """
+        limits = self._models.setdefault(model, _ModelLimits())
+        limits.pending_requests += 1
+        limits.pending_tokens += tokens
+        delay = 0.0
+        if limits.requests is not None:
+            delay = max(delay, limits.requests.reserve(1))
+        if limits.tokens is not None:
+            delay = max(delay, limits.tokens.reserve(tokens))
+        if delay > 0:
+            self.paced += 1
+            self.paced_seconds += delay
+            try:
+                await self._sleep(delay)
+            except BaseException:
+                # Вызов отменен, пока ждал своей очереди
+                self.release(model, tokens)
+                raise
+        return delay
+
+    def release(self, model: str, tokens: int) -> None:
+        """
+        Return capacity reserved by a call that got no response.
+
+        Args:
+            model: Model name
+            tokens: Tokens reserved for the call in acquire()
+        """
+        limits = self._models.setdefault(model, _ModelLimits())
+        limits.pending_requests = max(0, limits.pending_requests - 1)
+        limits.pending_tokens = max(0, limits.pending_tokens - tokens)
+
+    def update(self, model: str, tokens: int, headers: httpx.Headers, status_code: int = 200) -> None:
+        """
+        Update buckets of the model from response headers.
+
+        Args:
+            model: Model name
+            tokens: Tokens reserved for the call in acquire()
+            headers: Response headers
+            status_code: Response status code
+        """
+        self.release(model, tokens)
+        limits = self._models[model]
+        limits.requests = self._sync(
+            limits.requests, headers, "requests", limits.pending_requests
+        )
+        limits.tokens = self._sync(
+            limits.tokens, headers, "tokens", limits.pending_tokens
+        )
+
+        if status_code == 429:
+            self.rate_limited += 1
+            retry_after = self._retry_after(headers)
+            for bucket in (limits.requests, limits.tokens):
+                if bucket is not None:
+                    bucket.drain(retry_after)
+
+    async def send(
+        self,
+        request: httpx.Request,
+        send: Callable[[httpx.Request], Awaitable[httpx.Response]],
+    ) -> httpx.Response:
+        """
+        Delay the call if the model is near its limits, send it and learn
+        the current limits from the response headers.
+
+        Args:
+            request: Outgoing request
+            send: Function actually sending the request
+
+        Returns:
+            httpx.Response: Response of the call
+        """
+        reserved = self._reservation(request)
+        if reserved is None:
+            return await send(request)
+        model, tokens = reserved
+        await self.acquire(model, tokens)
+        try:
+            response = await send(request)
+        except BaseException:
+            # Ошибка соединения, таймаут или отмена: ответа не будет, резерв возвращается
+            self.release(model, tokens)
+            raise
+        self.update(model, tokens, response.headers, response.status_code)
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return pacing counters.
+
+        Returns:
+            Dict[str, Any]: Number of delayed calls, total delay, 429 responses
+                and per model calls in flight and capacity left
+        """
+        stats: Dict[str, Any] = {
+            "paced": self.paced,
+            "paced_seconds": self.paced_seconds,
+            "rate_limited": self.rate_limited,
+        }
+        for model, limits in self._models.items():
+            stats[f"{model}_pending_requests"] = limits.pending_requests
+            stats[f"{model}_pending_tokens"] = limits.pending_tokens
+            if limits.requests is not None:
+                stats[f"{model}_requests_left"] = round(limits.requests.tokens)
+            if limits.tokens is not None:
+                stats[f"{model}_tokens_left"] = round(limits.tokens.tokens)
+        return stats
+
+    def _sync(
+        self, bucket: Optional[TokenBucket], headers: httpx.Headers, kind: str, pending: int
+    ) -> Optional[TokenBucket]:
+        limit = headers.get(f"x-ratelimit-limit-{kind}")
+        remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+        if limit is None or remaining is None:
+            return bucket
+        try:
+            limit_value = float(limit)
+            # Вызовы, еще не дошедшие до сервера, уже зарезервированы локально
+            remaining_value = float(remaining) - pending
+        except ValueError:
+            logger.debug(f"Некорректные заголовки лимитов: {limit}, {remaining}")
+            return bucket
+        if bucket is None:
+            return TokenBucket(limit_value, remaining_value, self._clock)
+        bucket.sync(limit_value, remaining_value)
+        return bucket
+
+    @staticmethod
+    def _reservation(request: httpx.Request) -> Optional[Tuple[str, int]]:
+        if request.method != "POST":
+            return None
+        # Потоковое тело прочитать нельзя: отправитель передает оценку сам
+        reserved = request.extensions.get("rate_limit")
+        if reserved is not None:
+            return reserved
+        model, tokens = estimate_request(request.content)
+        if model is None:
+            return None
+        request.extensions["rate_limit"] = (model, tokens)
+        return model, tokens
+
+    @staticmethod
+    def _retry_after(headers: httpx.Headers) -> float:
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms:
+            try:
+                return float(retry_after_ms) / 1000
+            except ValueError:
+                pass
+        retry_after = parse_reset(headers.get("retry-after"))
+        if retry_after:
+            return retry_after
+        return max(
+            parse_reset(headers.get("x-ratelimit-reset-requests")),
+            parse_reset(headers.get("x-ratelimit-reset-tokens")),
+        )
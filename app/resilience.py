@@ -0,0 +1,335 @@
+"""Module with retries and circuit breaking for OpenAI calls."""
+import asyncio
+import logging
+import random
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import openai
+
+from app.rate_limiter import parse_reset
+
+if TYPE_CHECKING:
+    from app.router import ModelRouter
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Состояния автомата размыкателя
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the upstream while its circuit is open."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Check whether a failed OpenAI call may succeed if repeated.
+
+    Args:
+        error: Exception raised by the call
+
+    Returns:
+        bool: True for rate limits, timeouts, connection errors and 5xx
+    """
+    if isinstance(error, openai.RateLimitError):
+        # Исчерпанная квота не восстановится за время запроса
+        return getattr(error, "code", None) != "insufficient_quota"
+    if isinstance(error, (openai.APIConnectionError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500
+    return False
+
+
+def retry_after(error: BaseException) -> float:
+    """
+    Return delay requested by the server in retry-after headers.
+
+    Args:
+        error: Exception raised by the call
+
+    Returns:
+        float: Delay in seconds, 0 if the server did not ask for one
+    """
+    response = getattr(error, "response", None)
+    if response is None:
+        return 0.0
+    headers = response.headers
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    return parse_reset(headers.get("retry-after"))
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker of one model.
+
+    After failure_threshold upstream failures in a row the circuit opens
+    and calls fail immediately for reset_timeout seconds. Then a single
+    probe call is let through: its success closes the circuit, its failure
+    opens it again.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize breaker.
+
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds the circuit stays open before a probe
+            clock: Monotonic time source
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """
+        Check whether a call may be sent now.
+
+        Returns:
+            bool: False while the circuit is open or a probe is in flight
+        """
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if self._clock() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = HALF_OPEN
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self) -> None:
+        """Close the circuit after a successful call."""
+        self.state = CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self) -> bool:
+        """
+        Count an upstream failure.
+
+        Returns:
+            bool: True if the circuit has just gone from closed to open; a
+                failed probe reopens it without counting a new opening
+        """
+        self._probing = False
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            was_closed = self.state == CLOSED
+            self.state = OPEN
+            self.opened_at = self._clock()
+            return was_closed
+        return False
+
+    def release(self) -> None:
+        """Let another probe through if the current one ended without a verdict."""
+        self._probing = False
+
+
+class ResilientCaller:
+    """Runs OpenAI calls with classified retries, backoff and circuit breaking.
+
+    Transient failures (429, 5xx, timeouts, connection errors) are retried
+    with exponential backoff and full jitter, honouring retry-after. Every
+    call has a total time budget covering all attempts and pauses; a retry
+    that cannot finish within the budget is not started. Each model has its
+    own circuit breaker, so during an outage users get a fast failure
+    instead of waiting out repeated timeouts.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        budget: float = 60.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+    ):
+        """
+        Initialize caller.
+
+        Args:
+            max_retries: Maximum number of repeated attempts
+            base_delay: Backoff ceiling of the first retry in seconds
+            max_delay: Maximum backoff ceiling in seconds
+            budget: Total time in seconds for all attempts of one call
+            failure_threshold: Consecutive failures that open a model's circuit
+            reset_timeout: Seconds a circuit stays open before a probe
+            clock: Monotonic time source, replaced in tests
+            sleep: Async sleep function, replaced in tests
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._sleep = sleep
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.calls = 0
+        self.retries = 0
+        self.failed = 0
+        self.rejected = 0
+        self.circuit_opens = 0
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        """
+        Return circuit breaker of the model, creating it on first use.
+
+        Args:
+            model: Model name
+
+        Returns:
+            CircuitBreaker: Breaker of the model
+        """
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            breaker = self._breakers[model] = CircuitBreaker(
+                self.failure_threshold, self.reset_timeout, self._clock
+            )
+        return breaker
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Return jittered delay before the given retry.
+
+        Args:
+            attempt: Number of the retry, starting from 0
+
+        Returns:
+            float: Delay in seconds drawn uniformly from [0, ceiling]
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def call(
+        self,
+        model: str,
+        factory: Callable[[], Awaitable[T]],
+        budget: Optional[float] = None,
+    ) -> T:
+        """
+        Run the call, retrying transient failures within the time budget.
+
+        Args:
+            model: Model name the call goes to
+            factory: Function starting a new attempt of the call
+            budget: Total time budget in seconds, self.budget if omitted
+
+        Returns:
+            T: Result of the first successful attempt
+
+        Raises:
+            CircuitOpenError: If the model's circuit is open
+            asyncio.TimeoutError: If the budget ran out during an attempt
+            openai.OpenAIError: If the call failed with a non-retryable error
+                or all attempts failed
+        """
+        self.calls += 1
+        breaker = self.breaker(model)
+        deadline = self._clock() + (self.budget if budget is None else budget)
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                self.rejected += 1
+                raise CircuitOpenError(f"Сервис {model} временно недоступен")
+            remaining = deadline - self._clock()
+            try:
+                result = await asyncio.wait_for(factory(), timeout=max(remaining, 0.001))
+            except BaseException as e:
+                if not isinstance(e, Exception) or not is_retryable(e):
+                    # Ошибки запроса (4xx) и отмена не говорят о здоровье сервиса
+                    breaker.release()
+                    if isinstance(e, Exception):
+                        self.failed += 1
+                    raise
+                if breaker.record_failure():
+                    self.circuit_opens += 1
+                    logger.warning(f"Размыкатель модели {model} открыт после ошибки: {e}")
+                delay = max(self.backoff(attempt), retry_after(e))
+                if attempt >= self.max_retries or self._clock() + delay >= deadline:
+                    self.failed += 1
+                    raise
+                logger.info(f"Повтор запроса к {model} через {delay:.2f} с: {e}")
+                attempt += 1
+                self.retries += 1
+                await self._sleep(delay)
+                continue
+            breaker.record_success()
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return retry and circuit breaker counters.
+
+        Returns:
+            Dict[str, Any]: Calls, retries, failures, fast rejections, circuit
+                opens and the state of every model's circuit
+        """
+        stats: Dict[str, Any] = {
+            "calls": self.calls,
+            "retries": self.retries,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "circuit_opens": self.circuit_opens,
+        }
+        for model, breaker in self._breakers.items():
+            stats[f"{model}_circuit"] = breaker.state
+        return stats
+
+
+async def guarded_call(
+    model: str,
+    factory: Callable[[], Awaitable[T]],
+    resilience: Optional[ResilientCaller] = None,
+    router: Optional['ModelRouter'] = None,
+) -> T:
+    """
+    Run an API call through retries and report its outcome to the router.
+
+    Args:
+        model: Model name the call goes to
+        factory: Function starting a new attempt of the call
+        resilience: Optional retries and circuit breaking
+        router: Optional router collecting latency and error statistics
+
+    Returns:
+        T: Result of the call
+    """
+    started = time.monotonic()
+    try:
+        if resilience is None:
+            result = await factory()
+        else:
+            result = await resilience.call(model, factory)
+    except Exception as e:
+        # Ошибки запроса (4xx) не говорят о состоянии модели
+        if router is not None and (is_retryable(e) or isinstance(e, CircuitOpenError)):
+            router.observe(model, time.monotonic() - started, ok=False)
+        raise
+    if router is not None:
+        router.observe(model, time.monotonic() - started, ok=True)
+    return result
@@ -0,0 +1,150 @@
+"""Module with in-memory cache for model responses."""
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """
+    Normalize text for use in a cache key.
+
+    Case and repeated whitespace do not change the meaning of a question,
+    so "Что такое  Python?" and "что такое python?" share one entry.
+
+    Args:
+        text: Source text
+
+    Returns:
+        str: Normalized text
+    """
+    if not text:
+        return ""
+    return " ".join(text.split()).casefold()
+
+
+def make_cache_key(*parts: Any) -> str:
+    """
+    Build a compact cache key from request parameters.
+
+    Strings are normalized, other values are used as is.
+
+    Args:
+        *parts: Request parameters (prompts, model, temperature, ...)
+
+    Returns:
+        str: SHA-256 hex digest of the normalized parameters
+    """
+    normalized = [normalize_text(part) if isinstance(part, str) else part for part in parts]
+    payload = json.dumps(normalized, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Bounded LRU cache with TTL for text responses.
+
+    Entries are evicted in least-recently-used order when either the number
+    of entries or their total size in bytes exceeds the configured limits.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int = 8 * 1024 * 1024,
+        ttl: float = 3600.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize cache.
+
+        Args:
+            max_entries: Maximum number of stored responses
+            max_bytes: Maximum total size of stored responses in bytes
+            ttl: Lifetime of an entry in seconds
+            clock: Monotonic time source, replaced in tests
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._clock = clock
+        # key -> (expires_at, value, size)
+        self._entries: "OrderedDict[str, Tuple[float, str, int]]" = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Return cached value and mark it as recently used.
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Optional[str]: Cached value or None if missing or expired
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value, _ = entry
+        if expires_at <= self._clock():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        """
+        Store value, evicting least recently used entries if needed.
+
+        Values larger than the whole cache are not stored.
+
+        Args:
+            key: Cache key
+            value: Response text
+        """
+        size = len(key) + len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (self._clock() + self.ttl, value, size)
+        self.size_bytes += size
+        while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """Remove all entries; counters are kept."""
+        self._entries.clear()
+        self.size_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return cache counters.
+
+        Returns:
+            Dict[str, Any]: Entries, size, hits, misses, evictions and hit rate
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _remove(self, key: str) -> None:
+        _, _, size = self._entries.pop(key)
+        self.size_bytes -= size
@@ -0,0 +1,242 @@
+"""Module for choosing the OpenAI model of every request."""
+import re
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+# Уровни моделей
+FAST = "fast"
+STRONG = "strong"
+VISION = "vision"
+IMAGE = "image"
+
+# Политики маршрутизации чата
+POLICY_AUTO = "auto"
+POLICY_FAST = "fast"
+POLICY_STRONG = "strong"
+
+# Слова, по которым запрос считается требующим рассуждений
+_REASONING_WORDS = re.compile(
+    r"\b(объясни|почему|сравни|докажи|проанализируй|пошагово|рассуди|оптимизируй|"
+    r"спроектируй|реши|выведи|напиши (?:код|функцию|программу|скрипт)|"
+    r"explain|why|compare|prove|analy[sz]e|step by step|design|optimi[sz]e|solve|derive)\b",
+    re.IGNORECASE,
+)
+_CODE_MARKERS = re.compile(r"```|\bdef |\bclass |\bimport |=>|;\s*$|\{\s*$|</?\w+>", re.MULTILINE)
+_MATH = re.compile(r"\d\s*[-+*/^=<>]\s*\d|[∫∑√π]|\b(?:sin|cos|log|lim)\b")
+
+
+def estimate_complexity(text: str, history: Optional[List[Dict[str, str]]] = None) -> float:
+    """
+    Estimate how much reasoning a chat request needs.
+
+    A cheap local heuristic: long texts, code, formulas, several questions
+    and words asking for explanation or analysis raise the score, short
+    factual questions stay near zero.
+
+    Args:
+        text: User message
+        history: Previous messages of the conversation
+
+    Returns:
+        float: Score from 0 (trivial) to 1 (complex)
+    """
+    score = min(len(text) / 800, 1.0) * 0.4
+    if history:
+        history_chars = sum(len(message.get("content") or "") for message in history)
+        score += min(history_chars / 6000, 1.0) * 0.1
+    score += min(len(_REASONING_WORDS.findall(text)), 2) * 0.25
+    if _CODE_MARKERS.search(text):
+        score += 0.4
+    if _MATH.search(text):
+        score += 0.2
+    if text.count("?") > 1:
+        score += 0.1
+    return min(score, 1.0)
+
+
+class _ModelHealth:
+    """Exponentially weighted latency and error rate of one model."""
+
+    __slots__ = ("latency", "error_rate", "calls", "updated_at")
+
+    def __init__(self, now: float):
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.calls = 0
+        self.updated_at = now
+
+
+class ModelRouter:
+    """Picks a model per request from deployment tiers and live statistics.
+
+    Chat requests are scored by estimate_complexity: simple ones go to the
+    fast tier, the rest to the strong tier (a deployment may pin either
+    tier with the policy). Within a tier the model with the lowest observed
+    latency is used, skipping models whose recent error rate is too high;
+    if the whole tier is failing the other chat tier serves as a fallback.
+    The error rate of an avoided model decays over time, so it gets
+    traffic again once the outage is likely over.
+    """
+
+    def __init__(
+        self,
+        fast_models: Sequence[str] = ("gpt-3.5-turbo",),
+        strong_models: Sequence[str] = ("gpt-4o",),
+        vision_models: Sequence[str] = ("gpt-4o",),
+        image_models: Sequence[str] = ("dall-e-3",),
+        policy: str = POLICY_AUTO,
+        complexity_threshold: float = 0.5,
+        max_error_rate: float = 0.5,
+        alpha: float = 0.2,
+        error_half_life: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize router.
+
+        Args:
+            fast_models: Low-latency chat models
+            strong_models: Chat models for requests that need reasoning
+            vision_models: Models able to analyze images
+            image_models: Image generation models
+            policy: "auto", or "fast"/"strong" to send all chat requests to one tier
+            complexity_threshold: Score from which chat requests go to the strong tier
+            max_error_rate: Error rate above which a model is avoided
+            alpha: Weight of the newest observation in moving averages
+            error_half_life: Seconds in which the error rate of an idle model halves
+            clock: Monotonic time source, replaced in tests
+        """
+        if policy not in (POLICY_AUTO, POLICY_FAST, POLICY_STRONG):
+            raise ValueError(f"Unknown routing policy: {policy}")
+        self.tiers: Dict[str, List[str]] = {
+            FAST: list(fast_models),
+            STRONG: list(strong_models),
+            VISION: list(vision_models),
+            IMAGE: list(image_models),
+        }
+        for tier, models in self.tiers.items():
+            if not models:
+                raise ValueError(f"No models configured for tier {tier}")
+        self.policy = policy
+        self.complexity_threshold = complexity_threshold
+        self.max_error_rate = max_error_rate
+        self.alpha = alpha
+        self.error_half_life = error_half_life
+        self._clock = clock
+        self._health: Dict[str, _ModelHealth] = {}
+        self.routed: Dict[str, int] = {tier: 0 for tier in self.tiers}
+
+    def route_chat(self, text: str, history: Optional[List[Dict[str, str]]] = None) -> str:
+        """
+        Choose model for a chat request.
+
+        Args:
+            text: User message
+            history: Previous messages of the conversation
+
+        Returns:
+            str: Model name
+        """
+        if self.policy == POLICY_AUTO:
+            complex_request = estimate_complexity(text, history) >= self.complexity_threshold
+            tier = STRONG if complex_request else FAST
+        else:
+            tier = self.policy
+        fallback = FAST if tier == STRONG else STRONG
+        model = self._pick(self.tiers[tier])
+        if model is None:
+            # Весь уровень сбоит — переходим на другой уровень чата
+            model = self._pick(self.tiers[fallback])
+            if model is not None:
+                tier = fallback
+        self.routed[tier] += 1
+        return model or self.tiers[tier][0]
+
+    def route_vision(self) -> str:
+        """
+        Choose model for image analysis.
+
+        Returns:
+            str: Model name
+        """
+        return self.pick(VISION)
+
+    def route_image(self) -> str:
+        """
+        Choose model for image generation.
+
+        Returns:
+            str: Model name
+        """
+        return self.pick(IMAGE)
+
+    def pick(self, tier: str) -> str:
+        """
+        Choose the healthiest lowest-latency model of a tier.
+
+        Args:
+            tier: Tier name
+
+        Returns:
+            str: Model name, the first one of the tier if all are failing
+        """
+        self.routed[tier] += 1
+        models = self.tiers[tier]
+        return self._pick(models) or models[0]
+
+    def observe(self, model: str, latency: float, ok: bool) -> None:
+        """
+        Record outcome of a call.
+
+        Args:
+            model: Model name
+            latency: Call duration in seconds
+            ok: Whether the call succeeded
+        """
+        health = self._health.get(model)
+        if health is None:
+            health = self._health[model] = _ModelHealth(self._clock())
+        health.calls += 1
+        error_rate = self._error_rate(health)
+        health.error_rate = error_rate + self.alpha * ((0.0 if ok else 1.0) - error_rate)
+        health.updated_at = self._clock()
+        if ok:
+            if health.latency is None:
+                health.latency = latency
+            else:
+                health.latency += self.alpha * (latency - health.latency)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return routing counters and model statistics.
+
+        Returns:
+            Dict[str, Any]: Requests per tier, latency and error rate per model
+        """
+        stats: Dict[str, Any] = {f"routed_{tier}": count for tier, count in self.routed.items()}
+        for model, health in self._health.items():
+            if health.latency is not None:
+                stats[f"{model}_latency"] = health.latency
+            stats[f"{model}_error_rate"] = self._error_rate(health)
+        return stats
+
+    def _error_rate(self, health: _ModelHealth) -> float:
+        """Return error rate decayed by the time since the last observation."""
+        idle = self._clock() - health.updated_at
+        return health.error_rate * 0.5 ** (idle / self.error_half_life)
+
+    def _pick(self, models: List[str]) -> Optional[str]:
+        """Return the fastest model with acceptable error rate or None."""
+        best = None
+        best_latency = None
+        for model in models:
+            health = self._health.get(model)
+            if health is None:
+                # Модель без статистики пробуем в первую очередь
+                return model
+            if self._error_rate(health) > self.max_error_rate:
+                continue
+            latency = health.latency if health.latency is not None else 0.0
+            if best is None or latency < best_latency:
+                best, best_latency = model, latency
+        return best
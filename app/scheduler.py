@@ -0,0 +1,202 @@
+"""Module with fair scheduler limiting concurrent LLM calls."""
+import asyncio
+import itertools
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Hashable
+
+
+class QueueFullError(Exception):
+    """Raised when a user already has too many requests waiting."""
+
+
+class _Waiter:
+    """Queued request waiting for a free slot."""
+
+    __slots__ = ("future", "tag", "seq", "enqueued_at")
+
+    def __init__(self, future: asyncio.Future, tag: float, seq: int, enqueued_at: float):
+        self.future = future
+        self.tag = tag
+        self.seq = seq
+        self.enqueued_at = enqueued_at
+
+
+class LLMScheduler:
+    """Limits in-flight LLM calls globally and per user with fair queuing.
+
+    Waiting requests are ordered by start-time fair queuing: every request
+    gets a virtual start tag max(V, last finish tag of its user), and the
+    user's finish tag grows by cost / weight. The eligible request with the
+    smallest tag runs first, so a user flooding the bot only delays their
+    own requests, while others keep getting slots in proportion to their
+    weights.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        per_user_limit: int = 2,
+        max_queue_per_user: int = 10,
+        wait_samples: int = 1000,
+    ):
+        """
+        Initialize scheduler.
+
+        Args:
+            max_concurrency: Maximum number of LLM calls in flight
+            per_user_limit: Maximum number of calls in flight per user
+            max_queue_per_user: Maximum number of waiting requests per user
+            wait_samples: Number of recent wait times kept for percentiles
+        """
+        self.max_concurrency = max_concurrency
+        self.per_user_limit = per_user_limit
+        self.max_queue_per_user = max_queue_per_user
+        self._queues: Dict[Hashable, Deque[_Waiter]] = {}
+        self._running: Dict[Hashable, int] = {}
+        self._finish_tags: Dict[Hashable, float] = {}
+        self._virtual_time = 0.0
+        self._seq = itertools.count()
+        self.in_flight = 0
+        self.queued = 0
+        self.peak_queued = 0
+        self.granted = 0
+        self.rejected = 0
+        self._waits: Deque[float] = deque(maxlen=wait_samples)
+
+    @asynccontextmanager
+    async def slot(self, user_id: Hashable, weight: float = 1.0, cost: float = 1.0) -> AsyncIterator[None]:
+        """
+        Hold a slot for the duration of an LLM call.
+
+        Args:
+            user_id: Telegram user ID
+            weight: User's share relative to others
+            cost: Relative cost of the request (e.g. vision is heavier than text)
+
+        Raises:
+            QueueFullError: If the user already has too many waiting requests
+        """
+        await self.acquire(user_id, weight, cost)
+        try:
+            yield
+        finally:
+            self.release(user_id)
+
+    async def acquire(self, user_id: Hashable, weight: float = 1.0, cost: float = 1.0) -> None:
+        """
+        Wait for a free slot.
+
+        Args:
+            user_id: Telegram user ID
+            weight: User's share relative to others
+            cost: Relative cost of the request
+
+        Raises:
+            QueueFullError: If the user already has too many waiting requests
+        """
+        queue = self._queues.get(user_id)
+        if queue is not None and len(queue) >= self.max_queue_per_user:
+            self.rejected += 1
+            raise QueueFullError(f"Too many queued requests for user {user_id}")
+
+        start = max(self._virtual_time, self._finish_tags.get(user_id, 0.0))
+        self._finish_tags[user_id] = start + cost / weight
+
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(loop.create_future(), start, next(self._seq), loop.time())
+        if queue is None:
+            queue = self._queues[user_id] = deque()
+        queue.append(waiter)
+        self.queued += 1
+        self.peak_queued = max(self.peak_queued, self.queued)
+        self._dispatch()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Слот уже выдан, но вызывающий ушел — возвращаем его
+                self.release(user_id)
+            else:
+                self._remove(user_id, waiter)
+            raise
+
+    def release(self, user_id: Hashable) -> None:
+        """
+        Return slot and start the next waiting request.
+
+        Args:
+            user_id: Telegram user ID the slot was acquired for
+        """
+        self.in_flight -= 1
+        running = self._running.get(user_id, 0) - 1
+        if running > 0:
+            self._running[user_id] = running
+        else:
+            self._running.pop(user_id, None)
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return queue depth and wait time metrics.
+
+        Returns:
+            Dict[str, Any]: In-flight and queued requests, wait percentiles in seconds
+        """
+        waits = sorted(self._waits)
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "peak_queued": self.peak_queued,
+            "queued_users": len(self._queues),
+            "granted": self.granted,
+            "rejected": self.rejected,
+            "wait_p50": waits[len(waits) // 2] if waits else 0.0,
+            "wait_p95": waits[int(len(waits) * 0.95)] if waits else 0.0,
+            "wait_max": waits[-1] if waits else 0.0,
+        }
+
+    def _dispatch(self) -> None:
+        """Grant free slots to eligible waiters with the smallest start tags."""
+        while self.in_flight < self.max_concurrency:
+            best_user = None
+            best_waiter = None
+            for user_id, queue in list(self._queues.items()):
+                if self._running.get(user_id, 0) >= self.per_user_limit:
+                    continue
+                # Отмененные запросы, которые еще не успели убрать себя из очереди
+                while queue and queue[0].future.done():
+                    self._remove(user_id, queue[0])
+                if not queue:
+                    continue
+                waiter = queue[0]
+                if best_waiter is None or (waiter.tag, waiter.seq) < (best_waiter.tag, best_waiter.seq):
+                    best_user, best_waiter = user_id, waiter
+            if best_waiter is None:
+                return
+            self._remove(best_user, best_waiter)
+            self._virtual_time = max(self._virtual_time, best_waiter.tag)
+            self.in_flight += 1
+            self.granted += 1
+            self._running[best_user] = self._running.get(best_user, 0) + 1
+            self._waits.append(asyncio.get_running_loop().time() - best_waiter.enqueued_at)
+            best_waiter.future.set_result(None)
+            self._forget_idle_users()
+
+    def _remove(self, user_id: Hashable, waiter: _Waiter) -> None:
+        queue = self._queues.get(user_id)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        self.queued -= 1
+        if not queue:
+            del self._queues[user_id]
+
+    def _forget_idle_users(self) -> None:
+        """Drop finish tags that can no longer affect ordering."""
+        if len(self._finish_tags) <= 2 * (len(self._queues) + len(self._running)) + 64:
+            return
+        for user_id, tag in list(self._finish_tags.items()):
+            if tag <= self._virtual_time and user_id not in self._queues:
+                del self._finish_tags[user_id]
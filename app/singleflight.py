@@ -0,0 +1,149 @@
+"""Module for coalescing identical concurrent requests."""
+import asyncio
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class FlightCancelled(Exception):
+    """Raised to waiters when the shared request was cancelled by its owner."""
+
+
+class _Call:
+    """Shared in-flight request and the number of callers waiting for it."""
+
+    __slots__ = ("future", "owned", "waiters")
+
+    def __init__(self, future: asyncio.Future, owned: bool):
+        self.future = future
+        # owned=True: запрос выполняет сам SingleFlight и может его отменить
+        self.owned = owned
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs at most one upstream request per key at a time.
+
+    Callers that arrive while a request with the same key is in flight wait
+    for its result instead of sending their own. A waiter that is cancelled
+    does not affect the others; the upstream request itself is cancelled
+    only when nobody is waiting for it anymore.
+    """
+
+    def __init__(self):
+        """Initialize empty registry of in-flight requests."""
+        self._calls: Dict[Hashable, _Call] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def pending(self, key: Hashable) -> bool:
+        """
+        Check whether a request with the key is in flight.
+
+        Args:
+            key: Request key
+
+        Returns:
+            bool: True if callers can join an in-flight request
+        """
+        return key in self._calls
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run factory() or join an identical in-flight call.
+
+        Args:
+            key: Request key; equal keys share one upstream call
+            factory: Function creating the upstream coroutine
+
+        Returns:
+            Result of the shared call
+
+        Raises:
+            Exception raised by the shared call is re-raised to every waiter
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = self._register(key, asyncio.ensure_future(factory()), owned=True)
+        else:
+            self.coalesced += 1
+        return await self._wait(call)
+
+    def lead(self, key: Hashable) -> asyncio.Future:
+        """
+        Register the caller as the executor of the request for key.
+
+        Used when the result is produced incrementally (streaming) and cannot
+        be wrapped into a single coroutine. The caller must resolve the
+        returned future with set_result(), set_exception() or cancel().
+
+        Args:
+            key: Request key
+
+        Returns:
+            asyncio.Future: Future other callers will wait for
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._register(key, future, owned=False)
+        return future
+
+    async def join(self, key: Hashable) -> Any:
+        """
+        Wait for the result of an in-flight request.
+
+        Args:
+            key: Request key
+
+        Returns:
+            Result of the shared call
+
+        Raises:
+            KeyError: If no request with the key is in flight
+            FlightCancelled: If the owner cancelled the shared request
+        """
+        call = self._calls[key]
+        self.coalesced += 1
+        return await self._wait(call)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return coalescing counters.
+
+        Returns:
+            Dict[str, int]: Upstream calls, coalesced calls and calls in flight
+        """
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._calls),
+        }
+
+    def _register(self, key: Hashable, future: asyncio.Future, owned: bool) -> _Call:
+        call = _Call(future, owned)
+        self._calls[key] = call
+        self.calls += 1
+        future.add_done_callback(partial(self._forget, key, call))
+        return call
+
+    async def _wait(self, call: _Call) -> Any:
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.future)
+        except asyncio.CancelledError:
+            if call.future.cancelled() and not asyncio.current_task().cancelling():
+                # Отменен сам общий запрос, а не ожидающий его вызов
+                raise FlightCancelled() from None
+            if call.owned and call.waiters == 1 and not call.future.done():
+                # Ушел последний ожидающий — результат больше никому не нужен
+                call.future.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget(self, key: Hashable, call: _Call, future: asyncio.Future) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not future.cancelled():
+            # Помечаем исключение как полученное, даже если результат никто не ждал
+            future.exception()
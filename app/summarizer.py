@@ -0,0 +1,154 @@
+"""Module for background summarization of long conversation histories."""
+import asyncio
+import logging
+from typing import Any, Dict, List, Set
+
+from app.conversation import ConversationStore, Turn
+from app.openai_helper import OpenAIHelper
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SYSTEM_PROMPT = (
+    "Сожми диалог пользователя с ассистентом в краткое содержание из нескольких предложений. "
+    "Сохрани факты о пользователе, имена, числа, договоренности и открытые вопросы. "
+    "Если дано предыдущее краткое содержание, объедини его с новыми репликами."
+)
+
+SUMMARY_MAX_TOKENS = 300
+
+_ROLE_NAMES = {"user": "Пользователь", "assistant": "Ассистент"}
+
+
+def format_transcript(summary: str, turns: List[Turn]) -> str:
+    """
+    Format previous summary and turns as one text for the summarization request.
+
+    Args:
+        summary: Previous summary, may be empty
+        turns: Turns to summarize, oldest first
+
+    Returns:
+        str: Text for the model
+    """
+    lines = []
+    if summary:
+        lines.append(f"Предыдущее краткое содержание: {summary}")
+        lines.append("")
+    lines.append("Новые реплики:")
+    for turn in turns:
+        lines.append(f"{_ROLE_NAMES.get(turn.role, turn.role)}: {turn.content}")
+    return "\n".join(lines)
+
+
+class ConversationSummarizer:
+    """Folds older turns of long chats into a rolling summary.
+
+    Summaries are generated in background tasks, off the critical path of
+    the user's request, by a pool limited to max_concurrency simultaneous
+    model calls. At most one summarization per chat runs at a time.
+    """
+
+    def __init__(
+        self,
+        store: ConversationStore,
+        helper: OpenAIHelper,
+        threshold: int = 12,
+        keep_recent: int = 6,
+        max_concurrency: int = 2,
+    ):
+        """
+        Initialize summarizer.
+
+        Args:
+            store: Conversation store to read and fold turns in
+            helper: Helper used for summarization requests
+            threshold: Number of stored turns that triggers summarization
+            keep_recent: Number of most recent turns left untouched
+            max_concurrency: Maximum number of simultaneous summarization calls
+        """
+        self.store = store
+        self.helper = helper
+        self.threshold = threshold
+        self.keep_recent = keep_recent
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._running: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.completed = 0
+        self.failed = 0
+
+    def maybe_schedule(self, chat_id: int) -> bool:
+        """
+        Start background summarization if the chat history is long enough.
+
+        Args:
+            chat_id: Telegram chat ID
+
+        Returns:
+            bool: True if a summarization task was started
+        """
+        if chat_id in self._running:
+            return False
+        if len(self.store.turns(chat_id)) < self.threshold:
+            return False
+        self._running.add(chat_id)
+        task = asyncio.create_task(self._run(chat_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def summarize(self, chat_id: int) -> None:
+        """
+        Fold all but keep_recent turns of the chat into its summary.
+
+        Args:
+            chat_id: Telegram chat ID
+
+        Raises:
+            openai.OpenAIError: If the summarization request fails; the
+                history is left unchanged in that case
+        """
+        turns = self.store.turns(chat_id)[:-self.keep_recent or None]
+        if not turns:
+            return
+        transcript = format_transcript(self.store.summary(chat_id) or "", turns)
+        async with self._semaphore:
+            summary = await self.helper.complete(
+                [
+                    {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                    {"role": "user", "content": transcript},
+                ],
+                temperature=0,
+                max_tokens=SUMMARY_MAX_TOKENS,
+            )
+        if summary:
+            self.store.fold(chat_id, turns, summary)
+
+    async def aclose(self) -> None:
+        """Cancel running summarization tasks."""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return summarizer counters.
+
+        Returns:
+            Dict[str, Any]: Running, completed and failed summarizations
+        """
+        return {
+            "running": len(self._running),
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+    async def _run(self, chat_id: int) -> None:
+        try:
+            await self.summarize(chat_id)
+            self.completed += 1
+        except Exception as e:
+            # История остается полной и будет сжата при следующей попытке
+            self.failed += 1
+            logger.error(f"Ошибка при сжатии истории чата {chat_id}: {e}")
+        finally:
+            self._running.discard(chat_id)
@@ -1,67 +1,501 @@
 """Module for interacting with OpenAI Vision API."""
 import os
-import base64
-from typing import List, Optional, Union
+import asyncio
+import dataclasses
+import functools
+import json
+import re
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, TypeVar, Union
+import httpx
 from openai import AsyncOpenAI
 from dotenv import load_dotenv
 
+from app.disk_cache import DiskImageCache
+from app.executors import ImageExecutors
+from app.image_hashing import NearDuplicateCache, dhash
+from app.image_preprocessing import (
+    DEFAULT_JPEG_QUALITY,
+    DETAIL_AUTO,
+    DETAIL_HIGH,
+    DETAIL_LOW,
+    ImageSource,
+    PreparedImage,
+    apply_to_path,
+    open_source,
+    preprocess_image,
+    source_path,
+)
+from app.resilience import CircuitOpenError, ResilientCaller, guarded_call
+from app.response_cache import make_cache_key
+from app.router import ModelRouter
+from app.vision_planner import VisionPlan, VisionPlanner
+from app.vision_payload import VisionBody, build_vision_body, post_vision_body
+
 load_dotenv()
 
+# Модель анализа изображений (используется без маршрутизатора)
+VISION_MODEL = "gpt-4o"
+
+# Вопрос к изображению, если пользователь не добавил подпись
+DEFAULT_PROMPT = (
+    "Опиши детально, что ты видишь на этом изображении. Обрати внимание на:\n"
+    "1. Основные объекты и их расположение\n"
+    "2. Текст, если он есть\n"
+    "3. Людей, их действия и эмоции\n"
+    "4. Цвета и общую атмосферу"
+)
+DEFAULT_ALBUM_PROMPT = (
+    "Опиши детально, что ты видишь на этих изображениях: что на каждом из них "
+    "и что их объединяет"
+)
+
+# Несколько вопросов к одному изображению: один запрос со структурированным ответом
+MULTI_QUESTION_PROMPT = (
+    "Ответь на каждый вопрос об изображении отдельно, кратко и по существу. "
+    "Верни ответы в поле answers в том же порядке, что и вопросы."
+)
+ANSWERS_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "answers",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {"answers": {"type": "array", "items": {"type": "string"}}},
+            "required": ["answers"],
+            "additionalProperties": False,
+        },
+    },
+}
+NO_ANSWER = "Нет ответа"
+
+# Вопрос заканчивается знаком вопроса или занимает отдельную строку
+_QUESTION_SPLIT = re.compile(r"(?<=\?)\s+|\n+")
+
+T = TypeVar('T')
+
+
+def split_questions(text: Optional[str]) -> List[str]:
+    """
+    Split a caption or message into separate questions.
+
+    Args:
+        text: User text
+
+    Returns:
+        List[str]: Separate questions if the text has at least two sentences
+            ending with "?", otherwise the whole text as one element
+    """
+    if not text or not text.strip():
+        return []
+    parts = [part.strip() for part in _QUESTION_SPLIT.split(text) if part.strip()]
+    if sum(part.endswith("?") for part in parts) < 2:
+        return [text.strip()]
+    return parts
+
+
+def parse_answers(content: str, count: int) -> List[str]:
+    """
+    Extract per-question answers from the model's JSON.
+
+    Args:
+        content: JSON object with an "answers" array
+        count: Number of questions asked
+
+    Returns:
+        List[str]: Exactly count answers, NO_ANSWER for missing ones
+
+    Raises:
+        ValueError: If the content is not the expected JSON
+    """
+    data = json.loads(content) if content else None
+    answers = data.get("answers") if isinstance(data, dict) else None
+    if not isinstance(answers, list):
+        raise ValueError("в ответе модели нет списка answers")
+    answers = [str(answer).strip() or NO_ANSWER for answer in answers[:count]]
+    return answers + [NO_ANSWER] * (count - len(answers))
+
+
+def vision_cache_key(file_unique_id: str, prompt: Optional[str], model: str) -> str:
+    """
+    Build cache key of an image analysis result.
+
+    Args:
+        file_unique_id: Telegram ID of the file, the same for every copy of it
+        prompt: Question about the image, normalized by make_cache_key
+        model: Model that analyzed the image
+
+    Returns:
+        str: Cache key
+    """
+    return make_cache_key("vision", file_unique_id, prompt or "", model)
+
 class VisionHelper:
     """Helper class for interacting with OpenAI Vision API."""
     
-    def __init__(self):
-        """Initialize Vision helper."""
-        self.client = AsyncOpenAI()
-    
+    def __init__(
+        self,
+        client: Optional[AsyncOpenAI] = None,
+        resilience: Optional[ResilientCaller] = None,
+        router: Optional[ModelRouter] = None,
+        jpeg_quality: int = DEFAULT_JPEG_QUALITY,
+        default_detail: str = DETAIL_HIGH,
+        near_duplicates: Optional[NearDuplicateCache] = None,
+        executors: Optional[ImageExecutors] = None,
+        http_client: Optional[httpx.AsyncClient] = None,
+        planner: Optional[VisionPlanner] = None,
+        image_cache: Optional[DiskImageCache] = None,
+    ):
+        """
+        Initialize Vision helper.
 
+        Args:
+            client: Optional pre-configured async client shared with other helpers
+            resilience: Optional retries and circuit breaking of API calls
+            router: Optional per-request model choice, VISION_MODEL if omitted
+            jpeg_quality: JPEG quality of images re-encoded before upload
+            default_detail: Detail level when the question gives no hint
+            near_duplicates: Optional cache reusing results for visually identical images
+            executors: Optional process and thread pools for image work,
+                asyncio.to_thread if omitted
+            http_client: Optional HTTP client of the client's pool; when given,
+                request bodies are streamed through it without re-serializing
+            planner: Detail level and token budget of requests, default budget if omitted
+            image_cache: Optional disk cache of prepared images by Telegram file,
+                so repeat questions skip the download and the resize
+        """
+        self.client = client if client is not None else AsyncOpenAI()
+        self.resilience = resilience
+        self.router = router
+        self.jpeg_quality = jpeg_quality
+        self.default_detail = default_detail
+        self.near_duplicates = near_duplicates
+        self.executors = executors
+        self.http_client = http_client
+        self.planner = planner if planner is not None else VisionPlanner(default_detail=default_detail)
+        self.image_cache = image_cache
+        self.images = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    async def _run_cpu(self, fn: Callable[..., T], *args: Any) -> T:
+        # Декодирование и ресайз Pillow держат CPU: выносим в процессы
+        if self.executors is not None:
+            return await self.executors.run_cpu(fn, *args)
+        return await asyncio.to_thread(fn, *args)
+
+    async def _run_io(self, fn: Callable[..., T], *args: Any) -> T:
+        if self.executors is not None:
+            return await self.executors.run_io(fn, *args)
+        return await asyncio.to_thread(fn, *args)
+
+    async def _run_image(self, fn: Callable[..., T], source: ImageSource, *args: Any) -> T:
+        if isinstance(source, (bytes, bytearray)):
+            return await self._run_cpu(fn, source, *args)
+        # Открытый файл в процесс не передать: файл на диске процесс открывает сам
+        path = source_path(source)
+        if path is not None:
+            return await self._run_cpu(apply_to_path, fn, path, *args)
+        # Файл в памяти не больше порога загрузчика: отдаем процессу его байты
+        return await self._run_cpu(fn, open_source(source).read(), *args)
+
+    def _send(self, body: VisionBody) -> Awaitable[Any]:
+        if self.http_client is not None:
+            return post_vision_body(self.client, self.http_client, body)
+        # Без общего HTTP клиента тело разбирается обратно в параметры SDK
+        return self.client.chat.completions.create(**json.loads(body.data))
+
+    async def _prepare(
+        self,
+        image_data: ImageSource,
+        prompt: Optional[str],
+        detail: str,
+        cache_id: Optional[str] = None,
+    ) -> PreparedImage:
+        # Уменьшаем изображение до сетки модели и перекодируем без метаданных
+        prepared = await self._run_image(
+            preprocess_image,
+            image_data,
+            prompt,
+            detail,
+            self.jpeg_quality,
+            self.default_detail,
+        )
+        self.images += 1
+        self.bytes_in += prepared.original_size
+        self.bytes_out += len(prepared.data)
+        if self.image_cache is not None and cache_id is not None:
+            await self._run_io(self.image_cache.put, cache_id, prepared)
+        return prepared
+
+    async def load_prepared(self, cache_id: str, detail: str) -> Optional[PreparedImage]:
+        """
+        Return an image prepared earlier from the disk cache.
+
+        Args:
+            cache_id: Stable ID of the source file (Telegram file_unique_id)
+            detail: Detail level the image is needed at; an image prepared
+                at high detail also serves low, "auto" accepts either
+
+        Returns:
+            Optional[PreparedImage]: Cached image, None without a cache or on a miss
+        """
+        if self.image_cache is None:
+            return None
+        if detail == DETAIL_LOW:
+            # Модель сама уменьшит картинку высокой детализации для low
+            levels = [DETAIL_LOW, DETAIL_HIGH]
+        elif detail == DETAIL_HIGH:
+            levels = [DETAIL_HIGH]
+        else:
+            levels = [DETAIL_HIGH, DETAIL_LOW]
+        return await self._run_io(self._load_first, cache_id, levels)
+
+    def _load_first(self, cache_id: str, levels: Sequence[str]) -> Optional[PreparedImage]:
+        for level in levels:
+            prepared = self.image_cache.get(cache_id, level)
+            if prepared is not None:
+                return prepared
+        return None
+
+    async def _ask(
+        self,
+        model: str,
+        text: str,
+        images: List[PreparedImage],
+        plan: VisionPlan,
+        history: Optional[List[Dict[str, str]]] = None,
+        **params: Any,
+    ) -> str:
+        # Бюджет мог понизить детализацию уже подготовленных изображений
+        images = [
+            image if detail in (DETAIL_AUTO, image.detail) else dataclasses.replace(image, detail=detail)
+            for image, detail in zip(images, plan.details)
+        ]
+        # Кодируем изображения в base64 сразу в тело запроса, в пуле потоков
+        body = await self._run_io(
+            functools.partial(build_vision_body, history=history, **params), model, text, images, plan.max_tokens
+        )
+        response = await guarded_call(model, lambda: self._send(body), self.resilience, self.router)
+        choice = response.choices[0]
+        self.planner.record(plan, getattr(response, "usage", None), getattr(choice, "finish_reason", None))
+        return choice.message.content
+
+    def vision_model(self) -> str:
+        """
+        Choose model for image analysis.
+
+        Returns:
+            str: Model chosen by the router or VISION_MODEL
+        """
+        return self.router.route_vision() if self.router is not None else VISION_MODEL
 
-    async def analyze_image(self, image_data: bytearray, prompt: Optional[str] = None) -> str:
+    async def analyze_image(
+        self,
+        image_data: ImageSource,
+        prompt: Optional[str] = None,
+        model: Optional[str] = None,
+        detail: str = DETAIL_AUTO,
+        plan: Optional[VisionPlan] = None,
+        on_prepared: Optional[Callable[[PreparedImage], None]] = None,
+        cache_id: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+    ) -> str:
         """
         Analyze image using Google Cloud Vision API.
         
         Args:
-            image_data: Raw image bytes
+            image_data: Raw image bytes or a seekable file with them
+            prompt: Question about the image, detailed description by default
+            model: Model to use, chosen by the router when omitted
+            detail: Vision detail level, "auto" picks it from the image and prompt
+            plan: Detail level and answer cap planned from the Telegram photo
+                size, planned from the decoded image if omitted
+            on_prepared: Optional callback receiving the prepared image, e.g.
+                to keep it for follow-up questions
+            cache_id: Stable ID of the source file; the prepared image is
+                stored in the disk cache under it
+            history: Previous messages of the conversation; an answer given
+                with history is not shared through the near-duplicate cache
             
         Returns:
             str: Description of the image contents
         """
         try:
-            # Кодируем изображение в base64
-            image_b64 = base64.b64encode(image_data).decode('utf-8')
-            
-            # Формируем запрос к API
-            messages = [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": prompt if prompt else "Опиши детально, что ты видишь на этом изображении. Обрати внимание на:\n"
-                            "1. Основные объекты и их расположение\n"
-                            "2. Текст, если он есть\n"
-                            "3. Людей, их действия и эмоции\n"
-                            "4. Цвета и общую атмосферу"
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_b64}"
-                            }
-                        }
-                    ]
-                }
-            ]
-            
-            # Отправляем запрос в OpenAI
-            response = await self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=messages,
-                max_tokens=500
-            )
-            
-            return response.choices[0].message.content
+            if model is None:
+                model = self.vision_model()
+
+            # Пересжатые и пересланные копии картинки отвечаются из кэша
+            image_hash = None
+            if self.near_duplicates is not None and not history:
+                image_hash = await self._run_image(dhash, image_data)
+                if image_hash is not None:
+                    cached = self.near_duplicates.get(image_hash, prompt, model)
+                    if cached is not None:
+                        return cached
+
+            prepared = await self._prepare(image_data, prompt, plan.detail if plan else detail, cache_id)
+            if on_prepared is not None:
+                on_prepared(prepared)
+            if plan is None:
+                plan = self.planner.plan([(prepared.width, prepared.height)], prompt, [prepared.detail])
+            content = await self._ask(model, prompt or DEFAULT_PROMPT, [prepared], plan, history)
+            if image_hash is not None and content:
+                self.near_duplicates.set(image_hash, prompt, model, content)
+            return content
             
+        except CircuitOpenError:
+            # Быстрый отказ без ожидания таймаутов обрабатывается ботом отдельно
+            raise
         except Exception as e:
             # Пробрасываем ошибку дальше для обработки на уровне бота
             raise Exception(f"Ошибка при анализе изображения: {str(e)}")
+
+    async def analyze_prepared(
+        self,
+        prepared: PreparedImage,
+        prompt: Optional[str],
+        model: Optional[str] = None,
+        plan: Optional[VisionPlan] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+    ) -> str:
+        """
+        Ask about an image prepared earlier, without decoding it again.
+
+        Args:
+            prepared: Image kept from a previous analysis or read from the disk cache
+            prompt: Question about the image, detailed description by default
+            model: Model to use, chosen by the router when omitted
+            plan: Answer cap and detail level, planned from the image if omitted
+            history: Previous messages of the conversation, oldest first
+
+        Returns:
+            str: Answer about the image
+        """
+        try:
+            if model is None:
+                model = self.vision_model()
+            if plan is None:
+                plan = self.planner.plan([(prepared.width, prepared.height)], prompt, [prepared.detail])
+            return await self._ask(model, prompt or DEFAULT_PROMPT, [prepared], plan, history)
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            raise Exception(f"Ошибка при анализе изображения: {str(e)}")
+
+    async def answer_questions(
+        self,
+        image: Union[ImageSource, PreparedImage],
+        questions: Sequence[str],
+        model: Optional[str] = None,
+        plan: Optional[VisionPlan] = None,
+        on_prepared: Optional[Callable[[PreparedImage], None]] = None,
+        cache_id: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+    ) -> List[str]:
+        """
+        Answer several questions about one image in a single request.
+
+        The image is uploaded and tokenized once; the model returns a JSON
+        object with one answer per question (structured output).
+
+        Args:
+            image: Raw image bytes, a file with them or an image prepared earlier
+            questions: Questions about the image
+            model: Model to use, chosen by the router when omitted
+            plan: Detail level and answer cap for all questions,
+                planned from the image if omitted
+            on_prepared: Optional callback receiving the prepared image
+            cache_id: Stable ID of the source file; the prepared image is
+                stored in the disk cache under it
+            history: Previous messages of the conversation, oldest first
+
+        Returns:
+            List[str]: Answers in the order of the questions
+        """
+        try:
+            if model is None:
+                model = self.vision_model()
+            joined = "\n".join(questions)
+            if isinstance(image, PreparedImage):
+                prepared = image
+            else:
+                prepared = await self._prepare(image, joined, plan.detail if plan else DETAIL_AUTO, cache_id)
+                if on_prepared is not None:
+                    on_prepared(prepared)
+            if plan is None:
+                plan = self.planner.plan(
+                    [(prepared.width, prepared.height)], joined, [prepared.detail], questions=len(questions)
+                )
+            numbered = "\n".join(f"{index}. {question}" for index, question in enumerate(questions, 1))
+            content = await self._ask(
+                model,
+                f"{MULTI_QUESTION_PROMPT}\n\n{numbered}",
+                [prepared],
+                plan,
+                history,
+                response_format=ANSWERS_FORMAT,
+            )
+            return parse_answers(content, len(questions))
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            raise Exception(f"Ошибка при анализе изображения: {str(e)}")
+
+    async def analyze_images(
+        self,
+        images: Sequence[ImageSource],
+        prompt: Optional[str] = None,
+        model: Optional[str] = None,
+        detail: Union[str, Sequence[str]] = DETAIL_AUTO,
+        plan: Optional[VisionPlan] = None,
+    ) -> str:
+        """
+        Analyze several images (an album) in one request.
+
+        Args:
+            images: Raw image bytes or files in album order
+            prompt: Question about the images, detailed description by default
+            model: Model to use, chosen by the router when omitted
+            detail: Vision detail level for all images or one per image
+            plan: Detail levels and answer cap planned for the album,
+                planned from the decoded images if omitted
+
+        Returns:
+            str: One answer about all images
+        """
+        try:
+            if model is None:
+                model = self.vision_model()
+            if plan is not None:
+                details = list(plan.details)
+            else:
+                details = [detail] * len(images) if isinstance(detail, str) else list(detail)
+            prepared = list(await asyncio.gather(
+                *(self._prepare(data, prompt, level) for data, level in zip(images, details))
+            ))
+            if plan is None:
+                plan = self.planner.plan(
+                    [(image.width, image.height) for image in prepared],
+                    prompt,
+                    [image.detail for image in prepared],
+                )
+            return await self._ask(model, prompt or DEFAULT_ALBUM_PROMPT, prepared, plan)
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            raise Exception(f"Ошибка при анализе изображений: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return image preprocessing counters.
+
+        Returns:
+            Dict[str, Any]: Number of images, bytes before and after preprocessing
+        """
+        return {
+            "images": self.images,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "bytes_saved": self.bytes_in - self.bytes_out,
+        }
@@ -0,0 +1,186 @@
+"""Module for building Vision request bodies without extra copies of the image."""
+import binascii
+import json
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Union
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion
+
+from app.image_preprocessing import PreparedImage
+from app.rate_limiter import estimate_request
+
+# Кратно 3, чтобы куски base64 склеивались без символов выравнивания
+ENCODE_CHUNK = 3 * 16 * 1024
+SEND_CHUNK = 64 * 1024
+
+_STATUS_ERRORS = {
+    400: openai.BadRequestError,
+    401: openai.AuthenticationError,
+    403: openai.PermissionDeniedError,
+    404: openai.NotFoundError,
+    409: openai.ConflictError,
+    422: openai.UnprocessableEntityError,
+    429: openai.RateLimitError,
+}
+
+
+def encoded_length(size: int) -> int:
+    """Return length of base64 text for size bytes."""
+    return (size + 2) // 3 * 4
+
+
+def encode_into(buffer: bytearray, offset: int, data: Union[bytes, bytearray, memoryview]) -> int:
+    """
+    Base64-encode data into a preallocated buffer.
+
+    Only one ENCODE_CHUNK worth of base64 text exists outside the buffer at
+    any moment.
+
+    Args:
+        buffer: Destination with at least encoded_length(len(data)) free bytes
+        offset: Position in the buffer to write at
+        data: Bytes to encode
+
+    Returns:
+        int: Position right after the written text
+    """
+    view = memoryview(data)
+    for start in range(0, len(view), ENCODE_CHUNK):
+        chunk = binascii.b2a_base64(view[start:start + ENCODE_CHUNK], newline=False)
+        buffer[offset:offset + len(chunk)] = chunk
+        offset += len(chunk)
+    return offset
+
+
+@dataclass(frozen=True)
+class VisionBody:
+    """Serialized chat completion request with embedded images."""
+
+    data: bytearray
+    model: str
+    tokens: int
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        """Yield the body in SEND_CHUNK pieces for a streaming upload."""
+        view = memoryview(self.data)
+        for start in range(0, len(view), SEND_CHUNK):
+            yield bytes(view[start:start + SEND_CHUNK])
+
+
+def build_vision_body(
+    model: str,
+    text: str,
+    images: Sequence[PreparedImage],
+    max_tokens: int,
+    history: Optional[Sequence[Dict[str, str]]] = None,
+    **params: Any,
+) -> VisionBody:
+    """
+    Serialize a Vision chat completion request into one buffer.
+
+    The JSON around the images is produced by json.dumps; images are
+    base64-encoded straight into their place in the body, so the only
+    full-size allocation is the body itself. CPU-bound for large images:
+    run it off the event loop.
+
+    Args:
+        model: Model name
+        text: Question about the images
+        images: Prepared images, sent in this order after the text
+        max_tokens: Maximum tokens of the answer
+        history: Previous messages of the conversation, sent before the question
+        **params: Other request parameters, e.g. response_format
+
+    Returns:
+        VisionBody: Body bytes, model and estimated token cost
+    """
+    head = json.dumps({"model": model, "max_tokens": max_tokens, **params})[:-1]
+    earlier = "".join(f"{json.dumps(message)}, " for message in history or ())
+    segments: List[Union[bytes, PreparedImage]] = [
+        f'{head}, "messages": [{earlier}{{"role": "user", "content": ['.encode(),
+        json.dumps({"type": "text", "text": text}).encode(),
+    ]
+    for image in images:
+        url_prefix = json.dumps(f"data:{image.mime_type};base64,")[:-1]
+        segments.append(
+            f', {{"type": "image_url", "image_url": {{"detail": {json.dumps(image.detail)}, "url": {url_prefix}'.encode()
+        )
+        segments.append(image)
+        segments.append(b'"}}')
+    segments.append(b"]}]}")
+
+    # Оценка токенов по телу без данных картинок: оно маленькое и валидное
+    skeleton = b"".join(segment for segment in segments if isinstance(segment, bytes))
+    _, tokens = estimate_request(skeleton)
+
+    size = sum(
+        encoded_length(len(segment.data)) if isinstance(segment, PreparedImage) else len(segment)
+        for segment in segments
+    )
+    buffer = bytearray(size)
+    offset = 0
+    for segment in segments:
+        if isinstance(segment, PreparedImage):
+            offset = encode_into(buffer, offset, segment.data)
+        else:
+            buffer[offset:offset + len(segment)] = segment
+            offset += len(segment)
+    return VisionBody(data=buffer, model=model, tokens=tokens)
+
+
+async def post_vision_body(
+    client: AsyncOpenAI,
+    http_client: httpx.AsyncClient,
+    body: VisionBody,
+) -> ChatCompletion:
+    """
+    Send a prebuilt body to the chat completions endpoint.
+
+    The SDK only accepts request parameters and serializes them itself,
+    so the request is sent through the shared HTTP client with the SDK
+    headers. Errors are raised as the same openai exceptions the SDK raises,
+    so retries and circuit breaking treat both paths alike.
+
+    Args:
+        client: OpenAI client providing base URL and headers
+        http_client: HTTP client with the shared pool and rate limiter transport
+        body: Request body
+
+    Returns:
+        ChatCompletion: Parsed response
+    """
+    headers = {name: value for name, value in client.default_headers.items() if isinstance(value, str)}
+    headers["Content-Length"] = str(len(body.data))
+    request = http_client.build_request(
+        "POST",
+        client.base_url.join("chat/completions"),
+        headers=headers,
+        content=body.chunks(),
+        # Лимитер не читает потоковое тело: оценка передается заранее
+        extensions={"rate_limit": (body.model, body.tokens)},
+    )
+    try:
+        response = await http_client.send(request)
+    except httpx.TimeoutException as e:
+        raise openai.APITimeoutError(request=request) from e
+    except httpx.TransportError as e:
+        raise openai.APIConnectionError(request=request) from e
+    if response.is_error:
+        raise _status_error(response)
+    return ChatCompletion.model_validate(response.json())
+
+
+def _status_error(response: httpx.Response) -> openai.APIStatusError:
+    try:
+        body: Any = response.json()
+    except ValueError:
+        body = response.text
+    data: Dict[str, Any] = body.get("error", body) if isinstance(body, dict) else body
+    message = f"Error code: {response.status_code} - {body}"
+    if response.status_code >= 500:
+        return openai.InternalServerError(message, response=response, body=data)
+    error_class = _STATUS_ERRORS.get(response.status_code, openai.APIStatusError)
+    return error_class(message, response=response, body=data)
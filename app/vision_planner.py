@@ -0,0 +1,250 @@
+"""Module for planning detail level and token budget of Vision requests."""
+import math
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from app.image_preprocessing import (
+    DETAIL_AUTO,
+    DETAIL_HIGH,
+    DETAIL_LOW,
+    INTENT_BRIEF,
+    INTENT_DESCRIBE,
+    INTENT_DETAIL,
+    INTENT_READ,
+    LOW_DETAIL_SIDE,
+    classify_intent,
+    intent_detail,
+    target_size,
+)
+
+# Стоимость изображения: 85 токенов за картинку плюс 170 за каждый тайл 512x512 в режиме high
+BASE_IMAGE_TOKENS = 85
+TILE_TOKENS = 170
+TILE_SIDE = 512
+# Служебные токены сообщения сверх текста вопроса
+PROMPT_OVERHEAD_TOKENS = 10
+
+# Лимит ответа для каждого намерения
+_INTENT_OUTPUT_TOKENS = {
+    INTENT_READ: 1000,
+    INTENT_DETAIL: 700,
+    INTENT_BRIEF: 150,
+    INTENT_DESCRIBE: 500,
+}
+
+
+def image_tokens(width: Optional[int], height: Optional[int], detail: str) -> int:
+    """
+    Estimate input tokens of an image by the Vision tile formula.
+
+    Args:
+        width: Image width in pixels, None if unknown
+        height: Image height in pixels, None if unknown
+        detail: "low", "high" or "auto"
+
+    Returns:
+        int: 85 for low detail, 85 + 170 per 512x512 tile of the scaled
+            image otherwise; unknown sizes are priced as the largest grid
+    """
+    if detail == DETAIL_LOW:
+        return BASE_IMAGE_TOKENS
+    if not width or not height:
+        width, height = 2048, 768
+    width, height = target_size(width, height, DETAIL_HIGH)
+    tiles = math.ceil(width / TILE_SIDE) * math.ceil(height / TILE_SIDE)
+    return BASE_IMAGE_TOKENS + TILE_TOKENS * tiles
+
+
+@dataclass(frozen=True)
+class VisionPlan:
+    """Detail level per image, answer cap and expected token cost of a request."""
+
+    intent: str
+    details: Tuple[str, ...]
+    max_tokens: int
+    image_tokens: int
+    prompt_tokens: int
+    downgraded: bool = False
+
+    @property
+    def detail(self) -> str:
+        """Detail level of the first (usually the only) image."""
+        return self.details[0]
+
+
+class VisionPlanner:
+    """Chooses detail levels and max_tokens of Vision requests within a budget.
+
+    The question's intent picks the detail level ("прочитай текст" needs
+    high, "что это?" is answered from low) and the answer cap. When the
+    expected cost of a request exceeds token_budget, the most expensive
+    images are downgraded to low detail first, then the answer cap is
+    lowered. Planned and actual usage are counted for tuning.
+    """
+
+    def __init__(
+        self,
+        default_detail: str = DETAIL_HIGH,
+        token_budget: int = 4000,
+        max_output_tokens: int = 1000,
+        min_output_tokens: int = 100,
+    ):
+        """
+        Initialize planner.
+
+        Args:
+            default_detail: Detail level when the question gives no hint
+            token_budget: Maximum expected input plus output tokens of one request
+            max_output_tokens: Upper bound of the answer cap
+            min_output_tokens: Lower bound of the answer cap when the budget is tight
+        """
+        self.default_detail = default_detail
+        self.token_budget = token_budget
+        self.max_output_tokens = max_output_tokens
+        self.min_output_tokens = min_output_tokens
+        self.plans = 0
+        self.downgraded = 0
+        self.intents: Dict[str, int] = {}
+        self.planned_prompt_tokens = 0
+        self.planned_output_tokens = 0
+        self.measured = 0
+        self.measured_planned_prompt_tokens = 0
+        self.measured_planned_output_tokens = 0
+        self.actual_prompt_tokens = 0
+        self.actual_completion_tokens = 0
+        self.truncated = 0
+
+    def plan(
+        self,
+        sizes: Sequence[Tuple[Optional[int], Optional[int]]],
+        prompt: Optional[str] = None,
+        details: Optional[Sequence[str]] = None,
+        questions: int = 1,
+    ) -> VisionPlan:
+        """
+        Plan a request with one or more images.
+
+        Args:
+            sizes: Width and height of every image, None if unknown
+            prompt: User's question about the images
+            details: Detail levels already chosen for the images; only
+                downgraded if the budget requires
+            questions: Number of questions answered in one request
+
+        Returns:
+            VisionPlan: Chosen detail levels, answer cap and expected cost
+        """
+        intent = classify_intent(prompt)
+        if details is not None:
+            chosen = list(details)
+        else:
+            chosen = [self._detail(width, height, intent) for width, height in sizes]
+
+        max_tokens = _INTENT_OUTPUT_TOKENS[intent]
+        if len(sizes) > 1:
+            # На альбом нужен ответ длиннее, чем на одно фото
+            max_tokens *= 2
+        max_tokens *= max(1, questions)
+        max_tokens = min(max_tokens, self.max_output_tokens)
+        text_tokens = len(prompt or "") // 4 + PROMPT_OVERHEAD_TOKENS
+
+        costs = [image_tokens(width, height, detail) for (width, height), detail in zip(sizes, chosen)]
+        downgraded = False
+        while sum(costs) + text_tokens + max_tokens > self.token_budget:
+            index = max(range(len(costs)), key=costs.__getitem__, default=None)
+            if index is None or chosen[index] == DETAIL_LOW:
+                break
+            chosen[index] = DETAIL_LOW
+            costs[index] = BASE_IMAGE_TOKENS
+            downgraded = True
+        prompt_tokens = sum(costs) + text_tokens
+        if prompt_tokens + max_tokens > self.token_budget:
+            max_tokens = max(self.min_output_tokens, self.token_budget - prompt_tokens)
+            downgraded = True
+
+        self.plans += 1
+        self.downgraded += downgraded
+        self.intents[intent] = self.intents.get(intent, 0) + 1
+        self.planned_prompt_tokens += prompt_tokens
+        self.planned_output_tokens += max_tokens
+        return VisionPlan(
+            intent=intent,
+            details=tuple(chosen),
+            max_tokens=max_tokens,
+            image_tokens=sum(costs),
+            prompt_tokens=prompt_tokens,
+            downgraded=downgraded,
+        )
+
+    def record(self, plan: VisionPlan, usage: Any, finish_reason: Optional[str] = None) -> None:
+        """
+        Count actual usage of a planned request.
+
+        Args:
+            plan: Plan the request was sent with
+            usage: Usage object of the response (prompt_tokens, completion_tokens)
+            finish_reason: Finish reason of the answer, "length" if it hit the cap
+        """
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        completion_tokens = getattr(usage, "completion_tokens", None)
+        if not isinstance(prompt_tokens, int) or not isinstance(completion_tokens, int):
+            return
+        self.measured += 1
+        self.measured_planned_prompt_tokens += plan.prompt_tokens
+        self.measured_planned_output_tokens += plan.max_tokens
+        self.actual_prompt_tokens += prompt_tokens
+        self.actual_completion_tokens += completion_tokens
+        if finish_reason == "length":
+            self.truncated += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return planned and actual token counters.
+
+        Returns:
+            Dict[str, Any]: Plans, downgrades, intents, planned and actual
+                tokens with their ratios and answers cut by the cap
+        """
+        stats: Dict[str, Any] = {
+            "plans": self.plans,
+            "downgraded": self.downgraded,
+            "planned_prompt_tokens": self.planned_prompt_tokens,
+            "planned_output_tokens": self.planned_output_tokens,
+            "actual_prompt_tokens": self.actual_prompt_tokens,
+            "actual_completion_tokens": self.actual_completion_tokens,
+            "prompt_ratio": (
+                self.actual_prompt_tokens / self.measured_planned_prompt_tokens
+                if self.measured_planned_prompt_tokens else 0.0
+            ),
+            "output_ratio": (
+                self.actual_completion_tokens / self.measured_planned_output_tokens
+                if self.measured_planned_output_tokens else 0.0
+            ),
+            "truncated": self.truncated,
+        }
+        for intent, count in sorted(self.intents.items()):
+            stats[f"intent_{intent}"] = count
+        return stats
+
+    def resolve_detail(self, detail: str, prompt: Optional[str]) -> str:
+        """
+        Resolve "auto" detail of an image whose size is unknown by the question.
+
+        Args:
+            detail: Planned detail level
+            prompt: User's question about the image
+
+        Returns:
+            str: "low" or "high"; other levels are returned unchanged
+        """
+        if detail != DETAIL_AUTO:
+            return detail
+        return intent_detail(classify_intent(prompt), self.default_detail)
+
+    def _detail(self, width: Optional[int], height: Optional[int], intent: str) -> str:
+        if not width or not height:
+            return DETAIL_AUTO
+        if max(width, height) <= LOW_DETAIL_SIDE:
+            # Высокая детализация не добавит информации маленькой картинке
+            return DETAIL_LOW
+        return intent_detail(intent, self.default_detail)
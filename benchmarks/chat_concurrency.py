@@ -0,0 +1,62 @@
+"""Benchmark: chat throughput of OpenAIHelper under concurrent users.
+
+Uses fake OpenAI clients with a fixed simulated round-trip, so no network
+access or API key is needed. The "blocking" client reproduces the old
+behaviour (synchronous call inside a coroutine), the "async" client is the
+AsyncOpenAI-style path used by OpenAIHelper now.
+
+Run:
+    python -m benchmarks.chat_concurrency
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+from app.openai_helper import OpenAIHelper
+
+LATENCY = 0.2  # секунды на один ответ модели
+USERS = (1, 5, 10, 25, 50)
+
+
+def _completion(text: str) -> SimpleNamespace:
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+class _AsyncCompletions:
+    async def create(self, **kwargs):
+        await asyncio.sleep(LATENCY)
+        return _completion("ok")
+
+
+class _BlockingCompletions:
+    async def create(self, **kwargs):
+        # Синхронный вызов, как было с OpenAI(...).chat.completions.create
+        time.sleep(LATENCY)
+        return _completion("ok")
+
+
+def _fake_client(completions) -> SimpleNamespace:
+    return SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+
+async def _run(helper: OpenAIHelper, users: int) -> float:
+    started = time.perf_counter()
+    await asyncio.gather(*(helper.get_chat_response(f"question {i}") for i in range(users)))
+    elapsed = time.perf_counter() - started
+    return users / elapsed
+
+
+async def main() -> None:
+    blocking = OpenAIHelper(client=_fake_client(_BlockingCompletions()))
+    non_blocking = OpenAIHelper(client=_fake_client(_AsyncCompletions()))
+
+    print(f"simulated latency: {LATENCY * 1000:.0f} ms per completion")
+    print(f"{'users':>6} {'blocking req/s':>16} {'async req/s':>12}")
+    for users in USERS:
+        blocking_rps = await _run(blocking, users)
+        async_rps = await _run(non_blocking, users)
+        print(f"{users:>6} {blocking_rps:>16.1f} {async_rps:>12.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,64 @@
+"""Benchmark: upload size and latency of Vision requests with preprocessing.
+
+Generates synthetic photos of typical Telegram sizes, so no network access
+or API key is needed. Upload time is simulated for a fixed uplink over the
+base64-encoded payload; the preprocessing time is measured for real.
+
+Run:
+    python -m benchmarks.image_preprocessing
+"""
+import base64
+import io
+import time
+
+from PIL import Image
+
+from app.image_preprocessing import DETAIL_HIGH, DETAIL_LOW, preprocess_image
+from app.vision_planner import image_tokens
+
+UPLINK_MBIT = 10  # пропускная способность канала до OpenAI
+SIZES = ((1280, 960), (1920, 1440), (2560, 1920), (1280, 2560))
+QUALITY = 85
+
+
+def _photo(width: int, height: int) -> bytes:
+    # Шум поверх градиента сжимается примерно как настоящая фотография
+    gradient = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    noise = Image.effect_noise((width, height), 40).convert("RGB")
+    image = Image.blend(gradient, noise, 0.35)
+    output = io.BytesIO()
+    exif = Image.Exif()
+    exif[0x010F] = "Benchmark Camera"
+    image.save(output, format="JPEG", quality=95, exif=exif)
+    return output.getvalue()
+
+
+def _upload_ms(size: int) -> float:
+    encoded = len(base64.b64encode(b"\0" * size))
+    return encoded * 8 / (UPLINK_MBIT * 1_000_000) * 1000
+
+
+def main() -> None:
+    print(f"simulated uplink: {UPLINK_MBIT} Mbit/s, JPEG quality {QUALITY}")
+    print(
+        f"{'size':>10} {'detail':>6} {'raw KB':>8} {'sent KB':>8} {'saved':>6} "
+        f"{'prep ms':>8} {'raw ms':>8} {'new ms':>8} {'tokens':>6}"
+    )
+    for width, height in SIZES:
+        data = _photo(width, height)
+        for detail in (DETAIL_HIGH, DETAIL_LOW):
+            started = time.perf_counter()
+            prepared = preprocess_image(data, detail=detail, quality=QUALITY)
+            prep_ms = (time.perf_counter() - started) * 1000
+            raw_ms = _upload_ms(len(data))
+            new_ms = prep_ms + _upload_ms(len(prepared.data))
+            print(
+                f"{width}x{height:<5} {detail:>6} {len(data) / 1024:>8.0f} "
+                f"{len(prepared.data) / 1024:>8.0f} {prepared.saved_bytes / len(data):>6.0%} "
+                f"{prep_ms:>8.1f} {raw_ms:>8.1f} {new_ms:>8.1f} "
+                f"{image_tokens(prepared.width, prepared.height, detail):>6}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Benchmark: event loop lag while the vision pipeline processes 50 photos.
+
+A ticker coroutine sleeps 10 ms in a loop and records how late it wakes up;
+that lateness is what every other chat of the bot waits on. Photos are
+synthetic and the OpenAI client is fake, so no network access or API key
+is needed. Modes:
+
+- inline: Pillow and base64 on the event loop thread (worst case)
+- threads: asyncio.to_thread, Pillow competes for the GIL with the loop
+- executors: ImageExecutors, Pillow in worker processes, base64 in threads
+- files: same as executors, but photos are files on disk, as downloads above
+  DOWNLOAD_SPOOL_MAX_MEMORY are; workers open them by path
+
+Run:
+    python -m benchmarks.vision_event_loop_lag
+"""
+import asyncio
+import io
+import os
+import statistics
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, List, Optional, Sequence
+
+from PIL import Image
+
+from app.executors import ImageExecutors
+from app.image_preprocessing import ImageSource
+from app.vision_helper import VisionHelper
+
+PHOTOS = 50
+TICK = 0.01  # период тикера, секунды
+SIZE = (2560, 1920)
+
+
+def _photo(seed: int) -> bytes:
+    gradient = Image.linear_gradient("L").resize(SIZE).convert("RGB")
+    noise = Image.effect_noise(SIZE, 30 + seed % 20).convert("RGB")
+    output = io.BytesIO()
+    Image.blend(gradient, noise, 0.35).save(output, format="JPEG", quality=95)
+    return output.getvalue()
+
+
+class _Completions:
+    async def create(self, **kwargs):
+        await asyncio.sleep(0.05)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))])
+
+
+class _Inline:
+    """Runs image work right on the event loop, like synchronous code did."""
+
+    async def run_cpu(self, fn: Callable, *args: Any) -> Any:
+        return fn(*args)
+
+    async def run_io(self, fn: Callable, *args: Any) -> Any:
+        return fn(*args)
+
+
+async def _ticker(lags: List[float], stop: asyncio.Event) -> None:
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(TICK)
+        lags.append(max(0.0, loop.time() - started - TICK))
+
+
+async def _run(photos: Sequence[ImageSource], executors: Optional[Any]) -> List[float]:
+    client = SimpleNamespace(chat=SimpleNamespace(completions=_Completions()))
+    helper = VisionHelper(client=client, executors=executors)
+    lags: List[float] = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(_ticker(lags, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(helper.analyze_image(photo, prompt="Что это?") for photo in photos))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+    return [elapsed] + lags
+
+
+def _report(name: str, result: List[float]) -> None:
+    elapsed, lags = result[0], sorted(result[1:]) or [0.0]
+    p99 = lags[min(len(lags) - 1, int(len(lags) * 0.99))]
+    print(
+        f"{name:>10} {elapsed:>8.2f} {statistics.median(lags) * 1000:>8.1f} "
+        f"{p99 * 1000:>8.1f} {lags[-1] * 1000:>8.1f}"
+    )
+
+
+async def main() -> None:
+    photos = [_photo(seed) for seed in range(PHOTOS)]
+    processes = min(4, os.cpu_count() or 1)
+    print(f"{PHOTOS} photos {SIZE[0]}x{SIZE[1]}, tick {TICK * 1000:.0f} ms, {processes} worker processes")
+    print(f"{'mode':>10} {'total s':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    _report("inline", await _run(photos, _Inline()))
+    _report("threads", await _run(photos, None))
+    executors = ImageExecutors(processes=processes, threads=4)
+    # Первый вызов запускает процессы; запуск не входит в замер
+    await executors.run_cpu(len, b"")
+    files = []
+    try:
+        _report("executors", await _run(photos, executors))
+        for photo in photos:
+            # Как загрузка, ушедшая на диск: именованный временный файл
+            file = tempfile.NamedTemporaryFile(prefix="download-")
+            files.append(file)
+            file.write(photo)
+            file.flush()
+        _report("files", await _run(files, executors))
+    finally:
+        for file in files:
+            file.close()
+        executors.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
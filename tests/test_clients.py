@@ -0,0 +1,88 @@
+"""Tests for shared client registry."""
+import pytest
+from unittest.mock import MagicMock
+from app.clients import BOT_DATA_KEY, ClientRegistry, get_clients, post_init, post_shutdown
+
+@pytest.fixture(autouse=True)
+def api_key(monkeypatch):
+    """Устанавливает тестовый API ключ."""
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+
+@pytest.mark.asyncio
+async def test_helpers_share_http_client():
+    """Тест того, что все хелперы используют один пул соединений."""
+    registry = ClientRegistry()
+
+    assert registry.openai_helper.client is registry.client
+    assert registry.vision_helper.client is registry.client
+    assert registry.client._client is registry.http_client
+
+    await registry.aclose()
+    assert registry.http_client.is_closed
+
+@pytest.mark.asyncio
+async def test_downloader_has_own_http_client():
+    """Тест того, что файлы Telegram качаются не через клиент OpenAI."""
+    registry = ClientRegistry()
+
+    assert registry.downloader.http_client is registry.download_client
+    assert registry.download_client is not registry.http_client
+
+    await registry.aclose()
+    assert registry.download_client.is_closed
+
+@pytest.mark.asyncio
+async def test_from_env_limits(monkeypatch):
+    """Тест настройки лимитов соединений из переменных окружения."""
+    monkeypatch.setenv('OPENAI_MAX_CONNECTIONS', '7')
+    monkeypatch.setenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', '3')
+    monkeypatch.setenv('OPENAI_KEEPALIVE_EXPIRY', '12.5')
+
+    registry = ClientRegistry.from_env()
+
+    assert registry.limits.max_connections == 7
+    assert registry.limits.max_keepalive_connections == 3
+    assert registry.limits.keepalive_expiry == 12.5
+    await registry.aclose()
+
+def test_missing_api_key(monkeypatch):
+    """Тест создания реестра без API ключа."""
+    monkeypatch.delenv('OPENAI_API_KEY')
+    with pytest.raises(ValueError):
+        ClientRegistry()
+
+@pytest.mark.asyncio
+async def test_application_lifecycle():
+    """Тест создания реестра в post_init и закрытия в post_shutdown."""
+    application = MagicMock()
+    application.bot_data = {}
+
+    await post_init(application)
+    registry = application.bot_data[BOT_DATA_KEY]
+    assert get_clients(application.bot_data) is registry
+
+    await post_shutdown(application)
+    assert BOT_DATA_KEY not in application.bot_data
+    assert registry.http_client.is_closed
+
+@pytest.mark.asyncio
+async def test_get_clients_creates_registry_once():
+    """Тест ленивого создания реестра при отсутствии post_init."""
+    bot_data = {}
+
+    first = get_clients(bot_data)
+    second = get_clients(bot_data)
+
+    assert first is second
+    await first.aclose()
+
+@pytest.mark.asyncio
+async def test_stats_include_chat_cache():
+    """Тест сбора метрик кэша ответов."""
+    registry = ClientRegistry.from_env()
+
+    stats = registry.stats()
+
+    assert stats['chat_cache']['entries'] == 0
+    assert registry.openai_helper.cache is registry.chat_cache
+    await registry.aclose()
@@ -0,0 +1,85 @@
+"""Tests for per-chat conversation memory."""
+from app.conversation import ConversationStore, MESSAGE_OVERHEAD_TOKENS, estimate_tokens
+
+def test_estimate_tokens():
+    """Тест приблизительной оценки числа токенов."""
+    assert estimate_tokens("") == MESSAGE_OVERHEAD_TOKENS
+    assert estimate_tokens("a" * 400) == 101 + MESSAGE_OVERHEAD_TOKENS
+
+def test_history_in_order():
+    """Тест того, что история возвращается от старых реплик к новым."""
+    store = ConversationStore()
+    store.append(1, "user", "Привет")
+    store.append(1, "assistant", "Здравствуйте!")
+
+    history = store.build_history(1, "Как дела?")
+
+    assert history == [
+        {"role": "user", "content": "Привет"},
+        {"role": "assistant", "content": "Здравствуйте!"},
+    ]
+
+def test_chats_are_separate():
+    """Тест раздельного хранения истории разных чатов."""
+    store = ConversationStore()
+    store.append(1, "user", "первый чат")
+
+    assert store.build_history(2, "вопрос") == []
+
+def test_max_turns_bound():
+    """Тест ограничения числа хранимых реплик."""
+    store = ConversationStore(max_turns=3)
+    for i in range(10):
+        store.append(1, "user", f"сообщение {i}")
+
+    assert [turn.content for turn in store.turns(1)] == [
+        "сообщение 7", "сообщение 8", "сообщение 9"
+    ]
+
+def test_long_turn_truncated():
+    """Тест обрезки слишком длинных сообщений."""
+    store = ConversationStore(max_turn_chars=10)
+    store.append(1, "user", "x" * 100)
+
+    assert store.turns(1)[0].content == "x" * 10
+
+def test_budget_trims_oldest_turns_first():
+    """Тест того, что при нехватке бюджета отбрасываются старые реплики."""
+    store = ConversationStore()
+    for i in range(5):
+        store.append(1, "user", f"{i}" * 40)
+
+    turn_tokens = estimate_tokens("0" * 40)
+    budget = estimate_tokens("вопрос") + turn_tokens * 2
+    history = store.build_history(1, "вопрос", token_budget=budget)
+
+    assert [message["content"] for message in history] == ["3" * 40, "4" * 40]
+
+def test_budget_reserves_system_prompt():
+    """Тест учета системного промпта в бюджете."""
+    store = ConversationStore()
+    store.append(1, "user", "реплика")
+    budget = estimate_tokens("вопрос") + estimate_tokens("реплика")
+
+    assert len(store.build_history(1, "вопрос", token_budget=budget)) == 1
+    assert store.build_history(1, "вопрос", "системный промпт", token_budget=budget) == []
+
+def test_max_chats_evicts_least_recent():
+    """Тест вытеснения давно неактивных чатов."""
+    store = ConversationStore(max_chats=2)
+    store.append(1, "user", "a")
+    store.append(2, "user", "b")
+    store.append(1, "user", "c")
+    store.append(3, "user", "d")
+
+    assert store.turns(2) == []
+    assert len(store.turns(1)) == 2
+    assert store.stats() == {"chats": 2, "turns": 3, "summaries": 0}
+
+def test_clear():
+    """Тест очистки истории чата."""
+    store = ConversationStore()
+    store.append(1, "user", "a")
+    store.clear(1)
+
+    assert store.turns(1) == []
@@ -0,0 +1,122 @@
+"""Tests for disk-backed cache of prepared images."""
+import asyncio
+import json
+import mmap
+
+import pytest
+
+from app.disk_cache import DiskImageCache
+from app.image_preprocessing import PreparedImage
+
+class FakeClock:
+    """Ручное время для кэша."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def prepared(data, detail="high"):
+    """Создает подготовленное изображение с заданными байтами."""
+    return PreparedImage(data=data, detail=detail, width=1024, height=768, original_size=len(data) * 10)
+
+def test_put_and_get_memory_mapped(tmp_path):
+    """Тест сохранения и чтения изображения через отображение файла в память."""
+    cache = DiskImageCache(tmp_path)
+    cache.put("unique-1", prepared(b"jpeg-bytes"))
+
+    image = cache.get("unique-1", "high")
+
+    assert isinstance(image.data, mmap.mmap)
+    assert bytes(image.data) == b"jpeg-bytes"
+    assert (image.detail, image.width, image.height) == ("high", 1024, 768)
+    assert image.original_size == 100
+    assert cache.get("unique-1", "low") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_identical_content_shares_blob(tmp_path):
+    """Тест хранения одинаковых байтов разных файлов одним блобом."""
+    cache = DiskImageCache(tmp_path)
+    cache.put("unique-1", prepared(b"same"))
+    cache.put("unique-2", prepared(b"same"))
+
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["blobs"] == 1
+    assert cache.stats()["bytes"] == 4
+
+def test_lru_eviction_by_size(tmp_path):
+    """Тест вытеснения давно не использованных записей при превышении размера."""
+    cache = DiskImageCache(tmp_path, max_bytes=10)
+    cache.put("a", prepared(b"aaaa"))
+    cache.put("b", prepared(b"bbbb"))
+    cache.get("a", "high")
+    cache.put("c", prepared(b"cccc"))
+
+    assert cache.get("b", "high") is None
+    assert bytes(cache.get("a", "high").data) == b"aaaa"
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] == 8
+    assert len(list((tmp_path / "refs").iterdir())) == 2
+
+def test_expired_entries_swept(tmp_path):
+    """Тест удаления просроченных записей вместе с их файлами."""
+    clock = FakeClock()
+    cache = DiskImageCache(tmp_path, ttl=60, clock=clock)
+    cache.put("a", prepared(b"aaaa"))
+    clock.now += 30
+    cache.put("b", prepared(b"bbbb"))
+    clock.now += 40
+
+    assert cache.sweep() == 1
+    assert cache.get("a", "high") is None
+    assert cache.get("b", "high") is not None
+    assert cache.stats()["blobs"] == 1
+
+def test_index_recovered_after_restart(tmp_path):
+    """Тест восстановления индекса и очистки следов сбоя при запуске."""
+    clock = FakeClock()
+    cache = DiskImageCache(tmp_path, ttl=60, clock=clock)
+    cache.put("kept", prepared(b"kept"))
+    cache.put("truncated", prepared(b"truncated"))
+    cache.put("expired", prepared(b"expired"))
+    # Следы сбоя: недописанные файлы, обрезанный блоб и блоб без ссылки
+    (tmp_path / "refs" / "broken.tmp").write_bytes(b"{")
+    (tmp_path / "refs" / "garbage.json").write_bytes(b"not json")
+    refs = [json.loads(path.read_bytes()) for path in (tmp_path / "refs").glob("*.json") if path.stem != "garbage"]
+    truncated = next(ref for ref in refs if ref["size"] == len(b"truncated"))
+    (tmp_path / "blobs" / truncated["digest"][:2] / truncated["digest"]).write_bytes(b"trunc")
+    expired = next(ref for ref in refs if ref["size"] == len(b"expired"))
+    expired["expires_at"] = clock.now - 1
+    (tmp_path / "refs" / f"{expired['key']}.json").write_text(json.dumps(expired))
+    orphan = tmp_path / "blobs" / "ff" / ("f" * 64)
+    orphan.parent.mkdir()
+    orphan.write_bytes(b"orphan")
+
+    restarted = DiskImageCache(tmp_path, ttl=60, clock=clock)
+
+    assert bytes(restarted.get("kept", "high").data) == b"kept"
+    assert restarted.get("truncated", "high") is None
+    assert restarted.stats()["recovered"] == 1
+    assert restarted.stats()["dropped"] == 3
+    assert restarted.stats()["bytes"] == 4
+    assert not orphan.exists()
+    assert not (tmp_path / "refs" / "broken.tmp").exists()
+    assert len(list((tmp_path / "blobs").rglob("*.*"))) == 0
+    assert len([path for path in (tmp_path / "blobs").rglob("*") if path.is_file()]) == 1
+
+@pytest.mark.asyncio
+async def test_background_sweep(tmp_path):
+    """Тест фонового удаления просроченных записей."""
+    clock = FakeClock()
+    cache = DiskImageCache(tmp_path, ttl=60, sweep_interval=0.01, clock=clock)
+    cache.put("a", prepared(b"aaaa"))
+    clock.now += 61
+
+    cache.start()
+    await asyncio.sleep(0.1)
+    await cache.aclose()
+
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["expired"] == 1
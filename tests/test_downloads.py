@@ -0,0 +1,77 @@
+"""Tests for streaming downloads of Telegram files."""
+import os
+import tracemalloc
+import httpx
+import pytest
+from unittest.mock import MagicMock
+from app.downloads import DOWNLOAD_CHUNK, FileTooLargeError, SpooledDownloader
+
+def telegram_file(path="https://api.telegram.org/file/bot123:abc/photos/file_1.jpg", size=None):
+    """Создает файл Telegram, возвращенный get_file."""
+    return MagicMock(file_path=path, file_size=size)
+
+def make_client(data):
+    """Создает HTTP клиент, отдающий файл кусками."""
+    async def chunks():
+        for start in range(0, len(data), DOWNLOAD_CHUNK):
+            yield data[start:start + DOWNLOAD_CHUNK]
+
+    def handler(request):
+        return httpx.Response(200, content=chunks())
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+@pytest.mark.asyncio
+async def test_small_file_stays_in_memory():
+    """Тест загрузки маленького файла без записи на диск."""
+    downloader = SpooledDownloader(make_client(b"jpeg-bytes"), max_memory=1024)
+
+    with await downloader.download(telegram_file()) as image_file:
+        assert image_file.read() == b"jpeg-bytes"
+
+    assert downloader.stats() == {"downloads": 1, "spilled": 0, "rejected": 0, "bytes": 10}
+
+@pytest.mark.asyncio
+async def test_large_file_spills_to_disk_with_flat_memory():
+    """Тест загрузки большого файла: на диск, с памятью не больше порога."""
+    size = 8 * 1024 * 1024
+    data = os.urandom(size)
+    downloader = SpooledDownloader(make_client(data), max_memory=256 * 1024)
+
+    tracemalloc.start()
+    try:
+        image_file = await downloader.download(telegram_file())
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    with image_file:
+        assert image_file.read() == data
+        # Файл на диске доступен по имени, например процессу подготовки фото
+        assert os.path.getsize(image_file.name) == size
+    assert not os.path.exists(image_file.name)
+    assert downloader.stats()["spilled"] == 1
+    assert peak < size / 8
+
+@pytest.mark.asyncio
+async def test_oversized_file_rejected():
+    """Тест прерывания загрузки файла больше лимита."""
+    downloader = SpooledDownloader(make_client(b"x" * 2048), max_memory=512, max_size=1024)
+
+    with pytest.raises(FileTooLargeError):
+        await downloader.download(telegram_file())
+    with pytest.raises(FileTooLargeError):
+        await downloader.download(telegram_file(size=4096))
+
+    assert downloader.stats()["rejected"] == 2
+    assert downloader.stats()["downloads"] == 0
+
+@pytest.mark.asyncio
+async def test_local_bot_api_file_opened_directly(tmp_path):
+    """Тест файла локального сервера Bot API: открывается без копирования."""
+    path = tmp_path / "file_1.jpg"
+    path.write_bytes(b"local")
+    downloader = SpooledDownloader(make_client(b""))
+
+    with await downloader.download(telegram_file(str(path))) as image_file:
+        assert image_file.read() == b"local"
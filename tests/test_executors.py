@@ -0,0 +1,100 @@
+"""Tests for bounded executors of image work."""
+import asyncio
+import io
+import tempfile
+import threading
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from PIL import Image
+from app.executors import BoundedExecutor, ImageExecutors
+from app.image_preprocessing import preprocess_image
+from app.vision_helper import VisionHelper
+from concurrent.futures import ThreadPoolExecutor
+
+def make_jpeg(width, height):
+    """Создает JPEG заданного размера."""
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), (10, 120, 200)).save(output, format="JPEG")
+    return output.getvalue()
+
+@pytest.mark.asyncio
+async def test_bounded_executor_limits_submitted_jobs():
+    """Тест ограничения числа задач, переданных в пул."""
+    release = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=4)
+    executor = BoundedExecutor(pool, max_pending=2)
+
+    tasks = [asyncio.create_task(executor.run(release.wait, 5)) for _ in range(5)]
+    await asyncio.sleep(0.05)
+
+    assert executor.stats() == {"waiting": 3, "running": 2, "completed": 0}
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert executor.stats() == {"waiting": 0, "running": 0, "completed": 5}
+    pool.shutdown()
+
+@pytest.mark.asyncio
+async def test_bounded_executor_releases_slot_on_error():
+    """Тест освобождения слота при исключении в задаче."""
+    pool = ThreadPoolExecutor(max_workers=1)
+    executor = BoundedExecutor(pool, max_pending=1)
+
+    with pytest.raises(ZeroDivisionError):
+        await executor.run(divmod, 1, 0)
+
+    assert await executor.run(divmod, 7, 2) == (3, 1)
+    pool.shutdown()
+
+@pytest.mark.asyncio
+async def test_image_executors_run_pillow_in_process():
+    """Тест подготовки изображения в отдельном процессе."""
+    executors = ImageExecutors(processes=1, threads=1)
+    try:
+        prepared = await executors.run_cpu(preprocess_image, make_jpeg(3000, 2000), None, "high")
+    finally:
+        executors.shutdown()
+
+    assert (prepared.width, prepared.height) == (1152, 768)
+    assert executors.stats()["cpu_completed"] == 1
+
+@pytest.mark.asyncio
+async def test_vision_helper_uses_executors():
+    """Тест того, что VisionHelper отдает работу с изображением в пулы."""
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(
+        return_value=MagicMock(choices=[MagicMock(message=MagicMock(content="ответ"))])
+    )
+    executors = ImageExecutors(processes=0, threads=2)
+    helper = VisionHelper(client=client, executors=executors)
+
+    assert await helper.analyze_image(make_jpeg(800, 600), prompt="Что это?") == "ответ"
+
+    executors.shutdown()
+    stats = executors.stats()
+    assert stats["cpu_completed"] == 1
+    assert stats["io_completed"] == 1
+
+@pytest.mark.asyncio
+async def test_vision_helper_sends_files_to_processes():
+    """Тест подготовки скачанных файлов в процессах: файл на диске передается по пути."""
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(
+        return_value=MagicMock(choices=[MagicMock(message=MagicMock(content="ответ"))])
+    )
+    executors = ImageExecutors(processes=1, threads=1)
+    helper = VisionHelper(client=client, executors=executors)
+    on_disk = tempfile.NamedTemporaryFile()
+    on_disk.write(make_jpeg(3000, 2000))
+    on_disk.flush()
+    prepared = []
+
+    try:
+        with on_disk, io.BytesIO(make_jpeg(800, 600)) as in_memory:
+            for image_file in (on_disk, in_memory):
+                await helper.analyze_image(image_file, prompt="Прочитай текст", on_prepared=prepared.append)
+    finally:
+        executors.shutdown()
+
+    assert [(image.width, image.height) for image in prepared] == [(1152, 768), (800, 600)]
+    assert executors.stats()["cpu_completed"] == 2
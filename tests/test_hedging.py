@@ -0,0 +1,142 @@
+"""Tests for hedged requests."""
+import asyncio
+import pytest
+from unittest.mock import MagicMock
+from app.hedging import Hedger
+from app.openai_helper import OpenAIHelper
+
+def make_factory(delays, results=None):
+    """Создает фабрику попыток с заданными задержками и результатами."""
+    attempts = []
+
+    async def factory():
+        index = len(attempts)
+        state = {"cancelled": False}
+        attempts.append(state)
+        try:
+            await asyncio.sleep(delays[index])
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+        result = (results or [f"ответ {i}" for i in range(len(delays))])[index]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    factory.attempts = attempts
+    return factory
+
+@pytest.mark.asyncio
+async def test_fast_call_is_not_hedged():
+    """Тест того, что быстрый запрос не дублируется."""
+    hedger = Hedger(initial_delay=0.05)
+    factory = make_factory([0])
+
+    assert await hedger.run(factory) == "ответ 0"
+
+    assert len(factory.attempts) == 1
+    assert hedger.stats()["hedged"] == 0
+
+@pytest.mark.asyncio
+async def test_slow_call_is_hedged_and_loser_cancelled():
+    """Тест отправки дубля и отмены проигравшего запроса."""
+    hedger = Hedger(initial_delay=0.01, min_delay=0)
+    factory = make_factory([1.0, 0])
+
+    assert await hedger.run(factory) == "ответ 1"
+
+    assert len(factory.attempts) == 2
+    await asyncio.sleep(0)
+    assert factory.attempts[0]["cancelled"]
+    stats = hedger.stats()
+    assert stats["hedged"] == 1
+    assert stats["hedge_wins"] == 1
+    assert stats["win_rate"] == 1.0
+    assert stats["outstanding"] == 0
+
+@pytest.mark.asyncio
+async def test_primary_can_still_win():
+    """Тест победы основного запроса после отправки дубля."""
+    hedger = Hedger(initial_delay=0.01, min_delay=0)
+    factory = make_factory([0.03, 1.0])
+
+    assert await hedger.run(factory) == "ответ 0"
+
+    await asyncio.sleep(0)
+    assert factory.attempts[1]["cancelled"]
+    assert hedger.stats()["hedge_wins"] == 0
+
+@pytest.mark.asyncio
+async def test_failed_attempt_waits_for_other():
+    """Тест того, что ошибка одной попытки не отменяет вторую."""
+    hedger = Hedger(initial_delay=0.01, min_delay=0)
+    factory = make_factory([0.02, 0.05], results=[Exception("upstream"), "ответ 1"])
+
+    assert await hedger.run(factory) == "ответ 1"
+
+@pytest.mark.asyncio
+async def test_all_attempts_fail():
+    """Тест ошибки, если обе попытки упали."""
+    hedger = Hedger(initial_delay=0.01, min_delay=0)
+    factory = make_factory([0.02, 0.03], results=[Exception("first"), Exception("second")])
+
+    with pytest.raises(Exception):
+        await hedger.run(factory)
+    assert hedger.outstanding == 0
+
+@pytest.mark.asyncio
+async def test_outstanding_hedges_are_capped():
+    """Тест ограничения числа одновременных дублей."""
+    hedger = Hedger(initial_delay=0.01, min_delay=0, max_outstanding=1)
+    factories = [make_factory([0.1, 0.1]) for _ in range(3)]
+
+    await asyncio.gather(*(hedger.run(factory) for factory in factories))
+
+    assert sum(len(factory.attempts) for factory in factories) == 4
+    assert hedger.stats()["hedged"] == 1
+    assert hedger.stats()["skipped"] == 2
+
+def test_threshold_follows_latency_quantile():
+    """Тест адаптивного порога по квантилю задержек."""
+    hedger = Hedger(quantile=0.9, min_delay=0.1, max_delay=5, min_samples=10)
+    assert hedger.threshold() == hedger.initial_delay
+
+    hedger._latencies.extend([1.0] * 9 + [4.0])
+    assert hedger.threshold() == 4.0
+
+    hedger._latencies.extend([100.0] * 10)
+    assert hedger.threshold() == 5
+
+@pytest.mark.asyncio
+async def test_cancel_run_cancels_attempts():
+    """Тест отмены всех попыток при отмене вызывающего."""
+    hedger = Hedger(initial_delay=0.01, min_delay=0)
+    factory = make_factory([1.0, 1.0])
+
+    task = asyncio.create_task(hedger.run(factory))
+    await asyncio.sleep(0.03)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await asyncio.sleep(0)
+
+    assert all(attempt["cancelled"] for attempt in factory.attempts)
+    assert hedger.outstanding == 0
+
+@pytest.mark.asyncio
+async def test_openai_helper_uses_hedger():
+    """Тест дублирования медленного get_chat_response."""
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            await asyncio.sleep(1.0)
+        return MagicMock(choices=[MagicMock(message=MagicMock(content="быстрый ответ"))])
+
+    client = MagicMock()
+    client.chat.completions.create = create
+    helper = OpenAIHelper(client=client, hedger=Hedger(initial_delay=0.01, min_delay=0))
+
+    assert await helper.get_chat_response("Привет") == "быстрый ответ"
+    assert len(calls) == 2
+    assert helper.hedger.stats()["hedge_wins"] == 1
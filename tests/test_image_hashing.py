@@ -0,0 +1,123 @@
+"""Tests for perceptual hashing and near-duplicate cache."""
+import io
+import random
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from PIL import Image, ImageDraw
+from app.image_hashing import BKTree, NearDuplicateCache, dhash, hamming
+from app.vision_helper import VisionHelper
+
+def make_picture(seed, size=(640, 480), quality=90):
+    """Рисует картинку из случайных прямоугольников и кодирует в JPEG."""
+    rng = random.Random(seed)
+    image = Image.new("RGB", size, (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        color = tuple(rng.randrange(256) for _ in range(3))
+        draw.rectangle([x, y, x + rng.randrange(50, 300), y + rng.randrange(50, 300)], fill=color)
+    return encode(image, quality)
+
+def encode(image, quality):
+    """Кодирует изображение в JPEG."""
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=quality)
+    return output.getvalue()
+
+class FakeClock:
+    """Ручное время для кэша."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_dhash_survives_recompression_and_resize():
+    """Тест устойчивости хэша к пересжатию и уменьшению."""
+    original = make_picture(1)
+    copy = Image.open(io.BytesIO(original)).resize((320, 240))
+
+    assert hamming(dhash(original), dhash(encode(copy, 40))) <= 4
+
+def test_dhash_differs_for_other_images():
+    """Тест различия хэшей разных картинок."""
+    assert hamming(dhash(make_picture(1)), dhash(make_picture(2))) > 10
+
+def test_dhash_of_invalid_bytes():
+    """Тест хэша для данных, не являющихся изображением."""
+    assert dhash(b"not an image") is None
+
+def test_bk_tree_matches_brute_force():
+    """Тест поиска в BK-дереве против полного перебора."""
+    rng = random.Random(0)
+    values = [rng.getrandbits(64) for _ in range(500)]
+    tree = BKTree()
+    for value in values:
+        tree.add(value)
+    query = values[10] ^ 0b1011
+
+    expected = sorted((hamming(query, value), value) for value in values if hamming(query, value) <= 12)
+
+    assert tree.search(query, 12) == expected
+    assert tree.search(query, 3)[0] == (3, values[10])
+
+def test_bk_tree_remove_and_rebuild():
+    """Тест удаления с пометкой и перестроения дерева."""
+    tree = BKTree()
+    for value in range(1, 9):
+        tree.add(value)
+    for value in range(1, 6):
+        tree.remove(value)
+
+    assert len(tree) == 3
+    assert tree.tombstones == 0
+    assert [value for _, value in tree.search(0, 64)] == [8, 6, 7]
+
+    tree.add(1)
+    assert len(tree) == 4
+
+def test_cache_reuses_answer_for_similar_hash():
+    """Тест повторного использования ответа для близкого хэша."""
+    cache = NearDuplicateCache(max_distance=4)
+    cache.set(0b1111, "Что это?", "gpt-4o", "Кот")
+
+    assert cache.get(0b1110, "что  это?", "gpt-4o") == "Кот"
+    assert cache.get(0b1110, "Сколько котов?", "gpt-4o") is None
+    assert cache.get(0b1110, "Что это?", "gpt-4o-mini") is None
+    assert cache.get(0b1111 ^ 0b111110000, "Что это?", "gpt-4o") is None
+    assert cache.stats()["hits"] == 1
+
+def test_cache_ttl_and_eviction():
+    """Тест истечения срока и вытеснения старых записей."""
+    clock = FakeClock()
+    cache = NearDuplicateCache(max_entries=2, ttl=10, clock=clock)
+    first, second, third = 0, 0xFFFFFFFF00000000, 0x00000000FFFFFFFF
+    cache.set(first, "q", "m", "a")
+    cache.set(second, "q", "m", "b")
+    cache.set(third, "q", "m", "c")
+
+    assert cache.get(first, "q", "m") is None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["hashes"] == 2
+
+    clock.now += 11
+    assert cache.get(second, "q", "m") is None
+    assert cache.stats()["entries"] == 1
+
+@pytest.mark.asyncio
+async def test_vision_helper_reuses_near_duplicate():
+    """Тест того, что пересжатая копия фото не отправляется в OpenAI повторно."""
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(
+        return_value=MagicMock(choices=[MagicMock(message=MagicMock(content="Прямоугольники"))])
+    )
+    helper = VisionHelper(client=client, near_duplicates=NearDuplicateCache())
+    original = make_picture(3)
+    copy = encode(Image.open(io.BytesIO(original)), 50)
+
+    assert await helper.analyze_image(original, prompt="Что это?") == "Прямоугольники"
+    assert await helper.analyze_image(copy, prompt="Что это?") == "Прямоугольники"
+
+    assert client.chat.completions.create.await_count == 1
+    assert helper.near_duplicates.stats()["hits"] == 1
@@ -0,0 +1,88 @@
+"""Tests for per-chat memory of the last image."""
+from app.image_memory import ImageMemory
+from app.image_preprocessing import PreparedImage
+
+class FakeClock:
+    """Ручное время для памяти."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def prepared(size, detail="high"):
+    """Создает подготовленное изображение заданного размера."""
+    return PreparedImage(data=b"x" * size, detail=detail, width=100, height=100, original_size=size * 2)
+
+def test_remember_and_attach():
+    """Тест запоминания фото и добавления подготовленных байтов."""
+    memory = ImageMemory()
+    memory.remember(1, "file-1", "unique-1", 2560, 1920)
+
+    assert memory.get(1).prepared is None
+
+    memory.attach(1, "unique-1", prepared(100))
+    image = memory.get(1)
+    assert image.file_id == "file-1"
+    assert (image.width, image.height) == (2560, 1920)
+    assert image.prepared.data == b"x" * 100
+    assert memory.stats()["bytes"] == 100
+
+def test_attach_ignored_after_new_photo():
+    """Тест того, что байты старого фото не попадают к новому."""
+    memory = ImageMemory()
+    memory.remember(1, "file-1", "unique-1", 100, 100)
+    memory.remember(1, "file-2", "unique-2", 100, 100)
+
+    memory.attach(1, "unique-1", prepared(10))
+
+    assert memory.get(1).prepared is None
+
+def test_same_photo_keeps_prepared_bytes():
+    """Тест сохранения байтов при повторной отправке того же фото."""
+    memory = ImageMemory()
+    memory.remember(1, "file-1", "unique-1", 100, 100)
+    memory.attach(1, "unique-1", prepared(10))
+    memory.remember(1, "file-1b", "unique-1", 100, 100)
+
+    assert memory.get(1).prepared is not None
+    assert memory.get(1).file_id == "file-1b"
+
+def test_attach_answer_keeps_last_ids():
+    """Тест запоминания последних ответов бота о фото."""
+    memory = ImageMemory()
+    memory.remember(1, "file-1", "unique-1", 100, 100)
+    memory.attach(1, "unique-1", prepared(10))
+    for message_id in range(20):
+        memory.attach_answer(1, "unique-1", message_id)
+    memory.attach_answer(1, "unique-2", 100)
+
+    image = memory.get(1)
+    assert image.answer_ids == tuple(range(20 - memory.max_answer_ids, 20))
+    assert image.prepared is not None
+
+    memory.remember(1, "file-2", "unique-2", 100, 100)
+    assert memory.get(1).answer_ids == ()
+
+def test_ttl_expires_photo():
+    """Тест забывания фото после TTL."""
+    clock = FakeClock()
+    memory = ImageMemory(ttl=60, clock=clock)
+    memory.remember(1, "file-1", "unique-1", 100, 100)
+
+    clock.now += 61
+
+    assert memory.get(1) is None
+    assert memory.stats()["chats"] == 0
+
+def test_bytes_limit_evicts_oldest_chat():
+    """Тест вытеснения самого старого чата при превышении объема."""
+    memory = ImageMemory(max_bytes=150)
+    for chat_id in (1, 2):
+        memory.remember(chat_id, f"file-{chat_id}", f"unique-{chat_id}", 100, 100)
+        memory.attach(chat_id, f"unique-{chat_id}", prepared(100))
+
+    assert memory.get(1) is None
+    assert memory.get(2) is not None
+    assert memory.stats() == {"chats": 1, "bytes": 100, "hits": 1, "misses": 1, "evictions": 1}
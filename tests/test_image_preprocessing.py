@@ -0,0 +1,151 @@
+"""Tests for image preprocessing before Vision upload."""
+import io
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from PIL import Image
+from app.image_preprocessing import (
+    DETAIL_HIGH,
+    DETAIL_LOW,
+    choose_detail,
+    preprocess_image,
+    refers_to_image,
+    select_photo_size,
+    target_size,
+)
+from app.vision_helper import VisionHelper
+
+def make_jpeg(width, height, exif_orientation=None, mode="RGB"):
+    """Создает JPEG или PNG заданного размера."""
+    image = Image.new(mode, (width, height), (200, 100, 50) if mode == "RGB" else None)
+    output = io.BytesIO()
+    if mode != "RGB":
+        image.save(output, format="PNG")
+        return output.getvalue()
+    exif = Image.Exif()
+    exif[0x010F] = "Camera Maker"
+    if exif_orientation:
+        exif[0x0112] = exif_orientation
+    image.save(output, format="JPEG", quality=95, exif=exif)
+    return output.getvalue()
+
+def test_target_size_high_detail():
+    """Тест вписывания в сетку high: 2048 по длинной и 768 по короткой стороне."""
+    assert target_size(4000, 3000, DETAIL_HIGH) == (1024, 768)
+    assert target_size(4096, 1024, DETAIL_HIGH) == (2048, 512)
+    assert target_size(600, 400, DETAIL_HIGH) == (600, 400)
+
+def test_target_size_low_detail():
+    """Тест вписывания в 512x512 для low."""
+    assert target_size(4000, 3000, DETAIL_LOW) == (512, 384)
+    assert target_size(300, 200, DETAIL_LOW) == (300, 200)
+
+def test_refers_to_image():
+    """Тест распознавания текста, который относится к картинке."""
+    assert refers_to_image("Что на фото справа?")
+    assert refers_to_image("Какого он цвета?")
+    assert refers_to_image("what is this")
+    assert not refers_to_image("Напиши код сортировки на Python")
+    assert not refers_to_image("Фотосинтез — это что?")
+    assert not refers_to_image("Explain imagemagick flags")
+    assert not refers_to_image("Что этот метод возвращает?")
+    assert not refers_to_image(None)
+
+def test_choose_detail():
+    """Тест автоматического выбора детализации."""
+    assert choose_detail(400, 300, "прочитай текст") == DETAIL_LOW
+    assert choose_detail(2000, 1500, "Прочитай текст на вывеске") == DETAIL_HIGH
+    assert choose_detail(2000, 1500, "Что это? Кратко") == DETAIL_LOW
+    assert choose_detail(2000, 1500, None, default=DETAIL_LOW) == DETAIL_LOW
+    # Намерение определяется тем же классификатором, что и в планировщике
+    assert choose_detail(2000, 1500, "Перепиши рецепт") == DETAIL_HIGH
+    assert choose_detail(2000, 1500, "Сколько людей на фото?") == DETAIL_HIGH
+
+def photo_sizes(*sizes):
+    """Создает версии фото с размерами и весом файла."""
+    return [MagicMock(width=w, height=h, file_size=w * h // 10) for w, h in sizes]
+
+def test_select_photo_size():
+    """Тест выбора наименьшей версии фото, покрывающей сетку модели."""
+    photos = photo_sizes((90, 67), (320, 240), (800, 600), (1280, 960), (2560, 1920))
+
+    assert select_photo_size(photos, DETAIL_LOW) is photos[2]
+    assert select_photo_size(photos, DETAIL_HIGH) is photos[3]
+
+def test_select_photo_size_portrait():
+    """Тест выбора для вертикального фото."""
+    photos = photo_sizes((240, 320), (600, 800), (960, 1280))
+
+    assert select_photo_size(photos, DETAIL_HIGH) is photos[2]
+    assert select_photo_size(photos, DETAIL_LOW) is photos[1]
+
+def test_select_photo_size_falls_back_to_largest():
+    """Тест выбора самой большой версии, если ни одна не покрывает сетку."""
+    photos = photo_sizes((320, 240), (640, 480))
+
+    assert select_photo_size(photos, DETAIL_HIGH) is photos[1]
+
+def test_preprocess_downscales_and_strips_metadata():
+    """Тест уменьшения изображения и удаления EXIF."""
+    data = make_jpeg(4000, 3000)
+
+    prepared = preprocess_image(data, detail=DETAIL_HIGH)
+
+    assert (prepared.width, prepared.height) == (1024, 768)
+    assert prepared.saved_bytes > 0
+    image = Image.open(io.BytesIO(prepared.data))
+    assert image.format == "JPEG"
+    assert not image.getexif()
+
+def test_preprocess_applies_exif_orientation():
+    """Тест поворота по EXIF перед удалением метаданных."""
+    data = make_jpeg(800, 400, exif_orientation=6)
+
+    prepared = preprocess_image(data, detail=DETAIL_HIGH)
+
+    assert (prepared.width, prepared.height) == (400, 800)
+
+def test_preprocess_converts_transparent_png():
+    """Тест перекодирования PNG с прозрачностью в JPEG."""
+    data = make_jpeg(100, 100, mode="RGBA")
+
+    prepared = preprocess_image(data)
+
+    assert prepared.mime_type == "image/jpeg"
+    assert Image.open(io.BytesIO(prepared.data)).mode == "RGB"
+    assert prepared.detail == DETAIL_LOW
+
+def test_preprocess_keeps_undecodable_bytes():
+    """Тест отправки исходных байтов, если это не изображение."""
+    prepared = preprocess_image(b"not an image", default_detail=DETAIL_LOW)
+
+    assert prepared.data == b"not an image"
+    assert prepared.detail == DETAIL_LOW
+
+@pytest.mark.asyncio
+async def test_vision_helper_sends_prepared_image():
+    """Тест отправки подготовленного изображения с уровнем детализации."""
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(
+        return_value=MagicMock(choices=[MagicMock(message=MagicMock(content="ответ"))])
+    )
+    helper = VisionHelper(client=client)
+    data = make_jpeg(3000, 2000)
+
+    await helper.analyze_image(data, prompt="Что это? Кратко")
+
+    image_url = client.chat.completions.create.call_args.kwargs["messages"][0]["content"][1]["image_url"]
+    assert image_url["detail"] == DETAIL_LOW
+    assert helper.stats()["bytes_saved"] > 0
+
+def test_preprocess_from_file_matches_bytes(tmp_path):
+    """Тест подготовки изображения из файла без чтения его в память."""
+    data = make_jpeg(3000, 2000)
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(data)
+
+    with open(path, "rb") as image_file:
+        image_file.read(10)
+        from_file = preprocess_image(image_file, detail=DETAIL_HIGH)
+
+    assert from_file == preprocess_image(data, detail=DETAIL_HIGH)
+    assert from_file.original_size == len(data)
@@ -0,0 +1,59 @@
+"""Tests for album (media group) collection."""
+import asyncio
+import pytest
+from unittest.mock import MagicMock
+from app.media_group import MediaGroupCollector
+
+def album_message(message_id, group="album-1", chat_id=1):
+    """Создает сообщение альбома."""
+    return MagicMock(message_id=message_id, media_group_id=group, chat_id=chat_id)
+
+@pytest.mark.asyncio
+async def test_first_call_gets_whole_album():
+    """Тест сбора альбома: весь альбом получает только первый вызов."""
+    collector = MediaGroupCollector(window=0.05)
+    messages = [album_message(i) for i in (3, 1, 2)]
+
+    first = asyncio.create_task(collector.collect(messages[0]))
+    await asyncio.sleep(0.01)
+    others = [await collector.collect(message) for message in messages[1:]]
+
+    assert others == [None, None]
+    assert [message.message_id for message in await first] == [1, 2, 3]
+    assert collector.stats() == {"albums": 1, "photos": 3, "pending": 0}
+
+@pytest.mark.asyncio
+async def test_albums_of_different_chats_are_separate():
+    """Тест раздельного сбора альбомов разных чатов."""
+    collector = MediaGroupCollector(window=0.02)
+
+    first, second = await asyncio.gather(
+        collector.collect(album_message(1, chat_id=1)),
+        collector.collect(album_message(1, chat_id=2)),
+    )
+
+    assert len(first) == 1 and len(second) == 1
+    assert collector.stats()["albums"] == 2
+
+@pytest.mark.asyncio
+async def test_full_album_completes_without_waiting():
+    """Тест завершения альбома сразу при достижении максимального размера."""
+    collector = MediaGroupCollector(window=10, max_items=2)
+
+    first = asyncio.create_task(collector.collect(album_message(1)))
+    await asyncio.sleep(0)
+    await collector.collect(album_message(2))
+
+    assert len(await asyncio.wait_for(first, timeout=1)) == 2
+
+@pytest.mark.asyncio
+async def test_max_wait_limits_album():
+    """Тест ограничения общего времени ожидания альбома."""
+    collector = MediaGroupCollector(window=0.05, max_wait=0.08)
+
+    first = asyncio.create_task(collector.collect(album_message(1)))
+    for message_id in range(2, 6):
+        await asyncio.sleep(0.03)
+        await collector.collect(album_message(message_id))
+
+    assert len(await first) < 5
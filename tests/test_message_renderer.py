@@ -0,0 +1,190 @@
+"""Tests for streaming message renderer."""
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from telegram.error import RetryAfter
+from app.message_renderer import DelayedStatusMessage, EditThrottle, StreamRenderer, split_text
+
+def make_reply_to():
+    """Создает сообщение пользователя, ответы на которое можно редактировать."""
+    reply_to = MagicMock()
+    sent = []
+
+    async def reply_text(text):
+        message = MagicMock()
+        message.text = text
+        message.edit_text = AsyncMock()
+        sent.append(message)
+        return message
+
+    reply_to.reply_text = AsyncMock(side_effect=reply_text)
+    return reply_to, sent
+
+async def deltas(*parts):
+    for part in parts:
+        yield part
+
+def test_split_text_prefers_line_break():
+    """Тест разбиения текста по переводу строки."""
+    text = "a" * 6 + "\n" + "b" * 6
+    assert split_text(text, 10) == 7
+
+def test_split_text_hard_cut():
+    """Тест жесткого разбиения текста без пробелов."""
+    assert split_text("x" * 20, 10) == 10
+
+@pytest.mark.asyncio
+async def test_render_edits_placeholder():
+    """Тест того, что ответ дописывается в одно сообщение-заглушку."""
+    reply_to, sent = make_reply_to()
+    renderer = StreamRenderer(reply_to, min_interval=0)
+
+    text = await renderer.render(deltas("Привет", ", ", "мир"))
+
+    assert text == "Привет, мир"
+    assert len(sent) == 1
+    assert sent[0].edit_text.call_args[0][0] == "Привет, мир"
+
+@pytest.mark.asyncio
+async def test_render_coalesces_edits():
+    """Тест объединения частых обновлений в одно редактирование."""
+    reply_to, sent = make_reply_to()
+    renderer = StreamRenderer(reply_to, min_interval=60)
+
+    await renderer.render(deltas(*["слово "] * 50))
+
+    # Первое обновление сразу, остальные объединяются до финального
+    assert sent[0].edit_text.call_count == 2
+    assert sent[0].edit_text.call_args[0][0] == "слово " * 50
+
+@pytest.mark.asyncio
+async def test_render_splits_long_answer():
+    """Тест перехода к новому сообщению при превышении лимита длины."""
+    reply_to, sent = make_reply_to()
+    renderer = StreamRenderer(reply_to, min_interval=0, limit=20)
+
+    text = await renderer.render(deltas("первая часть ", "ответа и ", "вторая часть"))
+
+    assert text == "первая часть ответа и вторая часть"
+    assert len(sent) == 2
+    assert len(sent[0].edit_text.call_args[0][0]) <= 20
+    shown = sent[0].edit_text.call_args[0][0] + sent[1].edit_text.call_args[0][0]
+    assert shown == text
+
+@pytest.mark.asyncio
+async def test_render_empty_stream_uses_fallback():
+    """Тест замены пустого ответа запасным текстом."""
+    reply_to, sent = make_reply_to()
+    renderer = StreamRenderer(reply_to, min_interval=0)
+
+    await renderer.render(deltas(), fallback="Нет ответа")
+
+    sent[0].edit_text.assert_called_once_with("Нет ответа")
+
+@pytest.mark.asyncio
+async def test_retry_after_skips_intermediate_edit():
+    """Тест пропуска промежуточного обновления при ограничении Telegram."""
+    reply_to, sent = make_reply_to()
+    renderer = StreamRenderer(reply_to, min_interval=0)
+    await renderer.start()
+    sent[0].edit_text.side_effect = [RetryAfter(0), None]
+
+    await renderer.feed("часть")
+    assert renderer.edits == 0
+
+    await renderer.finish()
+    assert renderer.edits == 1
+
+class FakeClock:
+    """Ручное время для ограничителя правок."""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.mark.asyncio
+async def test_edit_rate_shared_by_renderers_of_one_chat():
+    """Тест общего лимита правок для нескольких ответов в одном чате."""
+    clock = FakeClock()
+    throttle = EditThrottle(private_interval=1.0, clock=clock)
+    first_reply, first_sent = make_reply_to()
+    second_reply, second_sent = make_reply_to()
+    other_reply, other_sent = make_reply_to()
+    first_reply.chat = second_reply.chat = MagicMock(id=1, type="private")
+    other_reply.chat = MagicMock(id=2, type="private")
+    renderers = [StreamRenderer(reply, throttle=throttle) for reply in (first_reply, second_reply, other_reply)]
+
+    for renderer in renderers:
+        await renderer.feed("часть")
+
+    # Второй ответ того же чата ждет интервала, другой чат — нет
+    assert [renderer.edits for renderer in renderers] == [1, 0, 1]
+    clock.now += 1.0
+    await renderers[1].feed(" ответа")
+    assert renderers[1].edits == 1
+    assert throttle.stats()["throttled"] == 1
+
+def test_group_chats_edited_less_often():
+    """Тест более длинного интервала правок в группах."""
+    clock = FakeClock()
+    throttle = EditThrottle(private_interval=1.0, group_interval=3.0, clock=clock)
+
+    assert throttle.acquire(1, "private") and throttle.acquire(-100, "supergroup")
+    clock.now += 1.5
+    assert throttle.acquire(1, "private")
+    assert not throttle.acquire(-100, "supergroup")
+    # Финальный текст ответа отправляется всегда
+    assert throttle.acquire(-100, "supergroup", force=True)
+
+@pytest.mark.asyncio
+async def test_fail_keeps_partial_answer():
+    """Тест сообщения об ошибке после частично показанного ответа."""
+    reply_to, sent = make_reply_to()
+    renderer = StreamRenderer(reply_to, min_interval=0)
+    await renderer.feed("Начало ответа")
+
+    await renderer.fail("Ошибка")
+
+    assert sent[0].edit_text.call_args[0][0] == "Начало ответа"
+    assert reply_to.reply_text.call_args[0][0] == "Ошибка"
+
+@pytest.mark.asyncio
+async def test_status_not_sent_for_fast_work():
+    """Тест того, что при быстрой обработке статус не отправляется."""
+    reply_to, sent = make_reply_to()
+    status = DelayedStatusMessage(reply_to, "Анализирую...", delay=0.5)
+    status.start()
+
+    await status.finish("Кот")
+
+    assert [message.text for message in sent] == ["Кот"]
+    await asyncio.sleep(0.6)
+    assert len(sent) == 1
+
+@pytest.mark.asyncio
+async def test_status_edited_into_answer():
+    """Тест замены текста статуса ответом без удаления сообщения."""
+    reply_to, sent = make_reply_to()
+    status = DelayedStatusMessage(reply_to, "Анализирую...", delay=0.01)
+    status.start()
+    await asyncio.sleep(0.05)
+
+    await status.finish("Кот")
+
+    assert [message.text for message in sent] == ["Анализирую..."]
+    sent[0].edit_text.assert_awaited_once_with("Кот")
+
+@pytest.mark.asyncio
+async def test_status_long_answer_continues_in_new_message():
+    """Тест продолжения длинного ответа в новом сообщении."""
+    reply_to, sent = make_reply_to()
+    status = DelayedStatusMessage(reply_to, "...", delay=0, limit=10)
+    status.start()
+    await asyncio.sleep(0.01)
+
+    await status.finish("aaaaa bbbbb ccccc")
+
+    sent[0].edit_text.assert_awaited_once_with("aaaaa ")
+    assert [message.text for message in sent[1:]] == ["bbbbb ", "ccccc"]
@@ -0,0 +1,302 @@
+"""Tests for OpenAIHelper class."""
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.hedging import Hedger
+from app.openai_helper import OpenAIHelper
+from app.resilience import ResilientCaller
+from app.response_cache import ResponseCache
+from app.singleflight import SingleFlight
+
+class FakeStream:
+    """Поток ответа с интерфейсом AsyncStream поверх асинхронного генератора."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.chunks.__anext__()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        self.closed = True
+        await self.chunks.aclose()
+
+# Фикстура для мока асинхронного OpenAI клиента
+@pytest.fixture
+def mock_openai_client():
+    with patch('app.openai_helper.AsyncOpenAI') as mock_client:
+        mock_completion = AsyncMock()
+        mock_completion.return_value.choices = [
+            MagicMock(message=MagicMock(content="Тестовый ответ"))
+        ]
+        mock_client.return_value.chat.completions.create = mock_completion
+        mock_image = AsyncMock()
+        mock_image.return_value.data = [MagicMock(url="https://example.com/image.png")]
+        mock_client.return_value.images.generate = mock_image
+        yield mock_client
+
+@pytest.fixture
+def openai_helper(mock_openai_client, monkeypatch):
+    """Фикстура для создания экземпляра OpenAIHelper с моком OpenAI."""
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    return OpenAIHelper()
+
+def test_init_without_api_key(monkeypatch):
+    """Тест инициализации без API ключа."""
+    monkeypatch.delenv('OPENAI_API_KEY', raising=False)
+    with pytest.raises(ValueError):
+        OpenAIHelper()
+
+def test_init_with_client(monkeypatch):
+    """Тест инициализации с готовым клиентом не требует API ключа."""
+    monkeypatch.delenv('OPENAI_API_KEY', raising=False)
+    client = MagicMock()
+    assert OpenAIHelper(client=client).client is client
+
+@pytest.mark.asyncio
+async def test_get_chat_response(openai_helper):
+    """Тест получения ответа с системным промптом."""
+    result = await openai_helper.get_chat_response("Привет", system_prompt="Будь краток")
+
+    assert result == "Тестовый ответ"
+    call_args = openai_helper.client.chat.completions.create.call_args
+    assert call_args.kwargs['model'] == "gpt-3.5-turbo"
+    messages = call_args.kwargs['messages']
+    assert messages[0] == {"role": "system", "content": "Будь краток"}
+    assert messages[1] == {"role": "user", "content": "Привет"}
+
+@pytest.mark.asyncio
+async def test_get_chat_response_error(openai_helper, mock_openai_client):
+    """Тест обработки ошибок при получении ответа."""
+    mock_openai_client.return_value.chat.completions.create.side_effect = Exception("Test error")
+
+    with pytest.raises(Exception, match="Test error"):
+        await openai_helper.get_chat_response("Привет")
+
+@pytest.mark.asyncio
+async def test_get_chat_response_retries_transient_error(mock_openai_client, monkeypatch):
+    """Тест повтора запроса после таймаута при включенной устойчивости."""
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    create = mock_openai_client.return_value.chat.completions.create
+    response = create.return_value
+    create.side_effect = [asyncio.TimeoutError(), response]
+    helper = OpenAIHelper(resilience=ResilientCaller(base_delay=0))
+
+    result = await helper.get_chat_response("Привет")
+
+    assert result == "Тестовый ответ"
+    assert create.call_count == 2
+    assert helper.resilience.stats()["retries"] == 1
+
+@pytest.mark.asyncio
+async def test_get_chat_response_does_not_block_event_loop(openai_helper, mock_openai_client):
+    """Тест того, что параллельные запросы выполняются одновременно."""
+    async def slow_create(**kwargs):
+        await asyncio.sleep(0.05)
+        return MagicMock(choices=[MagicMock(message=MagicMock(content="ok"))])
+
+    mock_openai_client.return_value.chat.completions.create.side_effect = slow_create
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    results = await asyncio.gather(
+        *(openai_helper.get_chat_response(f"msg {i}") for i in range(10))
+    )
+    elapsed = loop.time() - started
+
+    assert results == ["ok"] * 10
+    # Последовательное выполнение заняло бы не меньше 0.5 секунды
+    assert elapsed < 0.25
+
+@pytest.mark.asyncio
+async def test_generate_image(openai_helper):
+    """Тест генерации изображения."""
+    result = await openai_helper.generate_image("закат на море")
+
+    assert result == "https://example.com/image.png"
+    call_args = openai_helper.client.images.generate.call_args
+    assert call_args.kwargs['model'] == "dall-e-3"
+    assert call_args.kwargs['prompt'] == "закат на море"
+
+@pytest.mark.asyncio
+async def test_generate_image_error(openai_helper, mock_openai_client):
+    """Тест того, что ошибка генерации передается вызывающему, а не возвращается текстом."""
+    mock_openai_client.return_value.images.generate.side_effect = Exception("Test error")
+
+    with pytest.raises(Exception, match="Test error"):
+        await openai_helper.generate_image("закат на море")
+
+@pytest.mark.asyncio
+async def test_stream_chat_response(openai_helper, mock_openai_client):
+    """Тест потоковой выдачи ответа частями."""
+    async def stream():
+        for content in ["При", None, "вет"]:
+            yield MagicMock(choices=[MagicMock(delta=MagicMock(content=content))])
+        # Последний чанк может прийти без choices
+        yield MagicMock(choices=[])
+
+    mock_openai_client.return_value.chat.completions.create.return_value = FakeStream(stream())
+
+    parts = [part async for part in openai_helper.stream_chat_response("Привет")]
+
+    assert parts == ["При", "вет"]
+    call_args = openai_helper.client.chat.completions.create.call_args
+    assert call_args.kwargs['stream'] is True
+
+@pytest.mark.asyncio
+async def test_get_chat_response_cache_opt_in(mock_openai_client, monkeypatch):
+    """Тест обслуживания повторного вопроса из кэша."""
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    helper = OpenAIHelper(cache=ResponseCache())
+
+    first = await helper.get_chat_response("Что такое Python?", use_cache=True)
+    second = await helper.get_chat_response("что такое  python?", use_cache=True)
+
+    assert first == second == "Тестовый ответ"
+    assert helper.client.chat.completions.create.call_count == 1
+    assert helper.cache.hits == 1
+
+@pytest.mark.asyncio
+async def test_get_chat_response_cache_bypass_by_default(mock_openai_client, monkeypatch):
+    """Тест того, что недетерминированные запросы по умолчанию не кэшируются."""
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    helper = OpenAIHelper(cache=ResponseCache())
+
+    await helper.get_chat_response("Привет")
+    await helper.get_chat_response("Привет")
+
+    assert helper.client.chat.completions.create.call_count == 2
+    assert len(helper.cache) == 0
+
+@pytest.mark.asyncio
+async def test_get_chat_response_errors_not_cached(mock_openai_client, monkeypatch):
+    """Тест того, что ошибки не попадают в кэш."""
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    helper = OpenAIHelper(cache=ResponseCache())
+    mock_openai_client.return_value.chat.completions.create.side_effect = Exception("Test error")
+
+    with pytest.raises(Exception, match="Test error"):
+        await helper.get_chat_response("Привет", use_cache=True)
+
+    assert len(helper.cache) == 0
+
+@pytest.mark.asyncio
+async def test_stream_chat_response_cache(mock_openai_client, monkeypatch):
+    """Тест кэширования потокового ответа целиком."""
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    helper = OpenAIHelper(cache=ResponseCache())
+
+    async def stream():
+        for content in ["При", "вет"]:
+            yield MagicMock(choices=[MagicMock(delta=MagicMock(content=content))])
+
+    mock_openai_client.return_value.chat.completions.create.return_value = FakeStream(stream())
+
+    first = [part async for part in helper.stream_chat_response("Привет", use_cache=True)]
+    second = [part async for part in helper.stream_chat_response("Привет", use_cache=True)]
+
+    assert first == ["При", "вет"]
+    assert second == ["Привет"]
+    assert helper.client.chat.completions.create.call_count == 1
+
+@pytest.mark.asyncio
+async def test_stream_chat_response_coalesces_identical_requests(mock_openai_client, monkeypatch):
+    """Тест того, что одинаковые одновременные вопросы отправляются один раз."""
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    helper = OpenAIHelper(singleflight=SingleFlight())
+    release = asyncio.Event()
+
+    async def stream():
+        await release.wait()
+        for content in ["При", "вет"]:
+            yield MagicMock(choices=[MagicMock(delta=MagicMock(content=content))])
+
+    mock_openai_client.return_value.chat.completions.create.return_value = FakeStream(stream())
+
+    async def collect():
+        return [part async for part in helper.stream_chat_response("Привет", use_cache=True)]
+
+    leader = asyncio.create_task(collect())
+    await asyncio.sleep(0)
+    followers = [asyncio.create_task(collect()) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await leader == ["При", "вет"]
+    assert [await follower for follower in followers] == [["Привет"]] * 3
+    assert helper.client.chat.completions.create.call_count == 1
+    assert helper.singleflight.coalesced == 3
+
+@pytest.mark.asyncio
+async def test_get_chat_response_coalesces_identical_requests(mock_openai_client, monkeypatch):
+    """Тест объединения одинаковых одновременных запросов без потоковой выдачи."""
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    helper = OpenAIHelper(singleflight=SingleFlight())
+
+    async def slow_create(**kwargs):
+        await asyncio.sleep(0.01)
+        return MagicMock(choices=[MagicMock(message=MagicMock(content="ok"))])
+
+    mock_openai_client.return_value.chat.completions.create.side_effect = slow_create
+
+    results = await asyncio.gather(
+        *(helper.get_chat_response("Привет", use_cache=True) for _ in range(5))
+    )
+
+    assert results == ["ok"] * 5
+    assert helper.client.chat.completions.create.call_count == 1
+
+@pytest.mark.asyncio
+async def test_get_chat_response_with_history(openai_helper):
+    """Тест передачи истории диалога между системным промптом и вопросом."""
+    history = [
+        {"role": "user", "content": "Меня зовут Анна"},
+        {"role": "assistant", "content": "Приятно познакомиться!"},
+    ]
+
+    await openai_helper.get_chat_response("Как меня зовут?", system_prompt="system", history=history)
+
+    messages = openai_helper.client.chat.completions.create.call_args.kwargs['messages']
+    assert messages[0]["role"] == "system"
+    assert messages[1:3] == history
+    assert messages[3] == {"role": "user", "content": "Как меня зовут?"}
+
+@pytest.mark.asyncio
+async def test_stream_opening_is_hedged():
+    """Тест дублирования открытия потока, если первый кусок ответа задерживается."""
+    streams = []
+
+    async def chunks(delay):
+        await asyncio.sleep(delay)
+        for content in ["При", "вет"]:
+            yield MagicMock(choices=[MagicMock(delta=MagicMock(content=content))])
+
+    async def create(**kwargs):
+        assert kwargs["stream"] is True
+        stream = FakeStream(chunks(1.0 if not streams else 0))
+        streams.append(stream)
+        return stream
+
+    client = MagicMock()
+    client.chat.completions.create = create
+    helper = OpenAIHelper(client=client, hedger=Hedger(initial_delay=0.01, min_delay=0))
+
+    parts = [part async for part in helper.stream_chat_response("Привет")]
+
+    assert parts == ["При", "вет"]
+    # Отмененная попытка закрывает свой поток в фоне
+    await asyncio.sleep(0.01)
+    assert len(streams) == 2
+    assert all(stream.closed for stream in streams)
+    assert helper.hedger.stats()["hedge_wins"] == 1
+    assert helper.hedger.outstanding == 0
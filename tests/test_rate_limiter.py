@@ -0,0 +1,230 @@
+"""Tests for rate limit header aware pacing of OpenAI calls."""
+import asyncio
+import json
+import httpx
+import pytest
+from openai import AsyncOpenAI
+from app.openai_helper import OpenAIHelper
+from app.rate_limiter import RateLimiter, estimate_request, parse_reset
+from app.vision_helper import VisionHelper
+
+class FakeClock:
+    """Ручное время для лимитера: sleep сдвигает часы вместо ожидания."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+def limit_headers(limit_requests=60, remaining_requests=59, limit_tokens=6000, remaining_tokens=5000):
+    """Возвращает заголовки лимитов в формате OpenAI."""
+    return {
+        "x-ratelimit-limit-requests": str(limit_requests),
+        "x-ratelimit-remaining-requests": str(remaining_requests),
+        "x-ratelimit-reset-requests": "1s",
+        "x-ratelimit-limit-tokens": str(limit_tokens),
+        "x-ratelimit-remaining-tokens": str(remaining_tokens),
+        "x-ratelimit-reset-tokens": "6m0s",
+    }
+
+def chat_completion(content="ответ"):
+    """Возвращает тело ответа chat completions."""
+    return {
+        "id": "chatcmpl-1",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "gpt-3.5-turbo",
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": content},
+        }],
+    }
+
+def make_client(limiter, handler):
+    """Создает AsyncOpenAI поверх локального фейкового сервера."""
+    http_client = httpx.AsyncClient(
+        transport=limiter.wrap(httpx.MockTransport(handler)),
+    )
+    return AsyncOpenAI(api_key="test-key", base_url="http://fake/v1", http_client=http_client, max_retries=0)
+
+def test_parse_reset():
+    """Тест разбора длительностей из заголовков сброса лимитов."""
+    assert parse_reset("1s") == 1.0
+    assert parse_reset("6m0s") == 360.0
+    assert parse_reset("20ms") == pytest.approx(0.02)
+    assert parse_reset("1h2m3.5s") == pytest.approx(3723.5)
+    assert parse_reset("2") == 2.0
+    assert parse_reset(None) == 0.0
+
+def test_estimate_request_counts_text_and_max_tokens():
+    """Тест оценки токенов текстового запроса."""
+    body = json.dumps({
+        "model": "gpt-3.5-turbo",
+        "messages": [{"role": "user", "content": "a" * 400}],
+        "max_tokens": 100,
+    }).encode()
+
+    assert estimate_request(body) == ("gpt-3.5-turbo", 200)
+
+def test_estimate_request_skips_image_payload():
+    """Тест того, что base64 изображения не считается текстом."""
+    body = json.dumps({
+        "messages": [{"role": "user", "content": [
+            {"type": "text", "text": "что тут?"},
+            {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64," + "A" * 400_000}},
+        ]}],
+        "model": "gpt-4o",
+        "max_tokens": 500,
+    }).encode()
+
+    model, tokens = estimate_request(body)
+
+    assert model == "gpt-4o"
+    assert tokens < 1000
+
+@pytest.mark.asyncio
+async def test_no_pacing_before_first_headers():
+    """Тест того, что без известных лимитов запросы не задерживаются."""
+    clock = FakeClock()
+    limiter = RateLimiter(clock=clock, sleep=clock.sleep)
+
+    assert await limiter.acquire("gpt-3.5-turbo", 100) == 0
+    assert clock.sleeps == []
+
+@pytest.mark.asyncio
+async def test_paces_when_requests_exhausted():
+    """Тест распределения запросов во времени при исчерпании RPM."""
+    clock = FakeClock()
+    limiter = RateLimiter(clock=clock, sleep=clock.sleep)
+    await limiter.acquire("gpt-3.5-turbo", 10)
+    limiter.update("gpt-3.5-turbo", 10, httpx.Headers(limit_headers(remaining_requests=0)))
+
+    await limiter.acquire("gpt-3.5-turbo", 10)
+    await limiter.acquire("gpt-3.5-turbo", 10)
+
+    # 60 RPM — один запрос в секунду, второй ждет дольше первого
+    assert clock.sleeps == [pytest.approx(1.0), pytest.approx(1.0)]
+    assert limiter.stats()["paced"] == 2
+
+@pytest.mark.asyncio
+async def test_paces_by_tokens():
+    """Тест ожидания пополнения бюджета токенов."""
+    clock = FakeClock()
+    limiter = RateLimiter(clock=clock, sleep=clock.sleep)
+    await limiter.acquire("gpt-4o", 100)
+    limiter.update("gpt-4o", 100, httpx.Headers(limit_headers(remaining_tokens=100)))
+
+    delay = await limiter.acquire("gpt-4o", 300)
+
+    # 6000 TPM — 100 токенов в секунду, не хватает 200
+    assert delay == pytest.approx(2.0)
+
+@pytest.mark.asyncio
+async def test_retry_after_blocks_model():
+    """Тест паузы после 429 на время из retry-after."""
+    clock = FakeClock()
+    limiter = RateLimiter(clock=clock, sleep=clock.sleep)
+    await limiter.acquire("gpt-4o", 10)
+    headers = dict(limit_headers(remaining_requests=30), **{"retry-after": "5"})
+    limiter.update("gpt-4o", 10, httpx.Headers(headers), status_code=429)
+
+    delay = await limiter.acquire("gpt-4o", 10)
+
+    assert delay >= 5
+    assert limiter.stats()["rate_limited"] == 1
+    # Другие модели не затронуты
+    assert await limiter.acquire("gpt-3.5-turbo", 10) == 0
+
+@pytest.mark.asyncio
+async def test_chat_path_against_fake_server():
+    """Тест обучения лимитера по заголовкам ответа на пути чата."""
+    clock = FakeClock()
+    limiter = RateLimiter(clock=clock, sleep=clock.sleep)
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json=chat_completion(), headers=limit_headers(remaining_requests=0))
+
+    helper = OpenAIHelper(client=make_client(limiter, handler))
+
+    assert await helper.get_chat_response("привет") == "ответ"
+    assert await helper.get_chat_response("еще") == "ответ"
+
+    assert len(requests) == 2
+    assert clock.sleeps == [pytest.approx(1.0)]
+    assert limiter.stats()["gpt-3.5-turbo_requests_left"] == 0
+
+@pytest.mark.asyncio
+async def test_vision_path_against_fake_server():
+    """Тест того, что запросы vision проходят через тот же лимитер."""
+    clock = FakeClock()
+    limiter = RateLimiter(clock=clock, sleep=clock.sleep)
+
+    def handler(request):
+        return httpx.Response(200, json=chat_completion("кот"), headers=limit_headers(remaining_tokens=0))
+
+    helper = VisionHelper(client=make_client(limiter, handler))
+
+    assert await helper.analyze_image(b"x" * 300_000) == "кот"
+    await helper.analyze_image(b"x" * 300_000)
+
+    assert "gpt-4o_tokens_left" in limiter.stats()
+    assert limiter.stats()["paced"] == 1
+
+@pytest.mark.asyncio
+async def test_failed_requests_release_reservation():
+    """Тест возврата резерва запросами, не получившими ответа."""
+    clock = FakeClock()
+    limiter = RateLimiter(clock=clock, sleep=clock.sleep)
+
+    def handler(request):
+        raise httpx.ConnectError("нет соединения", request=request)
+
+    helper = OpenAIHelper(client=make_client(limiter, handler))
+    for _ in range(20):
+        with pytest.raises(Exception):
+            await helper.complete([{"role": "user", "content": "привет"}], max_tokens=500)
+
+    stats = limiter.stats()
+    assert stats["gpt-3.5-turbo_pending_requests"] == 0
+    assert stats["gpt-3.5-turbo_pending_tokens"] == 0
+
+@pytest.mark.asyncio
+async def test_cancelled_requests_release_reservation():
+    """Тест возврата резерва отмененным запросом: в пути и в ожидании очереди."""
+    clock = FakeClock()
+    limiter = RateLimiter(clock=clock)
+    await limiter.acquire("gpt-4o", 10)
+    limiter.update("gpt-4o", 10, httpx.Headers(limit_headers(remaining_requests=1)))
+    started = asyncio.Event()
+
+    async def handler(request):
+        started.set()
+        await asyncio.sleep(10)
+
+    client = make_client(limiter, handler)
+    # Первый запрос ждет ответа сервера, второй — своей очереди у лимитера
+    in_flight = asyncio.create_task(client.chat.completions.create(
+        model="gpt-4o", messages=[{"role": "user", "content": "a"}], max_tokens=10
+    ))
+    await started.wait()
+    waiting = asyncio.create_task(client.chat.completions.create(
+        model="gpt-4o", messages=[{"role": "user", "content": "b"}], max_tokens=10
+    ))
+    await asyncio.sleep(0.01)
+    assert limiter.stats()["gpt-4o_pending_requests"] == 2
+
+    in_flight.cancel()
+    waiting.cancel()
+    await asyncio.gather(in_flight, waiting, return_exceptions=True)
+
+    assert limiter.stats()["gpt-4o_pending_requests"] == 0
+    assert limiter.stats()["gpt-4o_pending_tokens"] == 0
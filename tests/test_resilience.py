@@ -0,0 +1,202 @@
+"""Tests for retries and circuit breaking of OpenAI calls."""
+import asyncio
+import httpx
+import openai
+import pytest
+from app.resilience import CLOSED, HALF_OPEN, OPEN, CircuitOpenError, ResilientCaller, is_retryable, retry_after
+
+REQUEST = httpx.Request("POST", "http://fake/v1/chat/completions")
+
+class FakeClock:
+    """Ручное время: sleep сдвигает часы вместо ожидания."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+def status_error(cls, status, headers=None, body=None):
+    """Создает ошибку OpenAI с заданным HTTP статусом."""
+    response = httpx.Response(status, headers=headers, request=REQUEST)
+    return cls("error", response=response, body=body)
+
+def make_caller(clock, **kwargs):
+    """Создает ResilientCaller с ручным временем."""
+    kwargs.setdefault("base_delay", 1.0)
+    return ResilientCaller(clock=clock, sleep=clock.sleep, **kwargs)
+
+def failing(*errors, result="ok"):
+    """Возвращает фабрику вызовов, падающих с заданными ошибками, затем успешных."""
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    factory.calls = calls
+    return factory
+
+def test_is_retryable():
+    """Тест классификации ошибок."""
+    assert is_retryable(status_error(openai.RateLimitError, 429))
+    assert is_retryable(status_error(openai.InternalServerError, 503))
+    assert is_retryable(openai.APITimeoutError(request=REQUEST))
+    assert is_retryable(openai.APIConnectionError(request=REQUEST))
+    assert not is_retryable(status_error(openai.BadRequestError, 400))
+    assert not is_retryable(status_error(openai.AuthenticationError, 401))
+    assert not is_retryable(
+        status_error(openai.RateLimitError, 429, body={"code": "insufficient_quota"})
+    )
+
+def test_retry_after():
+    """Тест чтения паузы из заголовков ответа."""
+    assert retry_after(status_error(openai.RateLimitError, 429, {"retry-after": "3"})) == 3.0
+    assert retry_after(status_error(openai.RateLimitError, 429, {"retry-after-ms": "250"})) == 0.25
+    assert retry_after(Exception()) == 0.0
+
+@pytest.mark.asyncio
+async def test_retries_transient_errors():
+    """Тест повтора временных ошибок с нарастающей паузой."""
+    clock = FakeClock()
+    caller = make_caller(clock)
+    factory = failing(
+        status_error(openai.InternalServerError, 500),
+        openai.APITimeoutError(request=REQUEST),
+    )
+
+    assert await caller.call("gpt-4o", factory) == "ok"
+
+    assert len(factory.calls) == 3
+    assert caller.stats()["retries"] == 2
+    # Полный джиттер: пауза не больше потолка экспоненты
+    assert 0 <= clock.sleeps[0] <= 1.0
+    assert 0 <= clock.sleeps[1] <= 2.0
+
+@pytest.mark.asyncio
+async def test_client_errors_are_not_retried():
+    """Тест того, что ошибки запроса не повторяются."""
+    clock = FakeClock()
+    caller = make_caller(clock)
+    factory = failing(status_error(openai.BadRequestError, 400))
+
+    with pytest.raises(openai.BadRequestError):
+        await caller.call("gpt-4o", factory)
+
+    assert len(factory.calls) == 1
+    assert caller.breaker("gpt-4o").failures == 0
+
+@pytest.mark.asyncio
+async def test_honours_retry_after():
+    """Тест ожидания не меньше retry-after при 429."""
+    clock = FakeClock()
+    caller = make_caller(clock)
+    factory = failing(status_error(openai.RateLimitError, 429, {"retry-after": "4"}))
+
+    await caller.call("gpt-4o", factory)
+
+    assert clock.sleeps == [4.0]
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_retries():
+    """Тест отказа после исчерпания числа повторов."""
+    clock = FakeClock()
+    caller = make_caller(clock, max_retries=2, failure_threshold=100)
+    error = status_error(openai.InternalServerError, 502)
+    factory = failing(error, error, error, error)
+
+    with pytest.raises(openai.InternalServerError):
+        await caller.call("gpt-4o", factory)
+
+    assert len(factory.calls) == 3
+    assert caller.stats()["failed"] == 1
+
+@pytest.mark.asyncio
+async def test_budget_stops_retries():
+    """Тест того, что повтор, не укладывающийся в бюджет, не запускается."""
+    clock = FakeClock()
+    caller = make_caller(clock, budget=10.0)
+    factory = failing(status_error(openai.RateLimitError, 429, {"retry-after": "30"}))
+
+    with pytest.raises(openai.RateLimitError):
+        await caller.call("gpt-4o", factory)
+
+    assert clock.sleeps == []
+    assert len(factory.calls) == 1
+
+@pytest.mark.asyncio
+async def test_budget_limits_slow_attempt():
+    """Тест прерывания попытки, которая не укладывается в бюджет."""
+    caller = ResilientCaller(budget=0.05)
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await caller.call("gpt-4o", slow)
+
+@pytest.mark.asyncio
+async def test_circuit_opens_and_fails_fast():
+    """Тест быстрого отказа при открытом размыкателе."""
+    clock = FakeClock()
+    caller = make_caller(clock, max_retries=0, failure_threshold=2, reset_timeout=30)
+    error = status_error(openai.InternalServerError, 503)
+
+    for _ in range(2):
+        with pytest.raises(openai.InternalServerError):
+            await caller.call("gpt-4o", failing(error))
+    assert caller.breaker("gpt-4o").state == OPEN
+
+    factory = failing()
+    with pytest.raises(CircuitOpenError):
+        await caller.call("gpt-4o", factory)
+    assert factory.calls == []
+    assert caller.stats()["rejected"] == 1
+    assert caller.stats()["circuit_opens"] == 1
+
+    # Размыкатель другой модели не затронут
+    assert await caller.call("gpt-3.5-turbo", failing()) == "ok"
+
+@pytest.mark.asyncio
+async def test_circuit_half_open_probe():
+    """Тест пробного запроса после паузы и закрытия размыкателя."""
+    clock = FakeClock()
+    caller = make_caller(clock, max_retries=0, failure_threshold=1, reset_timeout=30)
+    with pytest.raises(openai.InternalServerError):
+        await caller.call("gpt-4o", failing(status_error(openai.InternalServerError, 500)))
+
+    clock.now += 31
+    breaker = caller.breaker("gpt-4o")
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # Пока идет пробный запрос, остальные отклоняются
+    assert not breaker.allow()
+    breaker.record_success()
+
+    assert breaker.state == CLOSED
+    assert await caller.call("gpt-4o", failing()) == "ok"
+
+@pytest.mark.asyncio
+async def test_failed_probe_reopens_circuit():
+    """Тест повторного открытия размыкателя при неудачной пробе."""
+    clock = FakeClock()
+    caller = make_caller(clock, max_retries=0, failure_threshold=1, reset_timeout=30)
+    error = status_error(openai.InternalServerError, 500)
+    with pytest.raises(openai.InternalServerError):
+        await caller.call("gpt-4o", failing(error))
+
+    clock.now += 31
+    with pytest.raises(openai.InternalServerError):
+        await caller.call("gpt-4o", failing(error))
+
+    with pytest.raises(CircuitOpenError):
+        await caller.call("gpt-4o", failing())
+    # Неудачная проба не считается новым открытием
+    assert caller.stats()["circuit_opens"] == 1
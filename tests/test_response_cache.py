@@ -0,0 +1,92 @@
+"""Tests for response cache."""
+import pytest
+from app.response_cache import ResponseCache, make_cache_key, normalize_text
+
+class FakeClock:
+    """Управляемые тестом часы."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_normalize_text():
+    """Тест нормализации регистра и пробелов."""
+    assert normalize_text("  Что такое\n  Python? ") == "что такое python?"
+    assert normalize_text(None) == ""
+
+def test_make_cache_key_normalizes_strings():
+    """Тест того, что ключ не зависит от регистра и пробелов."""
+    first = make_cache_key("system", "Что такое Python?", "gpt-3.5-turbo", 0.7, 1000)
+    second = make_cache_key("System", "что  такое python?", "gpt-3.5-turbo", 0.7, 1000)
+    other_model = make_cache_key("system", "Что такое Python?", "gpt-4o", 0.7, 1000)
+
+    assert first == second
+    assert first != other_model
+
+def test_get_and_set():
+    """Тест сохранения значения и подсчета попаданий."""
+    cache = ResponseCache()
+
+    assert cache.get("key") is None
+    cache.set("key", "value")
+    assert cache.get("key") == "value"
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+
+def test_ttl_expiration():
+    """Тест истечения срока жизни записи."""
+    clock = FakeClock()
+    cache = ResponseCache(ttl=10, clock=clock)
+    cache.set("key", "value")
+
+    clock.now = 9.9
+    assert cache.get("key") == "value"
+    clock.now = 10
+    assert cache.get("key") is None
+    assert len(cache) == 0
+    assert cache.size_bytes == 0
+
+def test_lru_eviction_by_entries():
+    """Тест вытеснения давно не использованных записей."""
+    cache = ResponseCache(max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+
+    assert cache.get("a") == "1"
+    assert cache.get("b") is None
+    assert cache.get("c") == "3"
+    assert cache.evictions == 1
+
+def test_eviction_by_bytes():
+    """Тест ограничения суммарного размера в байтах."""
+    cache = ResponseCache(max_bytes=30)
+    cache.set("a", "x" * 10)
+    cache.set("b", "y" * 10)
+    cache.set("c", "z" * 10)
+
+    assert cache.size_bytes <= 30
+    assert cache.get("a") is None
+    assert cache.get("c") == "z" * 10
+
+def test_oversized_value_not_stored():
+    """Тест того, что слишком большое значение не попадает в кэш."""
+    cache = ResponseCache(max_bytes=10)
+    cache.set("a", "x" * 100)
+
+    assert len(cache) == 0
+
+def test_overwrite_updates_size():
+    """Тест перезаписи значения по тому же ключу."""
+    cache = ResponseCache()
+    cache.set("a", "x" * 10)
+    cache.set("a", "y")
+
+    assert cache.get("a") == "y"
+    assert cache.size_bytes == len("a") + 1
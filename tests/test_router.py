@@ -0,0 +1,137 @@
+"""Tests for model routing."""
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from app.openai_helper import OpenAIHelper
+from app.response_cache import ResponseCache
+from app.router import ModelRouter, estimate_complexity
+from app.vision_helper import VisionHelper
+
+class FakeClock:
+    """Ручное время для маршрутизатора."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def make_client(content="ответ"):
+    """Создает мок клиента OpenAI."""
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(
+        return_value=MagicMock(choices=[MagicMock(message=MagicMock(content=content))])
+    )
+    client.images.generate = AsyncMock(return_value=MagicMock(data=[MagicMock(url="https://example.com/1.png")]))
+    return client
+
+def test_complexity_heuristic():
+    """Тест оценки сложности запроса."""
+    assert estimate_complexity("Какая столица Франции?") < 0.2
+    assert estimate_complexity("Объясни пошагово, почему алгоритм Дейкстры не работает с отрицательными весами") >= 0.5
+    assert estimate_complexity("Почему падает?\n```\ndef f(x):\n    return x / 0\n```") >= 0.5
+    assert estimate_complexity("a" * 2000) == pytest.approx(0.4)
+
+def test_simple_query_goes_to_fast_model():
+    """Тест маршрутизации простого вопроса на быструю модель."""
+    router = ModelRouter(fast_models=["mini"], strong_models=["big"])
+
+    assert router.route_chat("Сколько дней в неделе?") == "mini"
+    assert router.route_chat("Сравни и объясни подходы к кэшированию в распределенных системах") == "big"
+    assert router.stats()["routed_fast"] == 1
+    assert router.stats()["routed_strong"] == 1
+
+def test_policy_pins_tier():
+    """Тест политики развертывания, закрепляющей уровень."""
+    router = ModelRouter(fast_models=["mini"], strong_models=["big"], policy="fast")
+    assert router.route_chat("Объясни пошагово, почему небо голубое") == "mini"
+
+    router = ModelRouter(fast_models=["mini"], strong_models=["big"], policy="strong")
+    assert router.route_chat("Привет") == "big"
+
+    with pytest.raises(ValueError):
+        ModelRouter(policy="cheap")
+
+def test_lowest_latency_model_in_tier():
+    """Тест выбора самой быстрой модели уровня."""
+    router = ModelRouter(fast_models=["a", "b"])
+    router.observe("a", 2.0, ok=True)
+    router.observe("b", 0.5, ok=True)
+
+    assert router.route_chat("Привет") == "b"
+
+def test_failing_model_is_avoided_and_recovers():
+    """Тест обхода сбоящей модели и возврата к ней со временем."""
+    clock = FakeClock()
+    router = ModelRouter(fast_models=["a", "b"], error_half_life=10, clock=clock)
+    router.observe("a", 0.1, ok=True)
+    router.observe("b", 1.0, ok=True)
+    for _ in range(5):
+        router.observe("a", 0.1, ok=False)
+
+    assert router.route_chat("Привет") == "b"
+
+    clock.now += 60
+    assert router.route_chat("Привет") == "a"
+
+def test_fallback_to_other_tier():
+    """Тест перехода на другой уровень, если весь уровень сбоит."""
+    router = ModelRouter(fast_models=["mini"], strong_models=["big"])
+    router.observe("big", 1.0, ok=True)
+    for _ in range(5):
+        router.observe("mini", 0.1, ok=False)
+
+    assert router.route_chat("Привет") == "big"
+
+@pytest.mark.asyncio
+async def test_openai_helper_routes_and_reports():
+    """Тест выбора модели и сбора статистики в OpenAIHelper."""
+    client = make_client()
+    router = ModelRouter(fast_models=["mini"], strong_models=["big"], image_models=["painter"])
+    helper = OpenAIHelper(client=client, router=router)
+
+    await helper.get_chat_response("Привет")
+    assert client.chat.completions.create.call_args.kwargs["model"] == "mini"
+
+    await helper.get_chat_response("Привет", model="big")
+    assert client.chat.completions.create.call_args.kwargs["model"] == "big"
+
+    await helper.generate_image("кот")
+    assert client.images.generate.call_args.kwargs["model"] == "painter"
+
+    assert "mini_latency" in router.stats()
+    assert "painter_latency" in router.stats()
+
+@pytest.mark.asyncio
+async def test_client_errors_do_not_mark_model_unhealthy():
+    """Тест того, что ошибка самого запроса не портит статистику модели."""
+    client = make_client()
+    client.chat.completions.create.side_effect = ValueError("bad request")
+    router = ModelRouter(fast_models=["mini"])
+    helper = OpenAIHelper(client=client, router=router)
+
+    with pytest.raises(ValueError):
+        await helper.get_chat_response("Привет")
+
+    assert "mini_error_rate" not in router.stats()
+
+@pytest.mark.asyncio
+async def test_cache_key_depends_on_model():
+    """Тест того, что ответы разных моделей кэшируются раздельно."""
+    client = make_client()
+    helper = OpenAIHelper(client=client, cache=ResponseCache())
+
+    await helper.get_chat_response("Привет", use_cache=True, model="mini")
+    await helper.get_chat_response("Привет", use_cache=True, model="big")
+    await helper.get_chat_response("Привет", use_cache=True, model="mini")
+
+    assert client.chat.completions.create.call_count == 2
+
+@pytest.mark.asyncio
+async def test_vision_helper_routes():
+    """Тест выбора модели анализа изображений."""
+    client = make_client()
+    helper = VisionHelper(client=client, router=ModelRouter(vision_models=["eyes"]))
+
+    await helper.analyze_image(b"image")
+
+    assert client.chat.completions.create.call_args.kwargs["model"] == "eyes"
@@ -0,0 +1,144 @@
+"""Tests for fair scheduler of LLM calls."""
+import asyncio
+import pytest
+from app.scheduler import LLMScheduler, QueueFullError
+
+async def hold(scheduler, user_id, started, release, cost=1.0, weight=1.0):
+    """Занимает слот до сигнала release и записывает порядок запуска."""
+    async with scheduler.slot(user_id, weight=weight, cost=cost):
+        started.append(user_id)
+        await release.wait()
+
+@pytest.mark.asyncio
+async def test_global_limit():
+    """Тест глобального ограничения числа одновременных вызовов."""
+    scheduler = LLMScheduler(max_concurrency=2, per_user_limit=10)
+    started = []
+    release = asyncio.Event()
+
+    tasks = [asyncio.create_task(hold(scheduler, user, started, release)) for user in range(5)]
+    await asyncio.sleep(0)
+
+    assert len(started) == 2
+    assert scheduler.stats()["queued"] == 3
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert len(started) == 5
+    assert scheduler.in_flight == 0
+    assert scheduler.queued == 0
+
+@pytest.mark.asyncio
+async def test_per_user_limit():
+    """Тест ограничения числа одновременных вызовов одного пользователя."""
+    scheduler = LLMScheduler(max_concurrency=10, per_user_limit=1)
+    started = []
+    release = asyncio.Event()
+
+    tasks = [asyncio.create_task(hold(scheduler, "spammer", started, release)) for _ in range(3)]
+    tasks.append(asyncio.create_task(hold(scheduler, "other", started, release)))
+    await asyncio.sleep(0)
+
+    # Второй пользователь не ждет, пока обслужат все запросы первого
+    assert started == ["spammer", "other"]
+
+    release.set()
+    await asyncio.gather(*tasks)
+
+@pytest.mark.asyncio
+async def test_fair_order_between_users():
+    """Тест чередования пользователей при перегрузке."""
+    scheduler = LLMScheduler(max_concurrency=1, per_user_limit=1)
+    started = []
+    gate = asyncio.Event()
+    blocker = asyncio.create_task(hold(scheduler, "blocker", started, gate))
+    await asyncio.sleep(0)
+
+    releases = []
+    tasks = []
+    for user in ["a", "a", "a", "b", "b", "b"]:
+        release = asyncio.Event()
+        releases.append(release)
+        tasks.append(asyncio.create_task(hold(scheduler, user, started, release)))
+    await asyncio.sleep(0)
+
+    gate.set()
+    await blocker
+    for release in releases:
+        release.set()
+    await asyncio.gather(*tasks)
+
+    assert started[1:] == ["a", "b", "a", "b", "a", "b"]
+
+@pytest.mark.asyncio
+async def test_weights_give_proportional_share():
+    """Тест того, что вес пользователя увеличивает его долю слотов."""
+    scheduler = LLMScheduler(max_concurrency=1, per_user_limit=1)
+    started = []
+    gate = asyncio.Event()
+    blocker = asyncio.create_task(hold(scheduler, "blocker", started, gate))
+    await asyncio.sleep(0)
+
+    release = asyncio.Event()
+    release.set()
+    tasks = [asyncio.create_task(hold(scheduler, "heavy", started, release, weight=2.0)) for _ in range(4)]
+    tasks += [asyncio.create_task(hold(scheduler, "light", started, release)) for _ in range(2)]
+    await asyncio.sleep(0)
+
+    gate.set()
+    await asyncio.gather(blocker, *tasks)
+
+    assert started[1:4].count("heavy") == 2
+
+@pytest.mark.asyncio
+async def test_queue_full():
+    """Тест отказа при переполнении очереди пользователя."""
+    scheduler = LLMScheduler(max_concurrency=1, per_user_limit=1, max_queue_per_user=1)
+    started = []
+    release = asyncio.Event()
+    first = asyncio.create_task(hold(scheduler, 1, started, release))
+    second = asyncio.create_task(hold(scheduler, 1, started, release))
+    await asyncio.sleep(0)
+
+    with pytest.raises(QueueFullError):
+        await scheduler.acquire(1)
+    assert scheduler.stats()["rejected"] == 1
+
+    release.set()
+    await asyncio.gather(first, second)
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_queue():
+    """Тест удаления отмененного запроса из очереди."""
+    scheduler = LLMScheduler(max_concurrency=1)
+    started = []
+    release = asyncio.Event()
+    running = asyncio.create_task(hold(scheduler, 1, started, release))
+    waiting = asyncio.create_task(hold(scheduler, 2, started, release))
+    await asyncio.sleep(0)
+
+    waiting.cancel()
+    await asyncio.gather(waiting, return_exceptions=True)
+    assert scheduler.queued == 0
+
+    release.set()
+    await running
+    assert scheduler.in_flight == 0
+    assert started == [1]
+
+@pytest.mark.asyncio
+async def test_wait_metrics():
+    """Тест метрик времени ожидания в очереди."""
+    scheduler = LLMScheduler(max_concurrency=1)
+    started = []
+    release = asyncio.Event()
+    first = asyncio.create_task(hold(scheduler, 1, started, release))
+    second = asyncio.create_task(hold(scheduler, 2, started, release))
+    await asyncio.sleep(0.02)
+    release.set()
+    await asyncio.gather(first, second)
+
+    stats = scheduler.stats()
+    assert stats["granted"] == 2
+    assert stats["peak_queued"] == 1
+    assert stats["wait_max"] >= 0.02
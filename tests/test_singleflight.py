@@ -0,0 +1,122 @@
+"""Tests for coalescing of identical concurrent requests."""
+import asyncio
+import pytest
+from app.singleflight import FlightCancelled, SingleFlight
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_request():
+    """Тест того, что одинаковые запросы выполняются один раз."""
+    flight = SingleFlight()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "ответ"
+
+    results = await asyncio.gather(*(flight.do("key", fetch) for _ in range(10)))
+
+    assert results == ["ответ"] * 10
+    assert calls == 1
+    assert flight.coalesced == 9
+    assert flight.stats()["in_flight"] == 0
+
+@pytest.mark.asyncio
+async def test_different_keys_not_coalesced():
+    """Тест того, что разные запросы не объединяются."""
+    flight = SingleFlight()
+
+    async def fetch(value):
+        await asyncio.sleep(0)
+        return value
+
+    results = await asyncio.gather(flight.do("a", lambda: fetch(1)), flight.do("b", lambda: fetch(2)))
+
+    assert results == [1, 2]
+    assert flight.coalesced == 0
+
+@pytest.mark.asyncio
+async def test_error_propagates_to_all_waiters():
+    """Тест передачи ошибки всем ожидающим."""
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream")
+
+    results = await asyncio.gather(
+        *(flight.do("key", fetch) for _ in range(3)), return_exceptions=True
+    )
+
+    assert all(isinstance(result, ValueError) for result in results)
+    # После ошибки следующий вызов выполняет новый запрос
+    assert not flight.pending("key")
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_cancel_others():
+    """Тест того, что отмена одного ожидающего не влияет на остальных."""
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def fetch():
+        await release.wait()
+        return "ответ"
+
+    first = asyncio.create_task(flight.do("key", fetch))
+    second = asyncio.create_task(flight.do("key", fetch))
+    await asyncio.sleep(0)
+
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await second == "ответ"
+    assert first.cancelled()
+
+@pytest.mark.asyncio
+async def test_last_waiter_cancels_upstream():
+    """Тест отмены общего запроса, когда его больше никто не ждет."""
+    flight = SingleFlight()
+    upstream_cancelled = asyncio.Event()
+
+    async def fetch():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            upstream_cancelled.set()
+            raise
+
+    waiter = asyncio.create_task(flight.do("key", fetch))
+    await asyncio.sleep(0)
+    waiter.cancel()
+
+    await asyncio.wait_for(upstream_cancelled.wait(), timeout=1)
+    await asyncio.sleep(0)
+    assert not flight.pending("key")
+
+@pytest.mark.asyncio
+async def test_lead_and_join():
+    """Тест ожидания результата запроса, выполняемого владельцем."""
+    flight = SingleFlight()
+    future = flight.lead("key")
+
+    waiter = asyncio.create_task(flight.join("key"))
+    await asyncio.sleep(0)
+    future.set_result("ответ")
+
+    assert await waiter == "ответ"
+    assert flight.coalesced == 1
+
+@pytest.mark.asyncio
+async def test_join_cancelled_flight():
+    """Тест ошибки у ожидающих, если владелец отменил запрос."""
+    flight = SingleFlight()
+    future = flight.lead("key")
+
+    waiter = asyncio.create_task(flight.join("key"))
+    await asyncio.sleep(0)
+    future.cancel()
+
+    with pytest.raises(FlightCancelled):
+        await waiter
@@ -0,0 +1,135 @@
+"""Tests for background conversation summarization."""
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from app.conversation import ConversationStore, SUMMARY_PREFIX
+from app.summarizer import ConversationSummarizer, format_transcript
+
+def make_store(turns):
+    """Создает хранилище с заданным числом реплик в чате 1."""
+    store = ConversationStore()
+    for i in range(turns):
+        store.append(1, "user" if i % 2 == 0 else "assistant", f"реплика {i}")
+    return store
+
+def make_helper(summary="краткое содержание"):
+    """Создает мок OpenAIHelper для запросов сжатия."""
+    helper = MagicMock()
+    helper.complete = AsyncMock(return_value=summary)
+    return helper
+
+def test_format_transcript():
+    """Тест формирования текста для сжатия."""
+    store = make_store(2)
+
+    text = format_transcript("раньше", store.turns(1))
+
+    assert "Предыдущее краткое содержание: раньше" in text
+    assert "Пользователь: реплика 0" in text
+    assert "Ассистент: реплика 1" in text
+
+@pytest.mark.asyncio
+async def test_summarize_folds_old_turns():
+    """Тест замены старых реплик кратким содержанием."""
+    store = make_store(10)
+    summarizer = ConversationSummarizer(store, make_helper(), keep_recent=4)
+
+    await summarizer.summarize(1)
+
+    assert [turn.content for turn in store.turns(1)] == [f"реплика {i}" for i in range(6, 10)]
+    assert store.summary(1) == "краткое содержание"
+    history = store.build_history(1, "вопрос")
+    assert history[0] == {"role": "system", "content": SUMMARY_PREFIX + "краткое содержание"}
+    assert len(history) == 5
+
+@pytest.mark.asyncio
+async def test_summarize_keeps_turns_added_meanwhile():
+    """Тест того, что реплики, добавленные во время сжатия, не теряются."""
+    store = make_store(10)
+    helper = make_helper()
+
+    async def complete(*args, **kwargs):
+        store.append(1, "user", "новая реплика")
+        return "краткое содержание"
+
+    helper.complete.side_effect = complete
+    summarizer = ConversationSummarizer(store, helper, keep_recent=4)
+
+    await summarizer.summarize(1)
+
+    contents = [turn.content for turn in store.turns(1)]
+    assert contents[-1] == "новая реплика"
+    assert len(contents) == 5
+
+@pytest.mark.asyncio
+async def test_previous_summary_is_included():
+    """Тест инкрементального объединения с предыдущим содержанием."""
+    store = make_store(10)
+    store.fold(1, [], "старое содержание")
+    helper = make_helper()
+    summarizer = ConversationSummarizer(store, helper, keep_recent=4)
+
+    await summarizer.summarize(1)
+
+    transcript = helper.complete.call_args[0][0][1]["content"]
+    assert "старое содержание" in transcript
+
+@pytest.mark.asyncio
+async def test_maybe_schedule_threshold():
+    """Тест запуска сжатия только после порога."""
+    store = make_store(5)
+    summarizer = ConversationSummarizer(store, make_helper(), threshold=6, keep_recent=2)
+
+    assert not summarizer.maybe_schedule(1)
+    store.append(1, "user", "еще одна")
+    assert summarizer.maybe_schedule(1)
+    # Повторный запуск для того же чата не создается
+    assert not summarizer.maybe_schedule(1)
+
+    await asyncio.gather(*summarizer._tasks)
+    assert summarizer.stats()["completed"] == 1
+    assert len(store.turns(1)) == 2
+
+@pytest.mark.asyncio
+async def test_failed_summary_keeps_history():
+    """Тест того, что при ошибке история не изменяется."""
+    store = make_store(12)
+    helper = make_helper()
+    helper.complete.side_effect = Exception("upstream")
+    summarizer = ConversationSummarizer(store, helper, threshold=12)
+
+    assert summarizer.maybe_schedule(1)
+    await asyncio.gather(*summarizer._tasks)
+
+    assert len(store.turns(1)) == 12
+    assert summarizer.stats()["failed"] == 1
+    assert summarizer.stats()["running"] == 0
+
+@pytest.mark.asyncio
+async def test_concurrency_limit():
+    """Тест ограничения числа одновременных запросов сжатия."""
+    store = ConversationStore()
+    for chat_id in range(5):
+        for i in range(4):
+            store.append(chat_id, "user", f"реплика {i}")
+    active = 0
+    peak = 0
+
+    async def complete(*args, **kwargs):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return "содержание"
+
+    helper = make_helper()
+    helper.complete.side_effect = complete
+    summarizer = ConversationSummarizer(store, helper, threshold=4, keep_recent=1, max_concurrency=2)
+
+    for chat_id in range(5):
+        summarizer.maybe_schedule(chat_id)
+    await asyncio.gather(*summarizer._tasks)
+
+    assert peak == 2
+    assert summarizer.stats()["completed"] == 5
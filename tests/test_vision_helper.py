@@ -2,7 +2,8 @@
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 import base64
-from app.vision_helper import VisionHelper
+from app.disk_cache import DiskImageCache
+from app.vision_helper import ANSWERS_FORMAT, NO_ANSWER, VisionHelper, parse_answers, split_questions
 
 # Фикстура для мока OpenAI клиента
 @pytest.fixture
@@ -95,3 +96,81 @@ async def test_analyze_image_base64_encoding(vision_helper):
         assert decoded == test_image
     except Exception as e:
         pytest.fail(f"Invalid base64 encoding: {e}")
+
+@pytest.mark.asyncio
+async def test_analyze_images_sends_one_request(vision_helper):
+    """Тест анализа альбома одним запросом с несколькими изображениями."""
+    result = await vision_helper.analyze_images(
+        [b"first", b"second", b"third"], prompt="Что общего?", detail=["low", "high", "low"]
+    )
+
+    assert result == "Тестовый ответ"
+    create = vision_helper.client.chat.completions.create
+    assert create.await_count == 1
+    content = create.call_args.kwargs['messages'][0]['content']
+    assert content[0] == {"type": "text", "text": "Что общего?"}
+    assert [part['image_url']['detail'] for part in content[1:]] == ["low", "high", "low"]
+    assert content[2]['image_url']['url'] == "data:image/jpeg;base64," + base64.b64encode(b"second").decode()
+    assert create.call_args.kwargs['max_tokens'] == 1000
+    assert vision_helper.stats()['images'] == 3
+
+def test_split_questions():
+    """Тест разбиения подписи на отдельные вопросы."""
+    assert split_questions(None) == []
+    assert split_questions("Что на фото?") == ["Что на фото?"]
+    assert split_questions("Опиши фото. Подробно") == ["Опиши фото. Подробно"]
+    assert split_questions("Что это? Какого цвета машина?  Сколько людей?") == [
+        "Что это?", "Какого цвета машина?", "Сколько людей?"
+    ]
+    assert split_questions("Где снято?\nКакое время года?") == ["Где снято?", "Какое время года?"]
+
+def test_parse_answers_pads_and_truncates():
+    """Тест разбора JSON-ответа: недостающие ответы заполняются, лишние отбрасываются."""
+    assert parse_answers('{"answers": ["Кот", ""]}', 3) == ["Кот", NO_ANSWER, NO_ANSWER]
+    assert parse_answers('{"answers": ["a", "b", "c"]}', 2) == ["a", "b"]
+    with pytest.raises(ValueError):
+        parse_answers('{"text": "Кот"}', 1)
+
+@pytest.mark.asyncio
+async def test_answer_questions_single_structured_request(vision_helper):
+    """Тест ответа на несколько вопросов одним запросом со структурированным ответом."""
+    create = vision_helper.client.chat.completions.create
+    create.return_value.choices = [
+        MagicMock(message=MagicMock(content='{"answers": ["Кот", "Рыжий"]}'))
+    ]
+
+    answers = await vision_helper.answer_questions(b"image", ["Кто это?", "Какого цвета?"])
+
+    assert answers == ["Кот", "Рыжий"]
+    assert create.await_count == 1
+    kwargs = create.call_args.kwargs
+    assert kwargs['response_format'] == ANSWERS_FORMAT
+    text = kwargs['messages'][0]['content'][0]['text']
+    assert "1. Кто это?\n2. Какого цвета?" in text
+    assert len(kwargs['messages'][0]['content']) == 2
+
+@pytest.mark.asyncio
+async def test_prepared_image_stored_in_disk_cache(mock_openai_client, tmp_path):
+    """Тест сохранения подготовленного изображения на диск и чтения без пересжатия."""
+    helper = VisionHelper(image_cache=DiskImageCache(tmp_path))
+
+    await helper.analyze_image(b"image", prompt="Что это?", detail="low", cache_id="unique-1")
+    prepared = await helper.load_prepared("unique-1", "low")
+
+    assert bytes(prepared.data) == b"image"
+    assert await helper.load_prepared("unique-1", "high") is None
+    result = await helper.analyze_prepared(prepared, "Какого цвета?")
+    assert result == "Тестовый ответ"
+    url = helper.client.chat.completions.create.call_args.kwargs['messages'][0]['content'][1]['image_url']['url']
+    assert url == "data:image/jpeg;base64," + base64.b64encode(b"image").decode()
+
+@pytest.mark.asyncio
+async def test_high_detail_image_serves_low_and_auto(mock_openai_client, tmp_path):
+    """Тест того, что изображение высокой детализации из кэша подходит для low и auto."""
+    helper = VisionHelper(image_cache=DiskImageCache(tmp_path))
+
+    await helper.analyze_image(b"image", prompt="Прочитай текст", detail="high", cache_id="unique-1")
+
+    assert (await helper.load_prepared("unique-1", "low")).detail == "high"
+    assert (await helper.load_prepared("unique-1", "auto")).detail == "high"
+    assert helper.stats()['images'] == 1
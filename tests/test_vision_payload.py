@@ -0,0 +1,152 @@
+"""Tests for copy-free Vision request bodies."""
+import base64
+import json
+import os
+import tracemalloc
+import httpx
+import openai
+import pytest
+from openai import AsyncOpenAI
+from app.image_preprocessing import PreparedImage
+from app.rate_limiter import IMAGE_TOKENS_ESTIMATE, RateLimiter
+from app.vision_helper import VisionHelper
+from app.vision_payload import build_vision_body, encoded_length, post_vision_body
+
+def prepared(data, detail="high"):
+    """Создает подготовленное изображение из байтов."""
+    return PreparedImage(data=data, detail=detail, width=10, height=10, original_size=len(data))
+
+def chat_completion(content="ответ"):
+    """Возвращает тело ответа chat completions."""
+    return {
+        "id": "chatcmpl-1",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "gpt-4o",
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": content},
+        }],
+    }
+
+def make_client(handler, limiter=None):
+    """Создает AsyncOpenAI и общий HTTP клиент поверх фейкового сервера."""
+    http_client = httpx.AsyncClient(
+        transport=limiter.wrap(httpx.MockTransport(handler)) if limiter else httpx.MockTransport(handler),
+    )
+    client = AsyncOpenAI(api_key="test-key", base_url="http://fake/v1", http_client=http_client, max_retries=0)
+    return client, http_client
+
+def test_body_matches_sdk_serialization():
+    """Тест того, что тело совпадает с обычным JSON запроса."""
+    first, second = os.urandom(100_001), os.urandom(5)
+
+    body = build_vision_body("gpt-4o", "Что \"здесь\"?", [prepared(first), prepared(second, "low")], 500)
+
+    parsed = json.loads(body.data)
+    assert parsed["model"] == "gpt-4o"
+    assert parsed["max_tokens"] == 500
+    content = parsed["messages"][0]["content"]
+    assert content[0] == {"type": "text", "text": "Что \"здесь\"?"}
+    assert content[1]["image_url"] == {
+        "detail": "high",
+        "url": "data:image/jpeg;base64," + base64.b64encode(first).decode(),
+    }
+    assert content[2]["image_url"]["detail"] == "low"
+    assert content[2]["image_url"]["url"].endswith(base64.b64encode(second).decode())
+    assert body.tokens >= 2 * IMAGE_TOKENS_ESTIMATE + 500
+
+def test_body_extra_params():
+    """Тест дополнительных параметров запроса."""
+    body = build_vision_body("gpt-4o", "q", [], 100, response_format={"type": "json_object"})
+
+    assert json.loads(body.data)["response_format"] == {"type": "json_object"}
+
+def test_body_history_before_question():
+    """Тест того, что история диалога идет перед вопросом с картинкой."""
+    history = [{"role": "user", "content": "Кто это?"}, {"role": "assistant", "content": "Кот"}]
+
+    body = build_vision_body("gpt-4o", "А сколько ему лет?", [prepared(b"jpeg")], 100, history=history)
+
+    messages = json.loads(body.data)["messages"]
+    assert messages[:2] == history
+    assert messages[2]["content"][0] == {"type": "text", "text": "А сколько ему лет?"}
+
+def test_peak_memory_near_encoded_size():
+    """Тест пиковой памяти: не больше 1.4 размера base64 на фото."""
+    image = prepared(os.urandom(3 * 1024 * 1024))
+    size = encoded_length(len(image.data))
+
+    tracemalloc.start()
+    try:
+        body = build_vision_body("gpt-4o", "Что это?", [image], 500)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert len(body.data) < size + 1024
+    assert peak <= 1.4 * size
+
+@pytest.mark.asyncio
+async def test_post_streams_body_with_rate_limit_estimate():
+    """Тест отправки тела через общий клиент с оценкой токенов для лимитера."""
+    requests = []
+
+    async def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json=chat_completion("кот"))
+
+    limiter = RateLimiter()
+    client, http_client = make_client(handler, limiter)
+    body = build_vision_body("gpt-4o", "Что это?", [prepared(b"\xff" * 1000)], 500)
+
+    response = await post_vision_body(client, http_client, body)
+
+    assert response.choices[0].message.content == "кот"
+    request = requests[0]
+    assert str(request.url) == "http://fake/v1/chat/completions"
+    assert request.headers["Authorization"] == "Bearer test-key"
+    assert request.headers["Content-Length"] == str(len(body.data))
+    assert "Transfer-Encoding" not in request.headers
+    assert request.content == bytes(body.data)
+    assert request.extensions["rate_limit"] == ("gpt-4o", body.tokens)
+    await http_client.aclose()
+
+@pytest.mark.asyncio
+async def test_post_raises_openai_errors():
+    """Тест преобразования ответов с ошибкой в исключения openai."""
+    async def handler(request):
+        if request.headers.get("X-Fail") == "500":
+            return httpx.Response(503, json={"error": {"message": "down"}})
+        return httpx.Response(429, json={"error": {"message": "quota", "code": "insufficient_quota"}})
+
+    client, http_client = make_client(handler)
+    body = build_vision_body("gpt-4o", "q", [], 10)
+
+    with pytest.raises(openai.RateLimitError) as error:
+        await post_vision_body(client, http_client, body)
+    assert error.value.code == "insufficient_quota"
+
+    http_client.headers["X-Fail"] = "500"
+    with pytest.raises(openai.InternalServerError):
+        await post_vision_body(client, http_client, body)
+    await http_client.aclose()
+
+@pytest.mark.asyncio
+async def test_vision_helper_sends_body_through_http_client():
+    """Тест анализа изображения через общий HTTP клиент без SDK сериализации."""
+    requests = []
+
+    async def handler(request):
+        requests.append(json.loads(request.content))
+        return httpx.Response(200, json=chat_completion("кот"))
+
+    client, http_client = make_client(handler)
+    helper = VisionHelper(client=client, http_client=http_client)
+
+    assert await helper.analyze_image(b"not an image", prompt="Кто это?") == "кот"
+
+    image_url = requests[0]["messages"][0]["content"][1]["image_url"]
+    assert image_url["url"] == "data:image/jpeg;base64," + base64.b64encode(b"not an image").decode()
+    await http_client.aclose()
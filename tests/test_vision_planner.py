@@ -0,0 +1,107 @@
+"""Tests for Vision detail level and token budget planner."""
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+from app.vision_helper import VisionHelper
+from app.vision_planner import (
+    INTENT_BRIEF,
+    INTENT_DESCRIBE,
+    INTENT_READ,
+    VisionPlanner,
+    classify_intent,
+    image_tokens,
+)
+
+def test_image_tokens_tile_formula():
+    """Тест формулы стоимости: 85 + 170 за каждый тайл 512x512."""
+    assert image_tokens(4000, 3000, "low") == 85
+    # 4000x3000 -> 1024x768 -> 2x2 тайла
+    assert image_tokens(4000, 3000, "high") == 85 + 170 * 4
+    # 2048x4096 -> 1024x2048 -> 768x1536 -> 2x3 тайла
+    assert image_tokens(2048, 4096, "high") == 85 + 170 * 6
+    assert image_tokens(500, 500, "high") == 85 + 170
+    assert image_tokens(None, None, "auto") == 85 + 170 * 8
+
+def test_classify_intent():
+    """Тест определения намерения по подписи к фото."""
+    assert classify_intent("Прочитай текст на вывеске") == INTENT_READ
+    assert classify_intent("Что это?") == INTENT_BRIEF
+    assert classify_intent("Нравится?") == INTENT_DESCRIBE
+    assert classify_intent(None) == INTENT_DESCRIBE
+    assert classify_intent("Напиши код сортировки") == INTENT_READ
+
+def test_classify_intent_whole_words():
+    """Тест того, что слова намерений не находятся внутри других слов."""
+    assert classify_intent("Расскажи про человека") == INTENT_DESCRIBE
+    assert classify_intent("Кодировка старая, опиши") == INTENT_DESCRIBE
+    assert classify_intent("I already know, describe it") == INTENT_DESCRIBE
+    assert classify_intent("Explain the context") == INTENT_DESCRIBE
+    assert classify_intent("Which country is it?") == INTENT_DESCRIBE
+    assert classify_intent("Прочитайте чеки") == INTENT_READ
+
+def test_plan_by_intent():
+    """Тест выбора детализации и лимита ответа по намерению."""
+    planner = VisionPlanner()
+
+    read = planner.plan([(2000, 1500)], "Перепиши текст с фото")
+    brief = planner.plan([(2000, 1500)], "Что это?")
+    small = planner.plan([(400, 300)], "Прочитай текст")
+
+    assert (read.detail, read.max_tokens) == ("high", 1000)
+    assert (brief.detail, brief.max_tokens) == ("low", 150)
+    assert brief.image_tokens == 85
+    assert small.detail == "low"
+    assert planner.stats()["intent_read"] == 2
+
+def test_budget_downgrades_most_expensive_images():
+    """Тест понижения детализации самых дорогих фото при нехватке бюджета."""
+    planner = VisionPlanner(token_budget=2200)
+
+    plan = planner.plan([(4000, 3000), (4000, 1000), (2000, 1500)], "Подробно опиши")
+
+    # Ответ 1000 токенов; в high каждое фото стоит 765, в low — 85
+    assert plan.details == ("low", "low", "high")
+    assert plan.image_tokens == 85 + 85 + 765
+    assert plan.downgraded
+    assert plan.prompt_tokens + plan.max_tokens <= 2200
+
+def test_budget_lowers_answer_cap_last():
+    """Тест уменьшения лимита ответа, когда все фото уже в low."""
+    planner = VisionPlanner(token_budget=300, min_output_tokens=100)
+
+    plan = planner.plan([(2000, 1500)], "Опиши")
+
+    assert plan.detail == "low"
+    assert plan.max_tokens == 300 - plan.prompt_tokens
+    assert planner.stats()["downgraded"] == 1
+
+def test_record_actual_usage():
+    """Тест учета фактического расхода токенов против плана."""
+    planner = VisionPlanner()
+    plan = planner.plan([(1024, 768)], "Что это?")
+
+    planner.record(plan, SimpleNamespace(prompt_tokens=plan.prompt_tokens * 2, completion_tokens=75), "length")
+    planner.record(plan, None)
+
+    stats = planner.stats()
+    assert stats["prompt_ratio"] == 2.0
+    assert stats["output_ratio"] == 0.5
+    assert stats["truncated"] == 1
+
+@pytest.mark.asyncio
+async def test_vision_helper_follows_plan():
+    """Тест отправки запроса по плану и учета фактического расхода."""
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(return_value=SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content="Кот"), finish_reason="stop")],
+        usage=SimpleNamespace(prompt_tokens=100, completion_tokens=20),
+    ))
+    helper = VisionHelper(client=client)
+    plan = helper.planner.plan([(2000, 1500)], "Что это?")
+
+    assert await helper.analyze_image(b"not an image", prompt="Что это?", plan=plan) == "Кот"
+
+    kwargs = client.chat.completions.create.call_args.kwargs
+    assert kwargs["max_tokens"] == 150
+    assert kwargs["messages"][0]["content"][1]["image_url"]["detail"] == "low"
+    assert helper.planner.stats()["actual_prompt_tokens"] == 100
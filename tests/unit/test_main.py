@@ -1,10 +1,19 @@
 """Тесты для основного модуля бота."""
+import asyncio
+import io
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 from telegram import Update, User, Message, Chat
 from telegram.ext import ContextTypes
-from app.main import start, button_handler, echo, make_admin, revoke_admin, my_roles
+from app.main import start, button_handler, echo, generate_image, handle_photo, handle_image_document, make_admin, revoke_admin, my_roles, show_stats, UNAVAILABLE_MESSAGE
 from app.roles import UserRole, add_role, clear_roles, has_role
+from app.conversation import ConversationStore
+from app.image_memory import ImageMemory
+from app.image_preprocessing import PreparedImage
+from app.media_group import MediaGroupCollector
+from app.resilience import CircuitOpenError
+from app.response_cache import ResponseCache
+from app.vision_planner import VisionPlanner
 from app.registration import RegistrationStatus, create_registration_request, clear_requests, approve_registration
 
 @pytest.fixture
@@ -18,6 +27,8 @@ def update():
     update.message = MagicMock(spec=Message)
     update.message.chat = MagicMock(spec=Chat)
     update.message.chat.id = 123
+    update.message.media_group_id = None
+    update.message.reply_to_message = None
     update.message.reply_text = AsyncMock()
     return update
 
@@ -268,6 +279,558 @@ async def test_echo_registered(update, context):
     call_args = update.message.reply_text.call_args[0][0]
     assert len(call_args) > 0  # Проверяем, что ответ не пустой
 
+@pytest.mark.asyncio
+async def test_echo_streams_answer(update, context):
+    """Тест потоковой выдачи ответа зарегистрированному пользователю."""
+    create_registration_request(update.effective_user.id, "test_user", "Test User")
+    approve_registration(update.effective_user.id, admin_id=54321)
+    add_role(update.effective_user.id, UserRole.USER)
+    update.message.text = "Привет"
+    placeholder = MagicMock()
+    placeholder.edit_text = AsyncMock()
+    update.message.reply_text.return_value = placeholder
+
+    async def stream(*args, **kwargs):
+        for part in ["Здравствуйте", "!"]:
+            yield part
+
+    clients = MagicMock()
+    clients.openai_helper.stream_chat_response = stream
+    clients.conversations = ConversationStore()
+    clients.image_memory = ImageMemory()
+    with patch('app.main.get_clients', return_value=clients):
+        await echo(update, context)
+
+    # Отправлена одна заглушка, ответ дописан в нее
+    update.message.reply_text.assert_called_once()
+    assert placeholder.edit_text.call_args[0][0] == "Здравствуйте!"
+    # Реплики сохранены в истории чата
+    history = clients.conversations.build_history(update.message.chat.id, "Как дела?")
+    assert history == [
+        {"role": "user", "content": "Привет"},
+        {"role": "assistant", "content": "Здравствуйте!"},
+    ]
+
+@pytest.mark.asyncio
+async def test_echo_circuit_open(update, context):
+    """Тест быстрого отказа при недоступности OpenAI."""
+    create_registration_request(update.effective_user.id, "test_user", "Test User")
+    approve_registration(update.effective_user.id, admin_id=54321)
+    add_role(update.effective_user.id, UserRole.USER)
+    update.message.text = "Привет"
+    placeholder = MagicMock()
+    placeholder.edit_text = AsyncMock()
+    update.message.reply_text.return_value = placeholder
+
+    async def stream(*args, **kwargs):
+        raise CircuitOpenError("gpt-3.5-turbo")
+        yield
+
+    clients = MagicMock()
+    clients.openai_helper.stream_chat_response = stream
+    clients.conversations = ConversationStore()
+    clients.image_memory = ImageMemory()
+    with patch('app.main.get_clients', return_value=clients):
+        await echo(update, context)
+
+    assert placeholder.edit_text.call_args[0][0] == UNAVAILABLE_MESSAGE
+    # Неудачный обмен не попадает в историю
+    assert clients.conversations.turns(update.message.chat.id) == []
+
+@pytest.mark.asyncio
+async def test_generate_image_circuit_open(update, context):
+    """Тест сообщения о недоступности OpenAI вместо отправки текста ошибки как фото."""
+    add_role(update.effective_user.id, UserRole.USER)
+    context.args = ["закат", "на", "море"]
+    update.message.reply_photo = AsyncMock()
+    processing = MagicMock()
+    processing.delete = AsyncMock()
+    update.message.reply_text.return_value = processing
+
+    clients = MagicMock()
+    clients.openai_helper.generate_image = AsyncMock(side_effect=CircuitOpenError("dall-e-3"))
+    with patch('app.main.get_clients', return_value=clients):
+        await generate_image(update, context)
+
+    update.message.reply_photo.assert_not_called()
+    update.message.reply_text.assert_called_with(UNAVAILABLE_MESSAGE)
+    processing.delete.assert_called_once()
+
+def make_photo_sizes():
+    """Создает типичный набор версий фото Telegram."""
+    sizes = []
+    for width, height in [(90, 67), (320, 240), (800, 600), (1280, 960), (2560, 1920)]:
+        photo = MagicMock(width=width, height=height, file_size=width * height // 10)
+        photo.file_unique_id = f"unique-{width}"
+        photo_file = MagicMock()
+        photo_file.download_as_bytearray = AsyncMock(return_value=bytearray(b"photo"))
+        photo.get_file = AsyncMock(return_value=photo_file)
+        sizes.append(photo)
+    return sizes
+
+def make_vision_clients():
+    """Создает мок реестра клиентов с настоящим кэшем анализа фото."""
+    clients = MagicMock()
+    clients.vision_cache = ResponseCache()
+    clients.vision_helper.default_detail = "high"
+    clients.vision_helper.planner = VisionPlanner()
+    clients.vision_helper.vision_model.return_value = "gpt-4o"
+    clients.vision_helper.analyze_image = AsyncMock(return_value="Кот")
+    clients.vision_helper.load_prepared = AsyncMock(return_value=None)
+    clients.downloader.download = AsyncMock(side_effect=lambda photo_file: io.BytesIO(b"photo"))
+    return clients
+
+@pytest.mark.asyncio
+async def test_handle_photo_downloads_smallest_sufficient_size(update, context):
+    """Тест загрузки наименьшей достаточной версии фото."""
+    add_role(update.effective_user.id, UserRole.USER)
+    update.message.photo = make_photo_sizes()
+    update.message.caption = "Что это? Кратко"
+    update.message.reply_text.return_value = MagicMock(delete=AsyncMock())
+    clients = make_vision_clients()
+
+    with patch('app.main.get_clients', return_value=clients):
+        await handle_photo(update, context)
+
+    # Для low достаточно 800x600, оригинал 2560x1920 не скачивается
+    update.message.photo[2].get_file.assert_awaited_once()
+    update.message.photo[4].get_file.assert_not_called()
+    assert clients.vision_helper.analyze_image.call_args.kwargs["detail"] == "low"
+    update.message.reply_text.assert_any_call("Кот")
+
+@pytest.mark.asyncio
+async def test_handle_photo_repeat_served_from_cache(update, context):
+    """Тест ответа на повторное фото из кэша без загрузки."""
+    add_role(update.effective_user.id, UserRole.USER)
+    update.message.caption = "Что  это?"
+    update.message.reply_text.return_value = MagicMock(delete=AsyncMock())
+    clients = make_vision_clients()
+
+    with patch('app.main.get_clients', return_value=clients):
+        update.message.photo = make_photo_sizes()
+        await handle_photo(update, context)
+        update.message.photo = make_photo_sizes()
+        update.message.caption = "что это?"
+        await handle_photo(update, context)
+
+    assert clients.vision_helper.analyze_image.await_count == 1
+    assert all(not photo.get_file.called for photo in update.message.photo)
+    assert clients.vision_cache.stats()["hits"] == 1
+    assert update.message.reply_text.call_args[0][0] == "Кот"
+
+@pytest.mark.asyncio
+async def test_handle_photo_slow_answer_edited_into_status(update, context):
+    """Тест статуса при долгой обработке: ответ заменяет его текст."""
+    add_role(update.effective_user.id, UserRole.USER)
+    update.message.photo = make_photo_sizes()
+    update.message.caption = "Что это?"
+    status_message = MagicMock(edit_text=AsyncMock(), delete=AsyncMock())
+    update.message.reply_text.return_value = status_message
+    clients = make_vision_clients()
+
+    async def slow_analysis(*args, **kwargs):
+        await asyncio.sleep(0.05)
+        return "Кот"
+
+    clients.vision_helper.analyze_image = AsyncMock(side_effect=slow_analysis)
+
+    with patch('app.main.get_clients', return_value=clients), patch('app.main.STATUS_MESSAGE_DELAY', 0.01):
+        await handle_photo(update, context)
+
+    assert "Анализирую" in update.message.reply_text.call_args[0][0]
+    update.message.reply_text.assert_awaited_once()
+    status_message.edit_text.assert_awaited_once_with("Кот")
+    status_message.delete.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_handle_photo_several_questions_one_request(update, context):
+    """Тест ответа на несколько вопросов в подписи одним запросом."""
+    add_role(update.effective_user.id, UserRole.USER)
+    update.message.photo = make_photo_sizes()
+    update.message.caption = "Кто это? Какого цвета?"
+    update.message.reply_text.return_value = MagicMock(delete=AsyncMock())
+    clients = make_vision_clients()
+    clients.vision_helper.answer_questions = AsyncMock(return_value=["Кот", "Рыжий"])
+
+    with patch('app.main.get_clients', return_value=clients):
+        await handle_photo(update, context)
+
+    clients.vision_helper.analyze_image.assert_not_called()
+    call = clients.vision_helper.answer_questions.call_args
+    assert call.args[1] == ["Кто это?", "Какого цвета?"]
+    update.message.reply_text.assert_any_call("1. Кто это?\nКот\n\n2. Какого цвета?\nРыжий")
+
+@pytest.mark.asyncio
+async def test_handle_photo_prepared_image_from_disk(update, context):
+    """Тест анализа фото, подготовленного раньше, без загрузки из Telegram."""
+    add_role(update.effective_user.id, UserRole.USER)
+    update.message.photo = make_photo_sizes()
+    update.message.caption = "Что на фоне?"
+    update.message.reply_text.return_value = MagicMock(delete=AsyncMock())
+    clients = make_vision_clients()
+    prepared = PreparedImage(b"jpeg", "high", 1024, 768, 5)
+    clients.vision_helper.load_prepared = AsyncMock(return_value=prepared)
+    clients.vision_helper.analyze_prepared = AsyncMock(return_value="Горы")
+
+    with patch('app.main.get_clients', return_value=clients):
+        await handle_photo(update, context)
+
+    assert clients.vision_helper.load_prepared.call_args.args == ("unique-2560", "high")
+    assert all(not photo.get_file.called for photo in update.message.photo)
+    clients.vision_helper.analyze_image.assert_not_called()
+    assert clients.vision_helper.analyze_prepared.call_args.args == (prepared, "Что на фоне?")
+    update.message.reply_text.assert_any_call("Горы")
+
+@pytest.mark.asyncio
+async def test_handle_image_document_streamed_to_vision(update, context):
+    """Тест анализа изображения, отправленного файлом, через скачанный временный файл."""
+    add_role(update.effective_user.id, UserRole.USER)
+    update.message.document = MagicMock(
+        file_id="doc-1", file_unique_id="doc-unique", file_size=5_000_000, mime_type="image/jpeg"
+    )
+    update.message.document.get_file = AsyncMock(return_value=MagicMock())
+    update.message.caption = None
+    update.message.reply_text.return_value = MagicMock(delete=AsyncMock())
+    clients = make_vision_clients()
+    clients.downloader.max_size = 20 * 1024 * 1024
+    clients.image_memory = ImageMemory()
+
+    with patch('app.main.get_clients', return_value=clients):
+        await handle_image_document(update, context)
+
+    update.message.document.get_file.assert_awaited_once()
+    clients.downloader.download.assert_awaited_once()
+    image_file = clients.vision_helper.analyze_image.call_args.args[0]
+    assert image_file.closed
+    assert clients.vision_helper.analyze_image.call_args.kwargs["cache_id"] == "doc-unique"
+    # Размеры файла неизвестны: детализация выбирается по самому изображению
+    assert clients.vision_helper.analyze_image.call_args.kwargs["detail"] == "auto"
+    assert clients.image_memory.get(update.message.chat.id).file_id == "doc-1"
+    update.message.reply_text.assert_any_call("Кот")
+
+@pytest.mark.asyncio
+async def test_handle_image_document_prepared_image_from_disk(update, context):
+    """Тест повторного анализа файла-документа по изображению с диска без загрузки."""
+    add_role(update.effective_user.id, UserRole.USER)
+    update.message.document = MagicMock(
+        file_id="doc-1", file_unique_id="doc-unique", file_size=5_000_000, mime_type="image/jpeg"
+    )
+    update.message.document.get_file = AsyncMock(return_value=MagicMock())
+    update.message.caption = "Прочитай текст"
+    update.message.reply_text.return_value = MagicMock(delete=AsyncMock())
+    clients = make_vision_clients()
+    clients.downloader.max_size = 20 * 1024 * 1024
+    clients.image_memory = ImageMemory()
+    prepared = PreparedImage(b"jpeg", "high", 1536, 2048, 5)
+    clients.vision_helper.load_prepared = AsyncMock(return_value=prepared)
+    clients.vision_helper.analyze_prepared = AsyncMock(return_value="Счет №1")
+
+    with patch('app.main.get_clients', return_value=clients):
+        await handle_image_document(update, context)
+
+    # Размер файла неизвестен, поэтому ищется уровень, нужный вопросу, а не "auto"
+    assert clients.vision_helper.load_prepared.call_args.args == ("doc-unique", "high")
+    update.message.document.get_file.assert_not_called()
+    clients.downloader.download.assert_not_called()
+    update.message.reply_text.assert_any_call("Счет №1")
+
+@pytest.mark.asyncio
+async def test_handle_photo_prepared_read_error_finishes_status(update, context):
+    """Тест ответа об ошибке, если подготовленное фото не читается с диска."""
+    add_role(update.effective_user.id, UserRole.USER)
+    update.message.photo = make_photo_sizes()
+    update.message.caption = "Что на фото?"
+    update.message.reply_text.return_value = MagicMock(edit_text=AsyncMock())
+    clients = make_vision_clients()
+
+    async def load_prepared(*args):
+        # Статус успевает появиться до ошибки чтения
+        await asyncio.sleep(0.01)
+        raise OSError("диск недоступен")
+
+    clients.vision_helper.load_prepared = AsyncMock(side_effect=load_prepared)
+
+    with patch('app.main.get_clients', return_value=clients), \
+            patch('app.main.STATUS_MESSAGE_DELAY', 0):
+        await handle_photo(update, context)
+
+    clients.downloader.download.assert_not_called()
+    status = update.message.reply_text.return_value
+    status.edit_text.assert_awaited_once()
+    assert "Ошибка при анализе изображения" in status.edit_text.call_args.args[0]
+
+@pytest.mark.asyncio
+async def test_handle_image_document_too_large(update, context):
+    """Тест отказа в анализе файла больше лимита загрузки."""
+    add_role(update.effective_user.id, UserRole.USER)
+    update.message.document = MagicMock(file_size=50 * 1024 * 1024)
+    update.message.document.get_file = AsyncMock()
+    clients = make_vision_clients()
+    clients.downloader.max_size = 20 * 1024 * 1024
+
+    with patch('app.main.get_clients', return_value=clients):
+        await handle_image_document(update, context)
+
+    update.message.document.get_file.assert_not_called()
+    assert "слишком большой" in update.message.reply_text.call_args[0][0]
+
+@pytest.mark.asyncio
+async def test_handle_image_document_unsupported_format(update, context):
+    """Тест отказа в анализе файла формата, который не разберет Vision."""
+    add_role(update.effective_user.id, UserRole.USER)
+    update.message.document = MagicMock(
+        file_id="doc-1", file_unique_id="doc-unique", file_size=5_000_000, mime_type="image/heic"
+    )
+    update.message.document.get_file = AsyncMock()
+    clients = make_vision_clients()
+    clients.downloader.max_size = 20 * 1024 * 1024
+    clients.image_memory = ImageMemory()
+
+    with patch('app.main.get_clients', return_value=clients):
+        await handle_image_document(update, context)
+
+    update.message.document.get_file.assert_not_called()
+    clients.vision_helper.analyze_image.assert_not_called()
+    assert clients.image_memory.get(update.message.chat.id) is None
+    message = update.message.reply_text.call_args[0][0]
+    assert "не поддерживается" in message
+    assert "JPEG, PNG, WebP или GIF" in message
+
+@pytest.mark.asyncio
+async def test_followup_question_uses_remembered_image(update, context):
+    """Тест ответа на текстовый вопрос о последнем фото без повторной загрузки."""
+    create_registration_request(update.effective_user.id, "test_user", "Test User")
+    approve_registration(update.effective_user.id, admin_id=54321)
+    add_role(update.effective_user.id, UserRole.USER)
+    update.message.photo = make_photo_sizes()
+    update.message.caption = "Опиши подробно"
+    clients = make_vision_clients()
+    clients.image_memory = ImageMemory()
+    clients.conversations = ConversationStore()
+
+    async def analyze(photo_bytes, **kwargs):
+        kwargs["on_prepared"](PreparedImage(b"jpeg", kwargs["detail"], 1024, 768, 5))
+        return "Кот"
+
+    clients.vision_helper.analyze_image = AsyncMock(side_effect=analyze)
+    clients.vision_helper.analyze_prepared = AsyncMock(return_value="Рыжий")
+
+    with patch('app.main.get_clients', return_value=clients):
+        await handle_photo(update, context)
+        update.message.text = "Какого он цвета?"
+        await echo(update, context)
+
+    clients.openai_helper.stream_chat_response.assert_not_called()
+    clients.vision_helper.analyze_image.assert_awaited_once()
+    prepared = clients.vision_helper.analyze_prepared.call_args.args[0]
+    assert prepared.data == b"jpeg"
+    assert clients.vision_helper.analyze_prepared.call_args.args[1] == "Какого он цвета?"
+    update.message.reply_text.assert_any_call("Рыжий")
+    assert clients.conversations.turns(update.message.chat.id)[-1].content == "Рыжий"
+
+@pytest.mark.asyncio
+async def test_reply_to_photo_answer_uses_remembered_image(update, context):
+    """Тест ответа на реплику к ответу бота о фото по этому фото."""
+    create_registration_request(update.effective_user.id, "test_user", "Test User")
+    approve_registration(update.effective_user.id, admin_id=54321)
+    add_role(update.effective_user.id, UserRole.USER)
+    update.message.photo = make_photo_sizes()
+    update.message.caption = "Какой породы кот?"
+    clients = make_vision_clients()
+    clients.image_memory = ImageMemory()
+    clients.conversations = ConversationStore()
+    update.message.reply_text.return_value = MagicMock(message_id=777)
+
+    async def analyze(photo_bytes, **kwargs):
+        kwargs["on_prepared"](PreparedImage(b"jpeg", kwargs["detail"], 1024, 768, 5))
+        return "Британец"
+
+    clients.vision_helper.analyze_image = AsyncMock(side_effect=analyze)
+    clients.vision_helper.analyze_prepared = AsyncMock(return_value="Около трех лет")
+
+    with patch('app.main.get_clients', return_value=clients):
+        await handle_photo(update, context)
+        # Ответ на сообщение бота, а не на само фото, и ни слова о картинке
+        update.message.text = "А сколько ему лет?"
+        update.message.reply_to_message = MagicMock(message_id=777, photo=[], document=None)
+        await echo(update, context)
+
+    clients.openai_helper.stream_chat_response.assert_not_called()
+    assert clients.vision_helper.analyze_prepared.call_args.args[1] == "А сколько ему лет?"
+
+@pytest.mark.asyncio
+async def test_reply_to_other_message_goes_to_chat(update, context):
+    """Тест того, что реплика к сообщению не о фото без слов о картинке уходит в чат."""
+    create_registration_request(update.effective_user.id, "test_user", "Test User")
+    approve_registration(update.effective_user.id, admin_id=54321)
+    add_role(update.effective_user.id, UserRole.USER)
+    clients = make_vision_clients()
+    clients.image_memory = ImageMemory()
+    clients.image_memory.remember(update.message.chat.id, "file-1", "unique-2560", 2560, 1920)
+    clients.image_memory.attach_answer(update.message.chat.id, "unique-2560", 777)
+    clients.conversations = ConversationStore()
+    clients.vision_helper.analyze_prepared = AsyncMock()
+    update.message.text = "А сколько ему лет?"
+    update.message.reply_to_message = MagicMock(message_id=555, photo=[], document=None)
+    update.message.reply_text.return_value = MagicMock(edit_text=AsyncMock())
+
+    async def stream(*args, **kwargs):
+        yield "Не знаю"
+
+    clients.openai_helper.stream_chat_response = MagicMock(side_effect=stream)
+    with patch('app.main.get_clients', return_value=clients):
+        await echo(update, context)
+
+    clients.openai_helper.stream_chat_response.assert_called_once()
+    clients.vision_helper.analyze_prepared.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_unrelated_text_after_photo_goes_to_chat(update, context):
+    """Тест того, что текст не о фото после фото отвечается обычным чатом."""
+    create_registration_request(update.effective_user.id, "test_user", "Test User")
+    approve_registration(update.effective_user.id, admin_id=54321)
+    add_role(update.effective_user.id, UserRole.USER)
+    clients = make_vision_clients()
+    clients.image_memory = ImageMemory()
+    clients.image_memory.remember(update.message.chat.id, "file-1", "unique-2560", 2560, 1920)
+    clients.conversations = ConversationStore()
+    clients.vision_helper.analyze_prepared = AsyncMock()
+    update.message.text = "Напиши код сортировки на Python"
+    update.message.reply_text.return_value = MagicMock(edit_text=AsyncMock())
+
+    async def stream(*args, **kwargs):
+        yield "def sort(items): ..."
+
+    clients.openai_helper.stream_chat_response = MagicMock(side_effect=stream)
+    with patch('app.main.get_clients', return_value=clients):
+        await echo(update, context)
+
+    clients.openai_helper.stream_chat_response.assert_called_once()
+    clients.vision_helper.analyze_image.assert_not_called()
+    clients.vision_helper.analyze_prepared.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_reply_to_photo_answered_with_history(update, context):
+    """Тест ответа на реплику к фото по этому фото вместе с первым вопросом о нем."""
+    create_registration_request(update.effective_user.id, "test_user", "Test User")
+    approve_registration(update.effective_user.id, admin_id=54321)
+    add_role(update.effective_user.id, UserRole.USER)
+    update.message.photo = make_photo_sizes()
+    update.message.caption = "Какой породы кот?"
+    clients = make_vision_clients()
+    clients.image_memory = ImageMemory()
+    clients.conversations = ConversationStore()
+
+    async def analyze(photo_file, **kwargs):
+        kwargs["on_prepared"](PreparedImage(b"jpeg", kwargs["detail"], 1024, 768, 5))
+        return "Британец"
+
+    clients.vision_helper.analyze_image = AsyncMock(side_effect=analyze)
+    clients.vision_helper.analyze_prepared = AsyncMock(return_value="Около трех лет")
+
+    with patch('app.main.get_clients', return_value=clients):
+        await handle_photo(update, context)
+        # Ни слова о картинке, но это ответ на само фото
+        update.message.text = "А сколько ему лет?"
+        update.message.reply_to_message = MagicMock(photo=make_photo_sizes(), document=None)
+        await echo(update, context)
+
+    clients.openai_helper.stream_chat_response.assert_not_called()
+    call = clients.vision_helper.analyze_prepared.call_args
+    assert call.args[1] == "А сколько ему лет?"
+    assert call.kwargs["history"] == [
+        {"role": "user", "content": "Какой породы кот?"},
+        {"role": "assistant", "content": "Британец"},
+    ]
+    update.message.reply_text.assert_any_call("Около трех лет")
+
+def album_update(message_id, caption=None):
+    """Создает апдейт с одним фото альбома."""
+    update = MagicMock(spec=Update)
+    update.effective_user = MagicMock(spec=User)
+    update.effective_user.id = 123
+    update.message = MagicMock(spec=Message)
+    update.message.message_id = message_id
+    update.message.chat_id = 123
+    update.message.media_group_id = "album"
+    update.message.caption = caption
+    update.message.photo = make_photo_sizes()
+    update.message.reply_text = AsyncMock(return_value=MagicMock(delete=AsyncMock()))
+    return update
+
+@pytest.mark.asyncio
+async def test_handle_photo_album_single_request(context):
+    """Тест обработки альбома одним запросом к Vision и одним ответом."""
+    add_role(123, UserRole.USER)
+    clients = make_vision_clients()
+    clients.media_groups = MediaGroupCollector(window=0.05)
+    clients.vision_helper.analyze_images = AsyncMock(return_value="Три кота")
+    updates = [album_update(1, caption="Что общего? Кратко"), album_update(2), album_update(3)]
+
+    with patch('app.main.get_clients', return_value=clients):
+        await asyncio.gather(*(handle_photo(update, context) for update in updates))
+
+    clients.vision_helper.analyze_image.assert_not_called()
+    clients.vision_helper.analyze_images.assert_awaited_once()
+    call = clients.vision_helper.analyze_images.call_args
+    assert len(call.args[0]) == 3
+    assert call.kwargs["prompt"] == "Что общего? Кратко"
+    assert call.kwargs["detail"] == ["low", "low", "low"]
+    updates[0].message.reply_text.assert_any_call("Три кота")
+    updates[1].message.reply_text.assert_not_called()
+    updates[2].message.reply_text.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_handle_photo_album_failed_download_closes_files(context):
+    """Тест закрытия скачанных файлов альбома, если загрузка одного фото упала."""
+    add_role(123, UserRole.USER)
+    clients = make_vision_clients()
+    clients.media_groups = MediaGroupCollector(window=0.05)
+    clients.vision_helper.analyze_images = AsyncMock()
+    files = []
+
+    async def download(photo_file):
+        index = len(files)
+        files.append(io.BytesIO(b"photo"))
+        if index == 1:
+            raise ConnectionError("обрыв")
+        if index == 2:
+            # Загрузка еще идет, когда другая уже упала
+            await asyncio.sleep(1.0)
+        return files[index]
+
+    clients.downloader.download = AsyncMock(side_effect=download)
+    updates = [album_update(1), album_update(2), album_update(3)]
+
+    with patch('app.main.get_clients', return_value=clients):
+        await asyncio.gather(*(handle_photo(update, context) for update in updates))
+
+    clients.vision_helper.analyze_images.assert_not_called()
+    assert files[0].closed
+    assert "обрыв" in updates[0].message.reply_text.call_args[0][0]
+
+@pytest.mark.asyncio
+async def test_show_stats_admin(update, context):
+    """Тест вывода метрик администратору."""
+    add_role(update.effective_user.id, UserRole.ADMIN)
+    clients = MagicMock()
+    clients.stats.return_value = {"chat_cache": {"hits": 3, "hit_rate": 0.75}}
+
+    with patch('app.main.get_clients', return_value=clients):
+        await show_stats(update, context)
+
+    text = update.message.reply_text.call_args[0][0]
+    assert "chat_cache:" in text
+    assert "hits: 3" in text
+    assert "hit_rate: 0.750" in text
+
+@pytest.mark.asyncio
+async def test_show_stats_not_admin(update, context):
+    """Тест запрета просмотра метрик без роли администратора."""
+    await show_stats(update, context)
+
+    assert "У вас нет прав" in update.message.reply_text.call_args[0][0]
+
 @pytest.mark.asyncio
 async def test_make_admin_success(update, context):
     """Тест успешного добавления роли администратора"""
@@ -9,7 +9,12 @@ def test_main_success():
     # Подготавливаем моки
     mock_app = MagicMock()
     mock_builder = MagicMock()
-    mock_builder.token.return_value.build.return_value = mock_app
+    # Все методы настройки builder возвращают сам builder
+    mock_builder.token.return_value = mock_builder
+    mock_builder.concurrent_updates.return_value = mock_builder
+    mock_builder.post_init.return_value = mock_builder
+    mock_builder.post_shutdown.return_value = mock_builder
+    mock_builder.build.return_value = mock_app
     
     with patch.dict(os.environ, {'TELEGRAM_BOT_TOKEN': 'test_token'}), \
          patch('telegram.ext.Application.builder', return_value=mock_builder):
@@ -18,6 +23,9 @@ def test_main_success():
         
         # Проверяем, что токен был использован правильно
         mock_builder.token.assert_called_once_with('test_token')
+        mock_builder.concurrent_updates.assert_called_once_with(True)
+        mock_builder.post_init.assert_called_once()
+        mock_builder.post_shutdown.assert_called_once()
         
         # Проверяем, что все обработчики были добавлены
         assert mock_app.add_handler.call_count >= 7  # start, make_admin, revoke_admin, my_roles, list_requests, button_handler, echo